@@ -2,10 +2,10 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.core.config import SECRET_KEY, API_PREFIX
-from app.models.user import UserInDB
+from app.models.user import UserInDB, UserPublic
 from app.api.dependencies.database import get_repository
 from app.db.repositories.users import UsersRepository
-from app.services import auth_service
+from app.services import auth_service, authenticated_user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{API_PREFIX}/users/login/token/")
 
@@ -17,12 +17,36 @@ async def get_user_from_token(
 ) -> Optional[UserInDB]:
     try:
         username = auth_service.get_username_from_token(token=token, secret_key=str(SECRET_KEY))
-        user = await user_repo.get_user_by_username(username=username)
+        user = authenticated_user_cache.get(username)
+        if user is None:
+            user = await user_repo.get_user_by_username(username=username)
+            if user:
+                authenticated_user_cache.set(username, user)
     except Exception as e:
         raise e
     return user
 
 
+async def get_user_from_token_claims(
+        *,
+        token: str = Depends(oauth2_scheme),
+        user_repo: UsersRepository = Depends(get_repository(UsersRepository)),
+) -> Optional[UserPublic]:
+    """
+    Stateless tokens carry everything needed to authorize the user, so no query is made for them
+    """
+    payload = auth_service.get_payload_from_token(token=token, secret_key=str(SECRET_KEY))
+    if payload.id is None:
+        return await get_user_from_token(token=token, user_repo=user_repo)
+    return UserPublic(
+        id=payload.id,
+        email=payload.sub,
+        username=payload.username,
+        is_active=payload.is_active,
+        is_superuser=payload.is_superuser,
+    )
+
+
 def get_current_active_user(current_user: UserInDB = Depends(get_user_from_token)) -> Optional[UserInDB]:
     if not current_user:
         raise HTTPException(
@@ -37,3 +61,12 @@ def get_current_active_user(current_user: UserInDB = Depends(get_user_from_token
             headers={"WWW-Authenticate": "Bearer"},
         )
     return current_user
+
+
+def get_current_active_user_from_claims(
+        current_user: UserPublic = Depends(get_user_from_token_claims),
+) -> Optional[UserPublic]:
+    """
+    For read-only endpoints that only need to know who the user is
+    """
+    return get_current_active_user(current_user=current_user)
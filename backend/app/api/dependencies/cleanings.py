@@ -1,17 +1,22 @@
-from fastapi import HTTPException, Depends, Path, status
+from typing import Optional, Union
+
+from fastapi import HTTPException, Depends, Path, Query, status
 from app.models.user import UserInDB
-from app.models.cleaning import CleaningInDB, CleaningPublic
+from app.models.cleaning import CleaningInDB, CleaningPublic, CleaningSearch, CleaningType
 from app.db.repositories.cleanings import CleaningsRepository
 from app.api.dependencies.database import get_repository
 from app.api.dependencies.auth import get_current_active_user
 
 
-async def get_cleaning_by_id_from_path(
+async def get_unpopulated_cleaning_by_id_from_path(
         cleaning_id: int = Path(..., ge=1),
         current_user: UserInDB = Depends(get_current_active_user),
         cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
-) -> CleaningPublic:
-    cleaning = await cleanings_repo.get_cleaning_by_id(id=cleaning_id, requesting_user=current_user)
+) -> CleaningInDB:
+    """
+    Bare cleaning for permission checks and routes that only need its columns
+    """
+    cleaning = await cleanings_repo.get_cleaning_by_id(id=cleaning_id, requesting_user=current_user, populate=False)
     if not cleaning:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="No cleaning found with that id.",
@@ -19,9 +24,17 @@ async def get_cleaning_by_id_from_path(
     return cleaning
 
 
+async def get_cleaning_by_id_from_path(
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
+        current_user: UserInDB = Depends(get_current_active_user),
+        cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
+) -> CleaningPublic:
+    return await cleanings_repo.populate_cleaning(cleaning=cleaning, requesting_user=current_user)
+
+
 def check_cleaning_modification_permissions(
         current_user: UserInDB = Depends(get_current_active_user),
-        cleaning: CleaningPublic = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
 ) -> None:
     if not user_owns_cleaning(user=current_user, cleaning=cleaning):
         raise HTTPException(
@@ -30,7 +43,16 @@ def check_cleaning_modification_permissions(
         )
 
 
-def user_owns_cleaning(*, user: UserInDB, cleaning: CleaningPublic) -> bool:
+def user_owns_cleaning(*, user: UserInDB, cleaning: Union[CleaningInDB, CleaningPublic]) -> bool:
     if isinstance(cleaning.owner, int):
         return cleaning.owner == user.id
     return cleaning.owner.id == user.id
+
+
+def get_cleaning_search_from_query(
+        q: str = Query(..., min_length=1, max_length=200),
+        cleaning_type: Optional[CleaningType] = Query(None),
+        min_price: Optional[float] = Query(None, ge=0),
+        max_price: Optional[float] = Query(None, ge=0),
+) -> CleaningSearch:
+    return CleaningSearch(query=q, cleaning_type=cleaning_type, min_price=min_price, max_price=max_price)
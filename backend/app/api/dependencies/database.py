@@ -1,16 +1,81 @@
-from typing import Callable, Type
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Callable, Optional, Type
 from databases import Database
 from fastapi import Depends
 from starlette.requests import Request
+from app.core.config import DB_PIN_REQUEST_CONNECTIONS
+from app.db.loaders import Loaders
+from app.db.pool import InstrumentedPool
+from app.db.replicas import DatabaseRouter, ReplicaSet
 from app.db.repositories.base import BaseRepository
 
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
 
 def get_database(request: Request) -> Database:
     return request.app.state._db
 
 
+def get_db_pool(request: Request) -> InstrumentedPool:
+    return request.app.state._db_pool
+
+
+def get_db_replicas(request: Request) -> Optional[ReplicaSet]:
+    return request.app.state._db_replicas
+
+
+def get_database_router(
+        request: Request,
+        db: Database = Depends(get_database),
+        replicas: Optional[ReplicaSet] = Depends(get_db_replicas),
+) -> DatabaseRouter:
+    # requests that write check what they're about to change, so they only ever read from the primary
+    return DatabaseRouter(db, replicas, pinned=request.method not in SAFE_METHODS)
+
+
+async def pin_request_connection(
+        request: Request,
+        router: DatabaseRouter = Depends(get_database_router),
+) -> AsyncIterator[None]:
+    """
+    Hold one connection for the rest of the request, so every query in it - and any transaction - shares it
+    instead of going back to the pool. Goes to the database the request reads from.
+    """
+    if not DB_PIN_REQUEST_CONNECTIONS or getattr(request.state, "release_db_connection", False):
+        yield
+        return
+    async with AsyncExitStack() as stack:
+        await stack.enter_async_context(router.reader.connection())
+        request.state._db_connection = stack
+        yield
+
+
+async def release_request_connection(request: Request) -> None:
+    """
+    Opt a route out of `pin_request_connection`, e.g. when it streams its response or waits on anything but
+    the database for long. Queries then acquire and release a connection each, as they would without pinning.
+    """
+    request.state.release_db_connection = True
+    pinned = getattr(request.state, "_db_connection", None)
+    if pinned is not None:
+        await pinned.aclose()
+
+
+def get_loaders(
+        db: Database = Depends(get_database),
+        router: DatabaseRouter = Depends(get_database_router),
+) -> Loaders:
+    # dependencies are cached per request, so every repository in a request shares these loaders
+    return Loaders(db, router)
+
+
 def get_repository(Repo_type: Type[BaseRepository]) -> Callable:
-    def get_repo(db: Database = Depends(get_database)) -> Type[BaseRepository]:
-        return Repo_type(db)
+    def get_repo(
+            db: Database = Depends(get_database),
+            loaders: Loaders = Depends(get_loaders),
+            router: DatabaseRouter = Depends(get_database_router),
+            _: None = Depends(pin_request_connection),
+    ) -> Type[BaseRepository]:
+        return Repo_type(db, loaders, router)
     
     return get_repo
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException, Query, status
+
+from app.core.config import FEED_PAGE_SIZE, MAX_PAGE_SIZE
+from app.models.pagination import PageCursor, Pagination
+
+
+def get_cleaning_feed_pagination(
+        page_chunk_size: int = Query(FEED_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        starting_date: Optional[datetime] = Query(None),
+        cursor: Optional[str] = Query(None),
+) -> Pagination:
+    """
+    Pages of the feed either follow the `X-Next-Cursor` header or hold the events from before
+    `starting_date` - usually the timestamp of the last event the client was sent.
+    """
+    if cursor:
+        try:
+            return Pagination(limit=page_chunk_size, cursor=PageCursor.decode(cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if starting_date:
+        if starting_date.tzinfo is None:
+            starting_date = starting_date.replace(tzinfo=timezone.utc)
+        # ids start at 1, so only events strictly before `starting_date` are included
+        return Pagination(limit=page_chunk_size, cursor=PageCursor(created_at=starting_date, id=0))
+    return Pagination(limit=page_chunk_size)
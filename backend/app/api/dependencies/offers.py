@@ -1,17 +1,20 @@
 from typing import List
 
-from fastapi import HTTPException, Depends, status
+from fastapi import HTTPException, Depends, Path, status
 
 from app.models.user import UserInDB
 from app.models.cleaning import CleaningInDB
-from app.models.offer import OfferInDB
+from app.models.offer import OfferInDB, OfferAuthorization
+from app.models.pagination import Pagination
 
 from app.db.repositories.offers import OffersRepository
+from app.db.repositories.authorization import AuthorizationRepository
 
 from app.api.dependencies.database import get_repository
 from app.api.dependencies.auth import get_current_active_user
 from app.api.dependencies.users import get_user_by_username_from_path
-from app.api.dependencies.cleanings import get_cleaning_by_id_from_path, user_owns_cleaning
+from app.api.dependencies.pagination import get_pagination
+from app.api.dependencies.cleanings import get_unpopulated_cleaning_by_id_from_path, user_owns_cleaning
 
 
 async def get_offer_for_cleaning_from_user(
@@ -25,22 +28,39 @@ async def get_offer_for_cleaning_from_user(
 
 async def get_offer_for_cleaning_from_user_by_path(
         user: UserInDB = Depends(get_user_by_username_from_path),
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
         offers_repo: OffersRepository = Depends(get_repository(OffersRepository)),
 ) -> OfferInDB:
     return await get_offer_for_cleaning_from_user(user=user, cleaning=cleaning, offers_repo=offers_repo)
 
 
+async def get_offer_authorization_from_path(
+        cleaning_id: int = Path(..., ge=1),
+        username: str = Path(..., min_length=3, regex="^[a-zA-Z0-9_-]+$"),
+        current_user: UserInDB = Depends(get_current_active_user),
+        authorization_repo: AuthorizationRepository = Depends(get_repository(AuthorizationRepository)),
+) -> OfferAuthorization:
+    authorization = await authorization_repo.get_offer_authorization(cleaning_id=cleaning_id, username=username)
+    if not authorization:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cleaning found with that id.")
+    if authorization.user_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No user found with that username.")
+    if authorization.offer_status is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Offer not found.")
+    return authorization
+
+
 async def list_offers_for_cleaning_by_id_from_path(
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
+        pagination: Pagination = Depends(get_pagination),
         offers_repo: OffersRepository = Depends(get_repository(OffersRepository)),
 ) -> List[OfferInDB]:
-    return await offers_repo.list_offers_for_cleaning(cleaning=cleaning)
+    return await offers_repo.list_offers_for_cleaning(cleaning=cleaning, pagination=pagination)
 
 
 async def check_offer_create_permissions(
         current_user: UserInDB = Depends(get_current_active_user),
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
         offers_repo: OffersRepository = Depends(get_repository(OffersRepository)),
 ) -> None:
     if user_owns_cleaning(user=current_user, cleaning=cleaning):
@@ -57,7 +77,7 @@ async def check_offer_create_permissions(
 
 async def get_offer_for_cleaning_from_current_user(
         current_user: UserInDB = Depends(get_current_active_user),
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
         offers_repo: OffersRepository = Depends(get_repository(OffersRepository)),
 ) -> OfferInDB:
     return await get_offer_for_cleaning_from_user(user=current_user, cleaning=cleaning, offers_repo=offers_repo)
@@ -65,7 +85,7 @@ async def get_offer_for_cleaning_from_current_user(
 
 def check_offer_list_permissions(
         current_user: UserInDB = Depends(get_current_active_user),
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
 ) -> None:
     if not user_owns_cleaning(user=current_user, cleaning=cleaning):
         raise HTTPException(
@@ -75,7 +95,7 @@ def check_offer_list_permissions(
 
 def check_offer_get_permissions(
         current_user: UserInDB = Depends(get_current_active_user),
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
         offer: OfferInDB = Depends(get_offer_for_cleaning_from_user_by_path),
 ) -> None:
     if not user_owns_cleaning(user=current_user, cleaning=cleaning) and offer.user_id != current_user.id:
@@ -86,19 +106,17 @@ def check_offer_get_permissions(
 
 def check_offer_acceptance_permissions(
         current_user: UserInDB = Depends(get_current_active_user),
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
-        offer: OfferInDB = Depends(get_offer_for_cleaning_from_user_by_path),
-        existing_offers: List[OfferInDB] = Depends(list_offers_for_cleaning_by_id_from_path)
+        authorization: OfferAuthorization = Depends(get_offer_authorization_from_path),
 ) -> None:
-    if not user_owns_cleaning(user=current_user, cleaning=cleaning):
+    if authorization.cleaning_owner != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Only the owner of the cleaning may accept offers."
         )
-    if offer.status != "pending":
+    if authorization.offer_status != "pending":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Can only accept offers that are currently pending."
         )
-    if "accepted" in [o.status for o in existing_offers]:
+    if authorization.has_accepted_offer:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="That cleaning job already has an accepted offer."
         )
@@ -0,0 +1,54 @@
+from typing import Optional, Sequence
+
+from fastapi import HTTPException, Query, status
+from starlette.responses import Response
+
+from app.core.config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.models.pagination import PageCursor, Pagination, SearchCursor, SearchPagination
+
+
+def get_pagination(
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+) -> Pagination:
+    try:
+        return Pagination(limit=limit, cursor=PageCursor.decode(cursor) if cursor else None)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def get_search_pagination(
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+) -> SearchPagination:
+    try:
+        return SearchPagination(limit=limit, cursor=SearchCursor.decode(cursor) if cursor else None)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def set_pagination_headers(
+        response: Response,
+        *,
+        items: Sequence,
+        pagination: Pagination,
+        timestamp: str = "created_at",
+        tiebreaker: str = "id",
+) -> None:
+    """
+    List bodies stay plain lists, so the page size and the cursor for the next page are sent as headers.
+    A full page is assumed to have more items after it.
+    """
+    response.headers["X-Limit"] = str(pagination.limit)
+    if items and len(items) == pagination.limit:
+        last = items[-1]
+        response.headers["X-Next-Cursor"] = PageCursor(
+            created_at=getattr(last, timestamp), id=getattr(last, tiebreaker),
+        ).encode()
+
+
+def set_search_pagination_headers(response: Response, *, results: Sequence, pagination: SearchPagination) -> None:
+    response.headers["X-Limit"] = str(pagination.limit)
+    if results and len(results) == pagination.limit:
+        last = results[-1]
+        response.headers["X-Next-Cursor"] = SearchCursor(rank=last.rank, id=last.id).encode()
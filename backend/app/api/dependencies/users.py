@@ -1,15 +1,22 @@
-from fastapi import HTTPException, Depends, Path, status
+import re
+from typing import List
+
+from fastapi import HTTPException, Depends, Path, Query, status
+
+from app.core.config import MAX_BULK_STATS_USERNAMES
 
 from app.models.user import UserInDB
 from app.db.repositories.users import UsersRepository
 
 from app.api.dependencies.database import get_repository
-from app.api.dependencies.auth import get_current_active_user
+from app.api.dependencies.auth import get_current_active_user_from_claims
+
+USERNAME_PATTERN = re.compile("^[a-zA-Z0-9_-]{3,}$")
 
 
 async def get_user_by_username_from_path(
         username: str = Path(..., min_length=3, regex="^[a-zA-Z0-9_-]+$"),
-        current_user: UserInDB = Depends(get_current_active_user),
+        current_user: UserInDB = Depends(get_current_active_user_from_claims),
         users_repo: UsersRepository = Depends(get_repository(UsersRepository)),
 ) -> UserInDB:
     user = await users_repo.get_user_by_username(username=username, populate=False)
@@ -18,3 +25,20 @@ async def get_user_by_username_from_path(
             status_code=status.HTTP_404_NOT_FOUND, detail="No user found with that username.",
         )
     return user
+
+
+def get_usernames_from_query(
+        usernames: List[str] = Query(..., description="Repeated, or separated by commas"),
+) -> List[str]:
+    usernames = list(dict.fromkeys(u.strip() for value in usernames for u in value.split(",") if u.strip()))
+    if len(usernames) > MAX_BULK_STATS_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BULK_STATS_USERNAMES} usernames can be requested at once.",
+        )
+    invalid = [u for u in usernames if not USERNAME_PATTERN.match(u)]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid usernames: {', '.join(invalid)}.",
+        )
+    return usernames
@@ -0,0 +1,44 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query, Response
+
+from app.core.config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.models.evaluation import CleanerAggregate, LeaderboardEntry
+
+from app.db.repositories.evaluations import EvaluationsRepository
+
+from app.api.dependencies.database import get_repository
+from app.api.dependencies.auth import get_current_active_user_from_claims
+from app.api.dependencies.users import get_usernames_from_query
+
+router = APIRouter(dependencies=[Depends(get_current_active_user_from_claims)])
+
+
+@router.get("/stats/", response_model=List[CleanerAggregate], name="cleaners:list-stats-for-cleaners")
+async def list_stats_for_cleaners(
+        usernames: List[str] = Depends(get_usernames_from_query),
+        evals_repo: EvaluationsRepository = Depends(get_repository(EvaluationsRepository)),
+) -> List[CleanerAggregate]:
+    return await evals_repo.list_cleaner_aggregates(usernames=usernames)
+
+
+@router.get("/leaderboard/", response_model=List[LeaderboardEntry], name="cleaners:get-leaderboard")
+async def get_leaderboard(
+        response: Response,
+        min_evaluations: int = Query(1, ge=1),
+        max_no_show_rate: float = Query(1, ge=0, le=1),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[int] = Query(None, ge=0, description="Rank of the last cleaner of the previous page"),
+        evals_repo: EvaluationsRepository = Depends(get_repository(EvaluationsRepository)),
+) -> List[LeaderboardEntry]:
+    leaderboard = await evals_repo.list_leaderboard(
+        min_evaluations=min_evaluations,
+        max_no_show_rate=max_no_show_rate,
+        limit=limit,
+        after_rank=cursor or 0,
+    )
+    # pages follow the ranks, so the cursor is simply the last rank sent
+    response.headers["X-Limit"] = str(limit)
+    if len(leaderboard) == limit:
+        response.headers["X-Next-Cursor"] = str(leaderboard[-1].rank)
+    return leaderboard
@@ -1,13 +1,34 @@
+import asyncio
 from typing import List
 
-from fastapi import APIRouter, Body, Depends, status
+from fastapi import APIRouter, Body, Depends, Path, Response, status
 
 from app.models.user import UserInDB
-from app.models.cleaning import CleaningCreate, CleaningUpdate, CleaningInDB, CleaningPublic
+from app.models.pagination import Pagination, SearchPagination
+from app.models.cleaning import (
+    CleaningCreate,
+    CleaningUpdate,
+    CleaningInDB,
+    CleaningPublic,
+    CleaningSearch,
+    CleaningSearchResult,
+    CleaningDiscovery,
+)
 from app.db.repositories.cleanings import CleaningsRepository
 from app.api.dependencies.database import get_repository
-from app.api.dependencies.auth import get_current_active_user
-from app.api.dependencies.cleanings import get_cleaning_by_id_from_path, check_cleaning_modification_permissions
+from app.api.dependencies.pagination import (
+    get_pagination,
+    get_search_pagination,
+    set_pagination_headers,
+    set_search_pagination_headers,
+)
+from app.api.dependencies.auth import get_current_active_user, get_current_active_user_from_claims
+from app.api.dependencies.cleanings import (
+    get_cleaning_by_id_from_path,
+    get_unpopulated_cleaning_by_id_from_path,
+    check_cleaning_modification_permissions,
+    get_cleaning_search_from_query,
+)
 
 router = APIRouter()
 
@@ -23,10 +44,49 @@ async def create_new_cleaning(
 
 @router.get("/", response_model=List[CleaningPublic], name="cleanings:list-all-user-cleanings")
 async def list_all_user_cleanings(
-        current_user: UserInDB = Depends(get_current_active_user),
+        response: Response,
+        current_user: UserInDB = Depends(get_current_active_user_from_claims),
+        pagination: Pagination = Depends(get_pagination),
         cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
 ) -> List[CleaningPublic]:
-    return await cleanings_repo.list_all_user_cleanings(requesting_user=current_user)
+    cleanings = await cleanings_repo.list_all_user_cleanings(requesting_user=current_user, pagination=pagination)
+    set_pagination_headers(response, items=cleanings, pagination=pagination)
+    return cleanings
+
+
+# declared before the routes for a single cleaning, whose path would also match
+@router.get("/search/", response_model=List[CleaningSearchResult], name="cleanings:search-cleanings")
+async def search_cleanings(
+        response: Response,
+        search: CleaningSearch = Depends(get_cleaning_search_from_query),
+        current_user: UserInDB = Depends(get_current_active_user_from_claims),
+        pagination: SearchPagination = Depends(get_search_pagination),
+        cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
+) -> List[CleaningSearchResult]:
+    results = await cleanings_repo.search_cleanings(
+        **search.dict(), requesting_user=current_user, pagination=pagination,
+    )
+    set_search_pagination_headers(response, results=results, pagination=pagination)
+    return results
+
+
+@router.get("/discover/", response_model=CleaningDiscovery, name="cleanings:discover-cleanings")
+async def discover_cleanings(
+        response: Response,
+        search: CleaningSearch = Depends(get_cleaning_search_from_query),
+        current_user: UserInDB = Depends(get_current_active_user_from_claims),
+        pagination: SearchPagination = Depends(get_search_pagination),
+        cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
+) -> CleaningDiscovery:
+    """
+    A page of search results along with the facet counts of every match
+    """
+    results, facets = await asyncio.gather(
+        cleanings_repo.search_cleanings(**search.dict(), requesting_user=current_user, pagination=pagination),
+        cleanings_repo.count_cleaning_facets(**search.dict()),
+    )
+    set_search_pagination_headers(response, results=results, pagination=pagination)
+    return CleaningDiscovery(results=results, facets=facets)
 
 
 @router.get("/{cleaning_id}/", response_model=CleaningPublic, name="cleanings:get-cleaning-by-id")
@@ -41,21 +101,18 @@ async def get_cleaning_by_id(cleaning: CleaningInDB = Depends(get_cleaning_by_id
     dependencies=[Depends(check_cleaning_modification_permissions)],
 )
 async def update_cleaning_by_id(
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
         cleaning_update: CleaningUpdate = Body(..., embed=True),
         cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
 ) -> CleaningPublic:
     return await cleanings_repo.update_cleaning(cleaning=cleaning, cleaning_update=cleaning_update)
 
 
-@router.delete(
-    "/{cleaning_id}/",
-    response_model=int,
-    name="cleanings:delete-cleaning-by-id",
-    dependencies=[Depends(check_cleaning_modification_permissions)],
-)
+@router.delete("/{cleaning_id}/", response_model=int, name="cleanings:delete-cleaning-by-id")
 async def delete_cleaning_by_id(
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning_id: int = Path(..., ge=1),
+        current_user: UserInDB = Depends(get_current_active_user),
         cleanings_repo: CleaningsRepository = Depends(get_repository(CleaningsRepository)),
 ) -> int:
-    return await cleanings_repo.delete_cleaning_by_id(cleaning=cleaning)
+    # ownership is checked by the delete itself
+    return await cleanings_repo.delete_cleaning_by_id(id=cleaning_id, requesting_user=current_user)
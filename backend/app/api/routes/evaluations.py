@@ -1,18 +1,18 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, Body, Path, status
+from fastapi import APIRouter, Depends, Body, Path, Response, status
 
 from app.models.evaluation import EvaluationCreate, EvaluationInDB, EvaluationPublic, EvaluationAggregate
 from app.models.user import UserInDB
-from app.models.cleaning import CleaningInDB
+from app.models.pagination import Pagination
 
 from app.db.repositories.evaluations import EvaluationsRepository
 
 from app.api.dependencies.database import get_repository
-from app.api.dependencies.cleanings import get_cleaning_by_id_from_path
+from app.api.dependencies.auth import get_current_active_user
 from app.api.dependencies.users import get_user_by_username_from_path
+from app.api.dependencies.pagination import get_pagination, set_pagination_headers
 from app.api.dependencies.evaluations import (
-    check_evaluation_create_permissions,
     list_evaluations_for_cleaner_from_path,
     get_cleaner_evaluation_for_cleaning_from_path,
 )
@@ -25,16 +25,19 @@ router = APIRouter()
     response_model=EvaluationPublic,
     name="evaluations:create-evaluation-for-cleaner",
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Depends(check_evaluation_create_permissions)],
 )
 async def create_evaluation_for_cleaner(
         evaluation_create: EvaluationCreate = Body(..., embed=True),
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
-        cleaner: UserInDB = Depends(get_user_by_username_from_path),
+        cleaning_id: int = Path(..., ge=1),
+        username: str = Path(..., min_length=3, regex="^[a-zA-Z0-9_-]+$"),
+        current_user: UserInDB = Depends(get_current_active_user),
         evals_repo: EvaluationsRepository = Depends(get_repository(EvaluationsRepository)),
 ) -> EvaluationPublic:
     return await evals_repo.create_evaluation_for_cleaner(
-        evaluation_create=evaluation_create, cleaner=cleaner, cleaning=cleaning
+        evaluation_create=evaluation_create,
+        cleaning_id=cleaning_id,
+        cleaner_username=username,
+        requesting_user=current_user,
     )
 
 
@@ -44,8 +47,11 @@ async def create_evaluation_for_cleaner(
     name="evaluations:list-evaluations-for-cleaner",
 )
 async def list_evaluations_for_cleaner(
-        evaluations: List[EvaluationInDB] = Depends(list_evaluations_for_cleaner_from_path)
+        response: Response,
+        evaluations: List[EvaluationInDB] = Depends(list_evaluations_for_cleaner_from_path),
+        pagination: Pagination = Depends(get_pagination),
 ) -> List[EvaluationPublic]:
+    set_pagination_headers(response, items=evaluations, pagination=pagination, tiebreaker="cleaning_id")
     return evaluations
 
 
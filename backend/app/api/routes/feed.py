@@ -0,0 +1,29 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, Response
+
+from app.models.feed import CleaningFeedItem
+from app.models.pagination import Pagination
+from app.db.repositories.feed import FeedRepository
+from app.api.dependencies.database import get_repository
+from app.api.dependencies.feed import get_cleaning_feed_pagination
+from app.api.dependencies.pagination import set_pagination_headers
+from app.api.dependencies.auth import get_current_active_user_from_claims
+
+router = APIRouter()
+
+
+@router.get(
+    "/cleanings/",
+    response_model=List[CleaningFeedItem],
+    name="feed:get-cleaning-feed-for-user",
+    dependencies=[Depends(get_current_active_user_from_claims)],
+)
+async def get_cleaning_feed_for_user(
+        response: Response,
+        pagination: Pagination = Depends(get_cleaning_feed_pagination),
+        feed_repo: FeedRepository = Depends(get_repository(FeedRepository)),
+) -> List[CleaningFeedItem]:
+    feed = await feed_repo.get_cleaning_feed(pagination=pagination)
+    set_pagination_headers(response, items=feed, pagination=pagination, timestamp="event_timestamp")
+    return feed
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends
+
+from app.models.health import DatabasePoolStats, PasswordHashingStats
+
+from app.db.pool import InstrumentedPool
+
+from app.api.dependencies.database import get_db_pool
+
+from app.services import auth_service
+
+router = APIRouter()
+
+
+@router.get("/db-pool/", response_model=DatabasePoolStats, name="health:get-db-pool-stats")
+async def get_db_pool_stats(pool: InstrumentedPool = Depends(get_db_pool)) -> DatabasePoolStats:
+    return DatabasePoolStats(**pool.stats())
+
+
+@router.get("/password-hashing/", response_model=PasswordHashingStats, name="health:get-password-hashing-stats")
+async def get_password_hashing_stats() -> PasswordHashingStats:
+    return PasswordHashingStats(**auth_service.hashing_pool.stats())
@@ -1,16 +1,18 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, Path, status
+from fastapi import APIRouter, HTTPException, Depends, Path, Response, status
 
 from app.models.offer import OfferCreate, OfferUpdate, OfferInDB, OfferPublic
 from app.models.user import UserInDB
 from app.models.cleaning import CleaningInDB
+from app.models.pagination import Pagination
 
 from app.db.repositories.offers import OffersRepository
 
 from app.api.dependencies.database import get_repository
 from app.api.dependencies.auth import get_current_active_user
-from app.api.dependencies.cleanings import get_cleaning_by_id_from_path
+from app.api.dependencies.cleanings import get_unpopulated_cleaning_by_id_from_path
+from app.api.dependencies.pagination import get_pagination, set_pagination_headers
 from app.api.dependencies.offers import (
     check_offer_create_permissions,
     check_offer_get_permissions,
@@ -34,7 +36,7 @@ router = APIRouter()
     dependencies=[Depends(check_offer_create_permissions)],
 )
 async def create_offer(
-        cleaning: CleaningInDB = Depends(get_cleaning_by_id_from_path),
+        cleaning: CleaningInDB = Depends(get_unpopulated_cleaning_by_id_from_path),
         current_user: UserInDB = Depends(get_current_active_user),
         offers_repo: OffersRepository = Depends(get_repository(OffersRepository)),
 ) -> OfferPublic:
@@ -51,8 +53,11 @@ async def create_offer(
     dependencies=[Depends(check_offer_list_permissions)],
 )
 async def list_offers_for_cleaning(
-        offers: List[OfferInDB] = Depends(list_offers_for_cleaning_by_id_from_path)
+        response: Response,
+        offers: List[OfferInDB] = Depends(list_offers_for_cleaning_by_id_from_path),
+        pagination: Pagination = Depends(get_pagination),
 ) -> List[OfferPublic]:
+    set_pagination_headers(response, items=offers, pagination=pagination, tiebreaker="user_id")
     return offers
 
 
@@ -1,6 +1,6 @@
 from fastapi import Depends, APIRouter, HTTPException, Path, Body, status
 
-from app.api.dependencies.auth import get_current_active_user
+from app.api.dependencies.auth import get_current_active_user, get_current_active_user_from_claims
 from app.api.dependencies.database import get_repository
 
 from app.models.user import UserInDB
@@ -14,7 +14,7 @@ router = APIRouter()
 @router.get("/{username}/", response_model=ProfilePublic, name="profiles:get-profile-by-username")
 async def get_profile_by_username(
         username: str = Path(..., min_length=3, regex="^[a-zA-Z0-9_-]+$"),
-        current_user: UserInDB = Depends(get_current_active_user),
+        current_user: UserInDB = Depends(get_current_active_user_from_claims),
         profiles_repo: ProfilesRepository = Depends(get_repository(ProfilesRepository)),
 ) -> ProfilePublic:
     profile = await profiles_repo.get_profile_by_username(username=username)
@@ -5,35 +5,45 @@ from starlette.status import (
 )
 from fastapi.security import OAuth2PasswordRequestForm
 
-from app.api.dependencies.database import get_repository
+from app.core.config import SECRET_KEY
+from app.api.dependencies.database import get_repository, release_request_connection
 from app.api.dependencies.auth import get_current_active_user
 from app.models.user import UserCreate, UserInDB, UserPublic
 from app.db.repositories.users import UsersRepository
+from app.db.repositories.tokens import TokensRepository
 from app.models.token import AccessToken
 from app.services import auth_service
 
 router = APIRouter()
+# password hashing takes far longer than the queries around it, so these don't hold a connection through it
+HASHES_PASSWORDS = [Depends(release_request_connection)]
 
 
-@router.post("/", response_model=UserPublic, name="users:register-new-user", status_code=HTTP_201_CREATED)
+@router.post(
+    "/",
+    response_model=UserPublic,
+    name="users:register-new-user",
+    status_code=HTTP_201_CREATED,
+    dependencies=HASHES_PASSWORDS,
+)
 async def register_new_user(
         new_user: UserCreate = Body(..., embed=True),
         user_repo: UsersRepository = Depends(get_repository(UsersRepository)),
 ) -> UserPublic:
     created_user = await user_repo.register_new_user(new_user=new_user)
-    access_token = AccessToken(
-        access_token=auth_service.create_access_token_for_user(user=created_user), token_type="bearer"
-    )
+    access_token = auth_service.create_tokens_for_user(user=created_user)
     return created_user.copy(update={"access_token": access_token})
 
 
-@router.post("/login/token/", response_model=AccessToken, name="users:login-email-and-password")
+@router.post(
+    "/login/token/", response_model=AccessToken, name="users:login-email-and-password", dependencies=HASHES_PASSWORDS,
+)
 async def user_login_with_email_and_password(
         user_repo: UsersRepository = Depends(get_repository(UsersRepository)),
         form_data: OAuth2PasswordRequestForm = Depends(OAuth2PasswordRequestForm),
 ) -> AccessToken:
     user = await user_repo.authenticate_user(email=form_data.username, password=form_data.password)
-
+    
     if not user:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
@@ -41,11 +51,38 @@ async def user_login_with_email_and_password(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = AccessToken(access_token=auth_service.create_access_token_for_user(user=user), token_type="bearer")
+    access_token = auth_service.create_tokens_for_user(user=user)
     
     return access_token
 
 
+@router.post("/login/token/refresh/", response_model=AccessToken, name="users:refresh-access-token")
+async def refresh_access_token(
+        refresh_token: str = Body(..., embed=True),
+        user_repo: UsersRepository = Depends(get_repository(UsersRepository)),
+        tokens_repo: TokensRepository = Depends(get_repository(TokensRepository)),
+) -> AccessToken:
+    payload = auth_service.get_payload_from_token(
+        token=refresh_token, secret_key=str(SECRET_KEY), token_type="refresh"
+    )
+    user = await user_repo.get_user_by_username(username=payload.username, populate=False)
+    
+    # refresh tokens are single use, whichever app process they were used with
+    if (
+        not user
+        or not user.is_active
+        or not payload.jti
+        or not await tokens_repo.revoke_token(jti=payload.jti, expires_at=payload.exp)
+    ):
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED,
+            detail="Could not validate token credentials.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return auth_service.create_tokens_for_user(user=user)
+
+
 @router.get("/me/", response_model=UserPublic, name="users:get-current-user")
 async def get_currently_authenticated_user(current_user: UserInDB = Depends(get_current_active_user)) -> UserPublic:
     return current_user
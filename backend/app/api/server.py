@@ -1,11 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core import config, tasks
+from app.db.pool import PoolAcquireTimeout
 
 from app.api.routes import router as api_router
 
 
+async def handle_db_pool_timeout(request: Request, exc: PoolAcquireTimeout) -> JSONResponse:
+    # every connection stayed busy for DB_POOL_ACQUIRE_TIMEOUT_SECONDS
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "The service is busy, please try again later."},
+        headers={"Retry-After": "1"},
+    )
+
+
 def get_application():
     app = FastAPI(title=config.PROJECT_NAME, version=config.VERSION)
     
@@ -15,11 +26,15 @@ def get_application():
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # pagination of list endpoints
+        expose_headers=["X-Limit", "X-Next-Cursor"],
     )
     
     app.add_event_handler("startup", tasks.create_start_app_handler(app))
     app.add_event_handler("shutdown", tasks.create_stop_app_handler(app))
     
+    app.add_exception_handler(PoolAcquireTimeout, handle_db_pool_timeout)
+    
     app.include_router(api_router, prefix="/api")
     
     return app
@@ -1,6 +1,6 @@
 from databases import DatabaseURL
 from starlette.config import Config
-from starlette.datastructures import Secret
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 config = Config(".env")
 PROJECT_NAME = "phrosty"
@@ -15,6 +15,43 @@ ACCESS_TOKEN_EXPIRE_MINUTES = config(
 JWT_ALGORITHM = config("JWT_ALGORITHM", cast=str, default="HS256")
 JWT_AUDIENCE = config("JWT_AUDIENCE", cast=str, default="phrosty:auth")
 JWT_TOKEN_PREFIX = config("JWT_TOKEN_PREFIX", cast=str, default="Bearer")
+# stateless auth issues short-lived access tokens carrying the user's id and flags, plus refresh tokens.
+# refresh tokens are single use, while access tokens can't be revoked - they're valid until they expire
+JWT_STATELESS_AUTH = config("JWT_STATELESS_AUTH", cast=bool, default=False)
+STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES = config("STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES", cast=int, default=15)
+REFRESH_TOKEN_EXPIRE_MINUTES = config(
+    "REFRESH_TOKEN_EXPIRE_MINUTES",
+    cast=int,
+    default=30 * 24 * 60  # thirty days
+)
+
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", cast=int, default=12)
+# when set, BCRYPT_ROUNDS is replaced on startup by the cost factor that hashes in about this many milliseconds
+BCRYPT_TARGET_HASH_MS = config("BCRYPT_TARGET_HASH_MS", cast=float, default=0)
+PASSWORD_HASHING_MAX_WORKERS = config("PASSWORD_HASHING_MAX_WORKERS", cast=int, default=4)
+PASSWORD_HASHING_QUEUE_TIMEOUT_SECONDS = config("PASSWORD_HASHING_QUEUE_TIMEOUT_SECONDS", cast=float, default=5)
+
+AUTH_USER_CACHE_MAX_SIZE = config("AUTH_USER_CACHE_MAX_SIZE", cast=int, default=10_000)
+AUTH_USER_CACHE_TTL_SECONDS = config("AUTH_USER_CACHE_TTL_SECONDS", cast=float, default=60)  # 0 disables the cache
+
+# list endpoints return pages of at most MAX_PAGE_SIZE items, DEFAULT_PAGE_SIZE unless a limit is asked for
+DEFAULT_PAGE_SIZE = config("DEFAULT_PAGE_SIZE", cast=int, default=50)
+MAX_PAGE_SIZE = config("MAX_PAGE_SIZE", cast=int, default=200)
+FEED_PAGE_SIZE = config("FEED_PAGE_SIZE", cast=int, default=20)
+# the first page of the feed is the same for everyone, so it's shared for a few seconds - 0 disables the cache
+CLEANING_FEED_CACHE_TTL_SECONDS = config("CLEANING_FEED_CACHE_TTL_SECONDS", cast=float, default=5)
+
+# search facets count matches per price bucket, split at these prices
+CLEANING_PRICE_BUCKETS = sorted(
+    float(price) for price in config("CLEANING_PRICE_BUCKETS", cast=CommaSeparatedStrings, default="25,50,100,250")
+)
+CLEANING_FACETS_CACHE_MAX_SIZE = config("CLEANING_FACETS_CACHE_MAX_SIZE", cast=int, default=10_000)
+# 0 disables the cache
+CLEANING_FACETS_CACHE_TTL_SECONDS = config("CLEANING_FACETS_CACHE_TTL_SECONDS", cast=float, default=5)
+
+# cleaner rankings are precomputed and refreshed this often by every app process, 0 disables refreshing
+LEADERBOARD_REFRESH_INTERVAL_SECONDS = config("LEADERBOARD_REFRESH_INTERVAL_SECONDS", cast=float, default=300)
+MAX_BULK_STATS_USERNAMES = config("MAX_BULK_STATS_USERNAMES", cast=int, default=300)
 
 POSTGRES_USER = config("POSTGRES_USER", cast=str, default="postgres")
 POSTGRES_PASSWORD = config("POSTGRES_PASSWORD", cast=Secret, default="password")
@@ -26,3 +63,21 @@ DATABASE_URL = config(
     cast=DatabaseURL,
     default=f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
 )
+
+# "databases", or "asyncpg" to run queries on an asyncpg pool directly, as prepared statements
+DATABASE_BACKEND = config("DATABASE_BACKEND", cast=str, default="databases")
+
+# connection pool of every app process
+DB_POOL_MIN_SIZE = config("DB_POOL_MIN_SIZE", cast=int, default=2)
+DB_POOL_MAX_SIZE = config("DB_POOL_MAX_SIZE", cast=int, default=10)
+DB_POOL_ACQUIRE_TIMEOUT_SECONDS = config("DB_POOL_ACQUIRE_TIMEOUT_SECONDS", cast=float, default=10)  # 0 waits forever
+# connections are recycled once they're this old, and closed once they've been idle this long - 0 disables either
+DB_POOL_MAX_CONNECTION_LIFETIME_SECONDS = config("DB_POOL_MAX_CONNECTION_LIFETIME_SECONDS", cast=float, default=3600)
+DB_POOL_MAX_IDLE_SECONDS = config("DB_POOL_MAX_IDLE_SECONDS", cast=float, default=300)
+# a request holds on to the first connection it needs, rather than acquiring one per query
+DB_PIN_REQUEST_CONNECTIONS = config("DB_PIN_REQUEST_CONNECTIONS", cast=bool, default=True)
+
+# reads are spread over these replicas of DATABASE_URL, skipping any that are down or lag too far behind
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", cast=CommaSeparatedStrings, default="")
+DB_REPLICA_MAX_LAG_SECONDS = config("DB_REPLICA_MAX_LAG_SECONDS", cast=float, default=5)
+DB_REPLICA_HEALTH_CHECK_INTERVAL_SECONDS = config("DB_REPLICA_HEALTH_CHECK_INTERVAL_SECONDS", cast=float, default=5)
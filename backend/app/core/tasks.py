@@ -1,17 +1,65 @@
+import asyncio
+import logging
 from typing import Callable
 from fastapi import FastAPI
+from app.core.config import (
+    BCRYPT_TARGET_HASH_MS,
+    DB_REPLICA_HEALTH_CHECK_INTERVAL_SECONDS,
+    LEADERBOARD_REFRESH_INTERVAL_SECONDS,
+)
 from app.db.tasks import connect_to_db, close_db_connection
+from app.db.replicas import ReplicaSet
+from app.db.repositories.evaluations import EvaluationsRepository
+from app.services import auth_service
+from app.services.authentication import calibrate_bcrypt_rounds
+
+logger = logging.getLogger(__name__)
+
+
+async def refresh_leaderboard_periodically(app: FastAPI, *, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await EvaluationsRepository(app.state._db).refresh_leaderboard()
+        except Exception as e:
+            logger.warning(f"Failed to refresh the cleaner leaderboard: {e}")
+
+
+async def check_replica_health_periodically(replicas: ReplicaSet, *, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await replicas.check_health()
 
 
 def create_start_app_handler(app: FastAPI) -> Callable:
     async def start_app() -> None:
         await connect_to_db(app)
+        if BCRYPT_TARGET_HASH_MS:
+            rounds = calibrate_bcrypt_rounds(target_ms=BCRYPT_TARGET_HASH_MS)
+            auth_service.set_bcrypt_rounds(rounds=rounds)
+            logger.info(f"Hashing passwords with {rounds} bcrypt rounds (target {BCRYPT_TARGET_HASH_MS}ms)")
+        app.state._leaderboard_refresh = None
+        if LEADERBOARD_REFRESH_INTERVAL_SECONDS:
+            app.state._leaderboard_refresh = asyncio.create_task(
+                refresh_leaderboard_periodically(app, interval=LEADERBOARD_REFRESH_INTERVAL_SECONDS)
+            )
+        app.state._replica_health_checks = None
+        if app.state._db_replicas is not None:
+            app.state._replica_health_checks = asyncio.create_task(
+                check_replica_health_periodically(
+                    app.state._db_replicas, interval=DB_REPLICA_HEALTH_CHECK_INTERVAL_SECONDS,
+                )
+            )
     
     return start_app
 
 
 def create_stop_app_handler(app: FastAPI) -> Callable:
     async def stop_app() -> None:
+        if app.state._leaderboard_refresh is not None:
+            app.state._leaderboard_refresh.cancel()
+        if app.state._replica_health_checks is not None:
+            app.state._replica_health_checks.cancel()
         await close_db_connection(app)
     
     return stop_app
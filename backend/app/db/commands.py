@@ -0,0 +1,61 @@
+"""
+Maintenance commands, run from the backend directory with
+
+    python -m app.db.commands check-rating-aggregates
+    python -m app.db.commands rebuild-rating-aggregates
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from typing import List, Optional
+
+from databases import Database
+
+from app.core.config import DATABASE_URL
+from app.db.repositories.evaluations import EvaluationsRepository
+
+logger = logging.getLogger(__name__)
+
+
+async def check_rating_aggregates(db: Database) -> int:
+    inconsistent = await EvaluationsRepository(db).list_inconsistent_cleaner_aggregates()
+    if inconsistent:
+        logger.warning("Rating aggregates don't match the evaluations of cleaners %s", inconsistent)
+        return 1
+    logger.info("Rating aggregates match the evaluations of every cleaner")
+    return 0
+
+
+async def rebuild_rating_aggregates(db: Database) -> int:
+    rebuilt = await EvaluationsRepository(db).rebuild_cleaner_aggregates()
+    logger.info("Rebuilt the rating aggregates of %d cleaners", len(rebuilt))
+    return 0
+
+
+COMMANDS = {
+    "check-rating-aggregates": check_rating_aggregates,
+    "rebuild-rating-aggregates": rebuild_rating_aggregates,
+}
+
+
+async def run(command: str) -> int:
+    database = Database(f"{DATABASE_URL}_test" if os.environ.get("TESTING") else DATABASE_URL)
+    await database.connect()
+    try:
+        return await COMMANDS[command](database)
+    finally:
+        await database.disconnect()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.db.commands")
+    parser.add_argument("command", choices=COMMANDS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    return asyncio.run(run(args.command))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
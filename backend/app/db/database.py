@@ -0,0 +1,238 @@
+import asyncio
+import contextvars
+import logging
+from typing import Any, List, Mapping, Optional, Union
+
+import asyncpg
+from databases import Database, DatabaseURL
+from sqlalchemy.sql import ClauseElement
+
+from app.db.queries import CompiledQuery, QueryRegistry, queries
+
+logger = logging.getLogger(__name__)
+
+# asyncpg's default
+STATEMENT_CACHE_SIZE = 100
+
+Query = Union[ClauseElement, str]
+
+
+class PrecompiledDatabase(Database):
+    """
+    Runs the queries in `registry` straight on the asyncpg connection, with the placeholders and
+    parameter order they were compiled with, instead of having `databases` compile them on every call.
+    Anything else - and everything about connections and transactions - is left to `databases`.
+    """
+    
+    def __init__(self, url: str, *, registry: QueryRegistry = queries, **options: Any) -> None:
+        super().__init__(url, **options)
+        self.registry = registry
+    
+    async def fetch_all(self, query: Query, values: Optional[Mapping] = None) -> List[Mapping]:
+        compiled = self.registry.get(query)
+        if compiled is None:
+            return await super().fetch_all(query, values)
+        arguments = compiled.arguments(values)
+        async with self.connection() as connection:
+            # a connection pinned for the request is shared by everything the request runs concurrently
+            async with connection._query_lock:
+                return await connection.raw_connection.fetch(compiled.sql, *arguments)
+    
+    async def fetch_one(self, query: Query, values: Optional[Mapping] = None) -> Optional[Mapping]:
+        compiled = self.registry.get(query)
+        if compiled is None:
+            return await super().fetch_one(query, values)
+        arguments = compiled.arguments(values)
+        async with self.connection() as connection:
+            async with connection._query_lock:
+                return await connection.raw_connection.fetchrow(compiled.sql, *arguments)
+    
+    async def fetch_val(self, query: Query, values: Optional[Mapping] = None, column: Any = 0) -> Any:
+        compiled = self.registry.get(query)
+        if compiled is None:
+            return await super().fetch_val(query, values, column=column)
+        row = await self.fetch_one(query, values)
+        return None if row is None else row[column]
+    
+    async def execute(self, query: Query, values: Optional[Mapping] = None) -> Any:
+        compiled = self.registry.get(query)
+        if compiled is None:
+            return await super().execute(query, values)
+        arguments = compiled.arguments(values)
+        async with self.connection() as connection:
+            async with connection._query_lock:
+                # like `databases`, the first column of the first row, e.g. the id of an INSERT ... RETURNING id
+                return await connection.raw_connection.fetchval(compiled.sql, *arguments)
+
+
+async def prepare_statements(connection: asyncpg.Connection, registry: QueryRegistry) -> None:
+    """
+    Fill the statement cache of a new connection with every registered query, so none of them is parsed and
+    planned by the server while a request waits on it. Queries registered later are prepared on first use.
+    
+    A statement from the public `prepare` can only be used until the connection goes back to the pool, and
+    doesn't go in the cache that `fetch` and friends look statements up in - so this relies on asyncpg's
+    `_prepare`, which is why asyncpg is pinned in requirements.txt. tests/test_database.py fails if an upgrade
+    stops it filling the cache.
+    """
+    for query in registry:
+        try:
+            await connection._prepare(query.sql, use_cache=True)
+        except asyncpg.PostgresError as e:
+            # e.g. queries on extensions that aren't installed, they only fail if they're ever run
+            logger.debug(f"Couldn't prepare {query.name}: {e}")
+    # preparing only flushes, which leaves the connection in an implicit transaction holding a lock on every table
+    # the queries touch, until a sync closes it
+    await connection.fetchval("SELECT 1;")
+
+
+class AsyncpgConnection:
+    """
+    Same lifecycle as a `databases` connection: acquired by the first `async with`, released by the last,
+    and shared by everything that runs in the same context.
+    """
+    
+    def __init__(self, database: "AsyncpgDatabase") -> None:
+        self._database = database
+        self._connection: Optional[asyncpg.Connection] = None
+        self._counter = 0
+        self._connection_lock = asyncio.Lock()
+        self._query_lock = asyncio.Lock()
+    
+    async def __aenter__(self) -> "AsyncpgConnection":
+        async with self._connection_lock:
+            self._counter += 1
+            if self._counter == 1:
+                try:
+                    self._connection = await self._database.pool.acquire()
+                except BaseException:
+                    self._counter -= 1
+                    raise
+        return self
+    
+    async def __aexit__(self, *args: Any) -> None:
+        async with self._connection_lock:
+            self._counter -= 1
+            if self._counter == 0:
+                connection, self._connection = self._connection, None
+                await self._database.pool.release(connection)
+    
+    @property
+    def raw_connection(self) -> asyncpg.Connection:
+        assert self._connection is not None, "Connection is not acquired"
+        return self._connection
+    
+    async def _run(self, method: str, query: str, values: Optional[Mapping], **kwargs: Any) -> Any:
+        if not isinstance(query, str):
+            raise TypeError(f"Only text queries can run on asyncpg directly, not {type(query).__name__}")
+        compiled = self._database.registry.get(query) or CompiledQuery("unregistered query", query)
+        arguments = compiled.arguments(values)
+        async with self._query_lock:
+            return await getattr(self.raw_connection, method)(compiled.sql, *arguments, **kwargs)
+    
+    async def fetch_all(self, query: str, values: Optional[Mapping] = None) -> List[asyncpg.Record]:
+        return await self._run("fetch", query, values)
+    
+    async def fetch_one(self, query: str, values: Optional[Mapping] = None) -> Optional[asyncpg.Record]:
+        return await self._run("fetchrow", query, values)
+    
+    async def fetch_val(self, query: str, values: Optional[Mapping] = None, column: Any = 0) -> Any:
+        return await self._run("fetchval", query, values, column=column)
+    
+    async def execute(self, query: str, values: Optional[Mapping] = None) -> Any:
+        return await self.fetch_val(query, values)
+    
+    def transaction(self) -> "AsyncpgTransaction":
+        return AsyncpgTransaction(self)
+
+
+class AsyncpgTransaction:
+    """
+    Committed when the `async with` block exits, rolled back if it raises. Nested transactions are savepoints.
+    """
+    
+    def __init__(self, connection: AsyncpgConnection) -> None:
+        self._connection = connection
+        self._transaction: Optional[asyncpg.transaction.Transaction] = None
+    
+    async def __aenter__(self) -> "AsyncpgTransaction":
+        await self._connection.__aenter__()
+        try:
+            async with self._connection._query_lock:
+                self._transaction = self._connection.raw_connection.transaction()
+                await self._transaction.start()
+        except BaseException:
+            await self._connection.__aexit__()
+            raise
+        return self
+    
+    async def __aexit__(self, exc_type: Any, *args: Any) -> None:
+        try:
+            async with self._connection._query_lock:
+                if exc_type is None:
+                    await self._transaction.commit()
+                else:
+                    await self._transaction.rollback()
+        finally:
+            await self._connection.__aexit__()
+
+
+class AsyncpgDatabase:
+    """
+    Stands in for `databases.Database` with an asyncpg pool of its own. Registered queries run as the server-side
+    prepared statements every connection makes as it opens, and rows come back as asyncpg Records - decoded from
+    the binary protocol, with nothing wrapping them.
+    """
+    
+    def __init__(self, url: str, *, registry: QueryRegistry = queries, **options: Any) -> None:
+        self.url = DatabaseURL(url)
+        self.registry = registry
+        self.options = options
+        self.pool: Optional[asyncpg.Pool] = None
+        self._connection_context: contextvars.ContextVar = contextvars.ContextVar("asyncpg_connection")
+    
+    @property
+    def is_connected(self) -> bool:
+        return self.pool is not None
+    
+    async def connect(self) -> None:
+        assert self.pool is None, "Already connected"
+        self.pool = await asyncpg.create_pool(
+            str(self.url),
+            init=lambda connection: prepare_statements(connection, self.registry),
+            # room for every registered query, with as much again for partial updates
+            statement_cache_size=max(STATEMENT_CACHE_SIZE, 2 * len(self.registry)),
+            **self.options,
+        )
+    
+    async def disconnect(self) -> None:
+        assert self.pool is not None, "Not connected"
+        pool, self.pool = self.pool, None
+        await pool.close()
+    
+    def connection(self) -> AsyncpgConnection:
+        try:
+            return self._connection_context.get()
+        except LookupError:
+            connection = AsyncpgConnection(self)
+            self._connection_context.set(connection)
+            return connection
+    
+    def transaction(self) -> AsyncpgTransaction:
+        return self.connection().transaction()
+    
+    async def fetch_all(self, query: str, values: Optional[Mapping] = None) -> List[asyncpg.Record]:
+        async with self.connection() as connection:
+            return await connection.fetch_all(query, values)
+    
+    async def fetch_one(self, query: str, values: Optional[Mapping] = None) -> Optional[asyncpg.Record]:
+        async with self.connection() as connection:
+            return await connection.fetch_one(query, values)
+    
+    async def fetch_val(self, query: str, values: Optional[Mapping] = None, column: Any = 0) -> Any:
+        async with self.connection() as connection:
+            return await connection.fetch_val(query, values, column=column)
+    
+    async def execute(self, query: str, values: Optional[Mapping] = None) -> Any:
+        async with self.connection() as connection:
+            return await connection.execute(query, values)
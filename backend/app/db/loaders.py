@@ -0,0 +1,104 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from databases import Database
+
+from app.db.replicas import DatabaseRouter
+from app.db.repositories.users import UsersRepository
+from app.db.repositories.profiles import ProfilesRepository
+
+from app.models.user import UserInDB
+from app.models.profile import ProfileInDB
+
+BatchLoadFn = Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+
+
+class DataLoader:
+    """
+    Collects every `load` made during the same event-loop tick and resolves them
+    with a single call to `batch_load_fn`. Results are memoized for the lifetime
+    of the loader, so a loader should never outlive the request that created it.
+    """
+    
+    def __init__(self, batch_load_fn: BatchLoadFn) -> None:
+        self.batch_load_fn = batch_load_fn
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+        self._dispatches: Set[asyncio.Task] = set()
+    
+    def load(self, key: Hashable) -> Awaitable[Optional[Any]]:
+        if key in self._futures:
+            return self._futures[key]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[key] = future
+        self._queue.append(key)
+        if len(self._queue) == 1:
+            # dispatch once everything already scheduled in this tick has had the chance to queue its keys
+            loop.call_soon(self._schedule_dispatch)
+        return future
+    
+    async def load_many(self, keys: List[Hashable]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+    
+    def prime(self, key: Hashable, value: Any) -> None:
+        """
+        Store a value fetched some other way, replacing whatever was memoized for that key
+        """
+        future = self._futures.get(key)
+        if future is None or future.done():
+            future = asyncio.get_running_loop().create_future()
+            self._futures[key] = future
+        future.set_result(value)
+    
+    def clear(self, key: Hashable) -> None:
+        future = self._futures.get(key)
+        if future is not None and future.done():
+            del self._futures[key]
+    
+    def _schedule_dispatch(self) -> None:
+        # hold on to the task so it isn't garbage collected while the batch is in flight
+        task = asyncio.get_running_loop().create_task(self._dispatch())
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+    
+    async def _dispatch(self) -> None:
+        keys, self._queue = self._queue, []
+        try:
+            results = await self.batch_load_fn(keys)
+        except Exception as e:
+            for key in keys:
+                future = self._futures.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key in keys:
+            future = self._futures[key]
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+class Loaders:
+    """
+    Request-scoped loaders for the resources that are looked up one at a time
+    from many places (populating offers, cleanings and users, authenticating, ...)
+    """
+    
+    def __init__(self, db: Database, router: Optional[DatabaseRouter] = None) -> None:
+        # loaders batch through repositories that don't use loaders themselves
+        self.users_repo = UsersRepository(db, router=router)
+        self.profiles_repo = ProfilesRepository(db, router=router)
+        self.users = DataLoader(self.batch_load_users)
+        self.profiles = DataLoader(self.batch_load_profiles)
+    
+    async def batch_load_users(self, user_ids: List[int]) -> Dict[int, UserInDB]:
+        users = {}
+        for user, profile in await self.users_repo.get_users_and_profiles_by_ids(user_ids=user_ids):
+            users[user.id] = user
+            # profiles come along with the users, so there's no need to load them separately
+            self.profiles.prime(user.id, profile)
+        return users
+    
+    async def batch_load_profiles(self, user_ids: List[int]) -> Dict[int, ProfileInDB]:
+        profiles = await self.profiles_repo.list_profiles_by_user_ids(user_ids=user_ids)
+        return {profile.user_id: profile for profile in profiles}
@@ -0,0 +1,41 @@
+"""add_cleanings_search
+Revision ID: 0b755e216898
+Revises: fc1ad41118ba
+Create Date: 2026-10-18 15:31:44.170352
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic
+revision = "0b755e216898"
+down_revision = "fc1ad41118ba"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # names weigh more than descriptions when ranking matches
+    op.execute(
+        """
+        ALTER TABLE cleanings
+        ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED;
+        """
+    )
+    op.create_index("ix_cleanings_search_vector", "cleanings", ["search_vector"], postgresql_using="gin")
+    # fuzzy matching of names needs pg_trgm, which ships with the contrib modules of most postgres builds
+    has_pg_trgm = op.get_bind().execute(
+        sa.text("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+    ).scalar()
+    if has_pg_trgm:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_cleanings_name_trgm ON cleanings USING gin (name gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_cleanings_name_trgm")
+    op.drop_index("ix_cleanings_search_vector", table_name="cleanings")
+    op.drop_column("cleanings", "search_vector")
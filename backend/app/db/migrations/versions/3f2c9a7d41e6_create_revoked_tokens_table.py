@@ -0,0 +1,31 @@
+"""create_revoked_tokens_table
+Revision ID: 3f2c9a7d41e6
+Revises: 0b755e216898
+Create Date: 2026-10-18 15:12:40.518204
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic
+revision = "3f2c9a7d41e6"
+down_revision = "0b755e216898"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """
+    Ids of the refresh tokens that have been used, shared by every app process so that each token is only used once.
+    Rows are only needed until the token would have expired anyway.
+    """
+    op.create_table(
+        "revoked_tokens",
+        sa.Column("jti", sa.Text, primary_key=True),
+        sa.Column("expires_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_index("ix_revoked_tokens_expires_at", "revoked_tokens", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_revoked_tokens_expires_at", table_name="revoked_tokens")
+    op.drop_table("revoked_tokens")
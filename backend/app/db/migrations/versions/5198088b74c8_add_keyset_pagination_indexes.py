@@ -0,0 +1,33 @@
+"""add_keyset_pagination_indexes
+Revision ID: 5198088b74c8
+Revises: fed7acad32fc
+Create Date: 2026-10-18 13:12:37.504821
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = "5198088b74c8"
+down_revision = "fed7acad32fc"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # each list is filtered by its parent and paginated newest first on (created_at, <tiebreaker>)
+    op.create_index("ix_cleanings_owner_created_at_id", "cleanings", ["owner", "created_at", "id"])
+    op.create_index(
+        "ix_offers_cleaning_id_created_at_user_id",
+        "user_offers_for_cleanings",
+        ["cleaning_id", "created_at", "user_id"],
+    )
+    op.create_index(
+        "ix_evaluations_cleaner_id_created_at_cleaning_id",
+        "cleaning_to_cleaner_evaluations",
+        ["cleaner_id", "created_at", "cleaning_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_evaluations_cleaner_id_created_at_cleaning_id", table_name="cleaning_to_cleaner_evaluations")
+    op.drop_index("ix_offers_cleaning_id_created_at_user_id", table_name="user_offers_for_cleanings")
+    op.drop_index("ix_cleanings_owner_created_at_id", table_name="cleanings")
@@ -0,0 +1,108 @@
+"""create_cleaner_rating_aggregates_table
+Revision ID: a9f1aac0fb94
+Revises: 5198088b74c8
+Create Date: 2026-10-18 14:02:19.845310
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic
+revision = "a9f1aac0fb94"
+down_revision = "5198088b74c8"
+branch_labels = None
+depends_on = None
+
+
+def counter(name: str) -> sa.Column:
+    return sa.Column(name, sa.Integer, nullable=False, server_default="0")
+
+
+def upgrade() -> None:
+    """
+    Running totals of every evaluation a cleaner has received, kept up to date as evaluations are created,
+    so that a cleaner's stats don't have to be aggregated from their whole history.
+    Averages are stored as sums and counts, since professionalism, completeness and efficiency are optional.
+    """
+    op.create_table(
+        "cleaner_rating_aggregates",
+        sa.Column(
+            "cleaner_id",
+            sa.Integer,
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        counter("total_evaluations"),
+        counter("total_no_show"),
+        counter("sum_professionalism"),
+        counter("count_professionalism"),
+        counter("sum_completeness"),
+        counter("count_completeness"),
+        counter("sum_efficiency"),
+        counter("count_efficiency"),
+        counter("sum_overall_rating"),
+        sa.Column("min_overall_rating", sa.Integer, nullable=True),
+        sa.Column("max_overall_rating", sa.Integer, nullable=True),
+        counter("one_stars"),
+        counter("two_stars"),
+        counter("three_stars"),
+        counter("four_stars"),
+        counter("five_stars"),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.execute(
+        """
+        CREATE TRIGGER update_cleaner_rating_aggregates_modtime
+            BEFORE UPDATE
+            ON cleaner_rating_aggregates
+            FOR EACH ROW
+        EXECUTE PROCEDURE update_updated_at_column();
+        """
+    )
+    # backfill from the evaluations made so far
+    op.execute(
+        """
+        INSERT INTO cleaner_rating_aggregates (
+            cleaner_id,
+            total_evaluations,
+            total_no_show,
+            sum_professionalism,
+            count_professionalism,
+            sum_completeness,
+            count_completeness,
+            sum_efficiency,
+            count_efficiency,
+            sum_overall_rating,
+            min_overall_rating,
+            max_overall_rating,
+            one_stars,
+            two_stars,
+            three_stars,
+            four_stars,
+            five_stars
+        )
+        SELECT cleaner_id,
+               COUNT(*),
+               COUNT(*) FILTER(WHERE no_show),
+               COALESCE(SUM(professionalism), 0),
+               COUNT(professionalism),
+               COALESCE(SUM(completeness), 0),
+               COUNT(completeness),
+               COALESCE(SUM(efficiency), 0),
+               COUNT(efficiency),
+               SUM(overall_rating),
+               MIN(overall_rating),
+               MAX(overall_rating),
+               COUNT(*) FILTER(WHERE overall_rating = 1),
+               COUNT(*) FILTER(WHERE overall_rating = 2),
+               COUNT(*) FILTER(WHERE overall_rating = 3),
+               COUNT(*) FILTER(WHERE overall_rating = 4),
+               COUNT(*) FILTER(WHERE overall_rating = 5)
+        FROM cleaning_to_cleaner_evaluations
+        GROUP BY cleaner_id;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("cleaner_rating_aggregates")
@@ -0,0 +1,56 @@
+"""create_cleaner_leaderboard_view
+Revision ID: fc1ad41118ba
+Revises: a9f1aac0fb94
+Create Date: 2026-10-18 14:47:05.262918
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic
+revision = "fc1ad41118ba"
+down_revision = "a9f1aac0fb94"
+branch_labels = None
+depends_on = None
+
+# cleaners are ranked as if they had this many extra evaluations at the mean rating of every cleaner,
+# so that a couple of five star evaluations don't outrank a long history of good ones
+PRIOR_EVALUATIONS = 10
+
+
+def upgrade() -> None:
+    """
+    Cleaners ranked by their smoothed overall rating. The view is refreshed periodically by the app,
+    and `rank` is unique so that the leaderboard can be paginated on it.
+    """
+    op.execute(
+        f"""
+        CREATE MATERIALIZED VIEW cleaner_leaderboard AS
+        WITH prior AS (
+            SELECT SUM(sum_overall_rating)::numeric / NULLIF(SUM(total_evaluations), 0) AS mean_overall_rating
+            FROM cleaner_rating_aggregates
+        ), scored AS (
+            SELECT a.cleaner_id,
+                   a.total_evaluations,
+                   a.total_no_show::numeric / a.total_evaluations AS no_show_rate,
+                   a.sum_overall_rating::numeric / a.total_evaluations AS avg_overall_rating,
+                   ({PRIOR_EVALUATIONS} * prior.mean_overall_rating + a.sum_overall_rating)
+                       / ({PRIOR_EVALUATIONS} + a.total_evaluations) AS score
+            FROM cleaner_rating_aggregates a
+                CROSS JOIN prior
+            WHERE a.total_evaluations > 0
+        )
+        SELECT ROW_NUMBER() OVER (ORDER BY score DESC, total_evaluations DESC, cleaner_id) AS rank,
+               cleaner_id,
+               score,
+               avg_overall_rating,
+               total_evaluations,
+               no_show_rate
+        FROM scored;
+        """
+    )
+    # unique indexes are also what allows the view to be refreshed concurrently
+    op.create_index("ix_cleaner_leaderboard_rank", "cleaner_leaderboard", ["rank"], unique=True)
+    op.create_index("ix_cleaner_leaderboard_cleaner_id", "cleaner_leaderboard", ["cleaner_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW cleaner_leaderboard")
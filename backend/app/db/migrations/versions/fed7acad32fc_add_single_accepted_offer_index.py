@@ -0,0 +1,28 @@
+"""add_single_accepted_offer_index
+Revision ID: fed7acad32fc
+Revises: 895636233437
+Create Date: 2026-10-18 12:04:51.093217
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic
+revision = "fed7acad32fc"
+down_revision = "895636233437"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # a cleaning job can only ever have one accepted offer, however many requests try to accept one at once
+    op.create_index(
+        "ix_user_offers_for_cleanings_single_accepted",
+        "user_offers_for_cleanings",
+        ["cleaning_id"],
+        unique=True,
+        postgresql_where=sa.text("status = 'accepted'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_offers_for_cleanings_single_accepted", table_name="user_offers_for_cleanings")
@@ -0,0 +1,150 @@
+import asyncio
+import bisect
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import asyncpg
+from databases import Database
+
+from app.db.database import AsyncpgDatabase
+
+logger = logging.getLogger(__name__)
+
+ACQUIRE_LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """
+    Counts of observed latencies per bucket, where each bucket holds the latencies up to its bound
+    """
+    
+    def __init__(self, buckets_ms: Sequence[float] = ACQUIRE_LATENCY_BUCKETS_MS) -> None:
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        # the last count is for latencies above every bucket
+        self.counts: List[int] = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+    
+    def observe(self, latency_ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets_ms, latency_ms)] += 1
+        self.count += 1
+        self.sum_ms += latency_ms
+    
+    def as_dict(self) -> Dict[str, Any]:
+        bounds = [str(bound) for bound in self.buckets_ms] + ["+Inf"]
+        return {"buckets": dict(zip(bounds, self.counts)), "count": self.count, "sum_ms": self.sum_ms}
+
+
+class PoolAcquireTimeout(Exception):
+    """
+    Raised when every connection of the pool stayed busy for longer than its acquire timeout.
+    """
+    pass
+
+
+class InstrumentedPool:
+    """
+    Stands in for the asyncpg pool behind a `databases.Database`, so that every connection the app uses
+    is acquired with a timeout and counted. Connections are recycled every `max_lifetime` seconds:
+    each one is closed as it's released, and reopened the next time it's needed.
+    """
+    
+    def __init__(
+            self,
+            pool: asyncpg.Pool,
+            *,
+            min_size: int,
+            max_size: int,
+            acquire_timeout: Optional[float] = None,
+            max_lifetime: Optional[float] = None,
+    ) -> None:
+        self.pool = pool
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout or None
+        self.max_lifetime = max_lifetime or None
+        self.waiters = 0
+        self.acquire_timeouts = 0
+        self.acquire_latency = LatencyHistogram()
+        self._recycling: Optional[asyncio.Task] = None
+        if self.max_lifetime:
+            self._recycling = asyncio.get_running_loop().create_task(self._recycle_connections())
+    
+    async def acquire(self) -> asyncpg.connection.Connection:
+        self.waiters += 1
+        started = time.perf_counter()
+        try:
+            connection = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError as e:
+            self.acquire_timeouts += 1
+            raise PoolAcquireTimeout(f"No connection was free within {self.acquire_timeout}s") from e
+        finally:
+            self.waiters -= 1
+        self.acquire_latency.observe((time.perf_counter() - started) * 1000)
+        return connection
+    
+    async def release(self, connection: asyncpg.connection.Connection) -> None:
+        await self.pool.release(connection)
+    
+    async def close(self) -> None:
+        if self._recycling is not None:
+            self._recycling.cancel()
+        await self.pool.close()
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.pool, name)
+    
+    async def _recycle_connections(self) -> None:
+        while True:
+            await asyncio.sleep(self.max_lifetime)
+            await self.pool.expire_connections()
+    
+    def stats(self) -> Dict[str, Any]:
+        size, idle = self.pool.get_size(), self.pool.get_idle_size()
+        return {
+            "size": size,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiters": self.waiters,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_latency": self.acquire_latency.as_dict(),
+        }
+
+
+def get_pool(database: Union[Database, AsyncpgDatabase]) -> Union[asyncpg.Pool, InstrumentedPool]:
+    """
+    The pool a connected database acquires its connections from, whichever backend it is
+    """
+    if isinstance(database, AsyncpgDatabase):
+        return database.pool
+    return database._backend._pool
+
+
+def instrument_pool(
+        database: Union[Database, AsyncpgDatabase],
+        *,
+        acquire_timeout: Optional[float] = None,
+        max_lifetime: Optional[float] = None,
+) -> InstrumentedPool:
+    """
+    Wrap the pool of a connected database. Both backends only acquire and release connections through it.
+    """
+    if isinstance(database, AsyncpgDatabase):
+        options = database.options
+    else:
+        options = database._backend._get_connection_kwargs()
+    pool = InstrumentedPool(
+        get_pool(database),
+        min_size=options.get("min_size", 10),
+        max_size=options.get("max_size", 10),
+        acquire_timeout=acquire_timeout,
+        max_lifetime=max_lifetime,
+    )
+    if isinstance(database, AsyncpgDatabase):
+        database.pool = pool
+    else:
+        database._backend._pool = pool
+    return pool
@@ -0,0 +1,69 @@
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import pypostgresql
+
+# the dialect `databases` compiles every query with
+DIALECT = pypostgresql.dialect(paramstyle="pyformat")
+
+
+class QueryParameterError(ValueError):
+    pass
+
+
+class CompiledQuery:
+    """
+    A `:name` style query compiled to asyncpg's `$n` placeholders, along with the order its values are passed in
+    """
+    
+    __slots__ = ("name", "sql", "parameters", "_parameter_set")
+    
+    def __init__(self, name: str, query: str) -> None:
+        compiled = text(query).compile(dialect=DIALECT)
+        self.name = name
+        self.parameters: Tuple[str, ...] = tuple(sorted(compiled.params))
+        self._parameter_set = frozenset(self.parameters)
+        placeholders = {parameter: f"${i}" for i, parameter in enumerate(self.parameters, start=1)}
+        self.sql = compiled.string % placeholders
+    
+    def arguments(self, values: Optional[Mapping[str, Any]] = None) -> List[Any]:
+        values = values or {}
+        if values.keys() != self._parameter_set:
+            missing = sorted(self._parameter_set - values.keys())
+            unexpected = sorted(values.keys() - self._parameter_set)
+            raise QueryParameterError(f"{self.name} is missing values for {missing}, and doesn't take {unexpected}")
+        return [values[parameter] for parameter in self.parameters]
+
+
+class QueryRegistry:
+    """
+    Compiled form of every query a repository runs, looked up by the query's text
+    """
+    
+    def __init__(self) -> None:
+        self._queries: Dict[str, CompiledQuery] = {}
+    
+    def __len__(self) -> int:
+        return len(self._queries)
+    
+    def __iter__(self):
+        return iter(self._queries.values())
+    
+    def register(self, name: str, query: str) -> CompiledQuery:
+        if query not in self._queries:
+            self._queries[query] = CompiledQuery(name, query)
+        return self._queries[query]
+    
+    def register_module(self, namespace: Mapping[str, Any]) -> None:
+        """
+        Register the module-level `*_QUERY` constants of a repository module, called with its `globals()`
+        """
+        for name, value in list(namespace.items()):
+            if "QUERY" in name and name.isupper() and isinstance(value, str):
+                self.register(name, value)
+    
+    def get(self, query: Any) -> Optional[CompiledQuery]:
+        return self._queries.get(query) if isinstance(query, str) else None
+
+
+queries = QueryRegistry()
@@ -0,0 +1,124 @@
+import asyncio
+import itertools
+import logging
+from typing import List, Optional
+
+from databases import Database
+
+from app.db.pool import InstrumentedPool, instrument_pool
+from app.db.queries import queries
+
+logger = logging.getLogger(__name__)
+
+# a replica that has replayed everything it received is caught up, however long ago the primary last wrote
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+               WHEN NOT pg_is_in_recovery() THEN 0
+               WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+               ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END AS lag_seconds;
+"""
+
+queries.register_module(globals())
+
+
+class Replica:
+    def __init__(
+            self,
+            database: Database,
+            *,
+            acquire_timeout: Optional[float] = None,
+            max_lifetime: Optional[float] = None,
+    ) -> None:
+        self.database = database
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.pool: Optional[InstrumentedPool] = None
+        # replicas only take reads once they've passed a health check
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+    
+    @property
+    def in_use(self) -> int:
+        return self.pool.stats()["in_use"] if self.pool is not None else 0
+    
+    async def connect(self) -> None:
+        await self.database.connect()
+        self.pool = instrument_pool(
+            self.database, acquire_timeout=self.acquire_timeout, max_lifetime=self.max_lifetime,
+        )
+
+
+class ReplicaSet:
+    """
+    Read replicas of the primary database. Reads go to the healthy replica with the fewest
+    connections in use. A replica is unhealthy while it can't be queried, or lags more than `max_lag` seconds behind.
+    """
+    
+    def __init__(self, replicas: List[Replica], *, max_lag: float, check_timeout: float = 5) -> None:
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_timeout = check_timeout
+        self._turns = itertools.count()
+    
+    def choose(self) -> Optional[Database]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        # replicas that are equally busy take turns
+        start = next(self._turns) % len(healthy)
+        rotated = healthy[start:] + healthy[:start]
+        return min(rotated, key=lambda replica: replica.in_use).database
+    
+    async def check_health(self) -> None:
+        await asyncio.gather(*[self.check_replica(replica) for replica in self.replicas])
+    
+    async def check_replica(self, replica: Replica) -> None:
+        try:
+            # replicas that couldn't be reached when the app started are connected once they're back
+            if not replica.database.is_connected:
+                await asyncio.wait_for(replica.connect(), timeout=self.check_timeout)
+            lag_seconds = await asyncio.wait_for(
+                replica.database.fetch_val(query=REPLICA_LAG_QUERY), timeout=self.check_timeout,
+            )
+        except Exception as e:
+            if replica.healthy:
+                logger.warning(f"Replica {replica.database.url.obscure_password} is unavailable: {e}")
+            replica.healthy, replica.lag_seconds = False, None
+            return
+        replica.lag_seconds = float(lag_seconds)
+        healthy = replica.lag_seconds <= self.max_lag
+        if replica.healthy and not healthy:
+            logger.warning(f"Replica {replica.database.url.obscure_password} lags {replica.lag_seconds:.1f}s behind")
+        replica.healthy = healthy
+    
+    async def disconnect(self) -> None:
+        await asyncio.gather(
+            *[replica.database.disconnect() for replica in self.replicas if replica.database.is_connected]
+        )
+
+
+class DatabaseRouter:
+    """
+    Request-scoped choice between the primary and a replica. Reads go to one replica for the whole request,
+    until the request uses the primary - it may have written, so every later read has to see that write.
+    """
+    
+    def __init__(self, primary: Database, replicas: Optional[ReplicaSet] = None, *, pinned: bool = False) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.pinned = pinned
+        self._replica: Optional[Database] = None
+    
+    def pin_to_primary(self) -> None:
+        self.pinned = True
+    
+    @property
+    def reader(self) -> Database:
+        if self.pinned or self.replicas is None:
+            return self.primary
+        if self._replica is None:
+            self._replica = self.replicas.choose()
+            if self._replica is None:
+                return self.primary
+        return self._replica
@@ -0,0 +1,39 @@
+from typing import Optional
+
+from app.db.queries import queries
+from app.db.repositories.base import BaseRepository
+from app.models.offer import OfferAuthorization
+
+# the cleaning is always returned, while the user and their offer are null when they don't exist
+GET_OFFER_AUTHORIZATION_QUERY = """
+    SELECT c.owner AS cleaning_owner,
+           u.id AS user_id,
+           o.status AS offer_status,
+           EXISTS (
+               SELECT 1
+               FROM user_offers_for_cleanings
+               WHERE cleaning_id = c.id AND status = 'accepted'
+           ) AS has_accepted_offer
+    FROM cleanings c
+        LEFT JOIN users u
+        ON u.username = :username
+        LEFT JOIN user_offers_for_cleanings o
+        ON o.cleaning_id = c.id AND o.user_id = u.id
+    WHERE c.id = :cleaning_id;
+"""
+
+
+queries.register_module(globals())
+
+
+class AuthorizationRepository(BaseRepository):
+    """
+    Answers permission checks with constant-cost queries, instead of loading and populating the resources involved
+    """
+    
+    async def get_offer_authorization(self, *, cleaning_id: int, username: str) -> Optional[OfferAuthorization]:
+        record = await self.read_db.fetch_one(
+            query=GET_OFFER_AUTHORIZATION_QUERY, values={"cleaning_id": cleaning_id, "username": username},
+        )
+        if record:
+            return OfferAuthorization(**record)
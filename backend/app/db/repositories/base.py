@@ -1,6 +1,88 @@
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Mapping, Optional, Tuple
+
 from databases import Database
 
+from app.db.queries import queries
+from app.db.replicas import DatabaseRouter
+
+if TYPE_CHECKING:
+    from app.db.loaders import Loaders
+
+IDENTIFIER_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+@lru_cache(maxsize=256)
+def build_partial_update_query(*, table: str, columns: Tuple[str, ...], where: Tuple[str, ...], returning: str) -> str:
+    """
+    UPDATE statement that only sets the given columns and returns the updated row.
+    Columns are bound to `:set_<column>` and the `where` columns to `:where_<column>`, so the same
+    column can be both updated and filtered on. Without any columns, the row is only selected.
+    """
+    for identifier in (table, *columns, *where):
+        if not IDENTIFIER_PATTERN.match(identifier):
+            raise ValueError(f"Invalid identifier for a partial update: {identifier!r}")
+    conditions = " AND ".join(f"{column} = :where_{column}" for column in where)
+    if not columns:
+        query = f"SELECT {returning} FROM {table} WHERE {conditions};"
+    else:
+        assignments = ", ".join(f"{column} = :set_{column}" for column in columns)
+        query = f"UPDATE {table} SET {assignments} WHERE {conditions} RETURNING {returning};"
+    # each combination of columns is only ever built once, so it's compiled once too
+    queries.register(f"PARTIAL_UPDATE_{table.upper()}_QUERY", query)
+    return query
+
 
 class BaseRepository:
-    def __init__(self, db: Database) -> None:
-        self.db = db
+    def __init__(
+            self,
+            db: Database,
+            loaders: Optional["Loaders"] = None,
+            router: Optional[DatabaseRouter] = None,
+    ) -> None:
+        self._db = db
+        # request-scoped loaders and router, only available when the repository is created for a request
+        self.loaders = loaders
+        self.router = router
+    
+    @property
+    def db(self) -> Database:
+        """
+        The primary. Whatever runs on it may write, so the rest of the request reads from the primary too.
+        """
+        if self.router is not None:
+            self.router.pin_to_primary()
+        return self._db
+    
+    @property
+    def read_db(self) -> Database:
+        """
+        Where read-only queries go: a replica, unless this request has already used the primary
+        """
+        if self.router is None:
+            return self._db
+        return self.router.reader
+    
+    async def partial_update(
+            self,
+            *,
+            table: str,
+            values: Mapping[str, Any],
+            where: Mapping[str, Any],
+            returning: str,
+    ) -> Optional[Mapping]:
+        """
+        Write only the columns in `values` - usually a model's `.dict(exclude_unset=True)` -
+        without reading the row first
+        """
+        query = build_partial_update_query(
+            table=table, columns=tuple(values), where=tuple(where), returning=returning,
+        )
+        return await self.db.fetch_one(
+            query=query,
+            values={
+                **{f"set_{column}": value for column, value in values.items()},
+                **{f"where_{column}": value for column, value in where.items()},
+            },
+        )
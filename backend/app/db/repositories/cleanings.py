@@ -1,14 +1,38 @@
-from typing import List, Union
+import asyncio
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 
 from fastapi import HTTPException, status
 from databases import Database
 
+from app.db.replicas import DatabaseRouter
+from app.db.queries import queries
 from app.db.repositories.base import BaseRepository
 from app.db.repositories.users import UsersRepository
 from app.db.repositories.offers import OffersRepository
 
-from app.models.cleaning import CleaningCreate, CleaningUpdate, CleaningInDB, CleaningPublic
+from app.models.cleaning import (
+    CleaningCreate,
+    CleaningUpdate,
+    CleaningInDB,
+    CleaningPublic,
+    CleaningSearchResult,
+    CleaningType,
+    CleaningFacets,
+    PriceBucketCount,
+)
+from app.models.offer import OfferPublic
 from app.models.user import UserInDB
+from app.models.pagination import Pagination, SearchPagination
+from app.core.config import CLEANING_PRICE_BUCKETS
+from app.services import cleaning_facets_cache, cleaning_feed_cache
+
+if TYPE_CHECKING:
+    from app.db.loaders import Loaders
+
+# whether pg_trgm is installed, by database url - it only changes through migrations
+PG_TRGM_INSTALLED: Dict[str, bool] = {}
+
+CLEANING_COLUMNS = "id, name, description, price, cleaning_type, owner, created_at, updated_at"
 
 CREATE_CLEANING_QUERY = """
     INSERT INTO cleanings (name, description, price, cleaning_type, owner)
@@ -25,35 +49,128 @@ GET_CLEANING_BY_ID_QUERY = """
 LIST_ALL_USER_CLEANINGS_QUERY = """
     SELECT id, name, description, price, cleaning_type, owner, created_at, updated_at
     FROM cleanings
-    WHERE owner = :owner;
+    WHERE owner = :owner
+      AND (created_at, id) < (:after_created_at, :after_id)
+    ORDER BY created_at DESC, id DESC
+    LIMIT :limit;
 """
 
-UPDATE_CLEANING_BY_ID_QUERY = """
-    UPDATE cleanings
-    SET name         = :name,
-        description  = :description,
-        price        = :price,
-        cleaning_type = :cleaning_type
-    WHERE id = :id
-    RETURNING id, name, description, price, cleaning_type, owner, created_at, updated_at;
+CLEANING_TYPE_FILTER = "(CAST(:cleaning_type AS text) IS NULL OR cleaning_type = :cleaning_type)"
+PRICE_FILTER = """(
+    (CAST(:min_price AS numeric) IS NULL OR price >= :min_price)
+    AND (CAST(:max_price AS numeric) IS NULL OR price <= :max_price)
+)"""
+
+# Matches are found through the GIN index on `search_vector`, and only they are ranked.
+# Ranks are cast to float8 so that a rank sent back in a cursor compares equal to the one it came from.
+SEARCH_CLEANINGS_QUERY = f"""
+    WITH matches AS (
+        SELECT {CLEANING_COLUMNS},
+               ts_rank(search_vector, query)::float8 AS rank
+        FROM cleanings,
+             websearch_to_tsquery('english', :query) AS query
+        WHERE search_vector @@ query
+          AND {CLEANING_TYPE_FILTER}
+          AND {PRICE_FILTER}
+    )
+    SELECT {CLEANING_COLUMNS}, rank
+    FROM matches
+    WHERE (rank, id) < (:after_rank, :after_id)
+    ORDER BY rank DESC, id DESC
+    LIMIT :limit;
+"""
+
+# With pg_trgm, names that are similar to the query also match (through their own GIN index),
+# so that typos still find jobs. Similarity is added to the rank of the full-text match.
+FUZZY_SEARCH_CLEANINGS_QUERY = f"""
+    WITH matches AS (
+        SELECT {CLEANING_COLUMNS},
+               (ts_rank(search_vector, query) + similarity(name, :query))::float8 AS rank
+        FROM cleanings,
+             websearch_to_tsquery('english', :query) AS query
+        WHERE (search_vector @@ query OR name % :query)
+          AND {CLEANING_TYPE_FILTER}
+          AND {PRICE_FILTER}
+    )
+    SELECT {CLEANING_COLUMNS}, rank
+    FROM matches
+    WHERE (rank, id) < (:after_rank, :after_id)
+    ORDER BY rank DESC, id DESC
+    LIMIT :limit;
+"""
+
+# Both facets are counted in one pass over the matches, grouped by cleaning type and by price bucket.
+# Cleaning types are counted among the matches in the price range and price buckets among those of the type.
+CLEANING_FACETS_QUERY = f"""
+    WITH matches AS (
+        SELECT cleaning_type,
+               width_bucket(price, CAST(:price_buckets AS numeric[])) AS price_bucket,
+               {CLEANING_TYPE_FILTER} AS in_cleaning_type,
+               {PRICE_FILTER} AS in_price_range
+        FROM cleanings,
+             websearch_to_tsquery('english', :query) AS query
+        WHERE search_vector @@ query
+    )
+    SELECT cleaning_type,
+           price_bucket,
+           COUNT(*) FILTER(WHERE in_price_range)   AS cleaning_type_count,
+           COUNT(*) FILTER(WHERE in_cleaning_type) AS price_bucket_count
+    FROM matches
+    GROUP BY GROUPING SETS ((cleaning_type), (price_bucket));
+"""
+
+FUZZY_CLEANING_FACETS_QUERY = f"""
+    WITH matches AS (
+        SELECT cleaning_type,
+               width_bucket(price, CAST(:price_buckets AS numeric[])) AS price_bucket,
+               {CLEANING_TYPE_FILTER} AS in_cleaning_type,
+               {PRICE_FILTER} AS in_price_range
+        FROM cleanings,
+             websearch_to_tsquery('english', :query) AS query
+        WHERE (search_vector @@ query OR name % :query)
+    )
+    SELECT cleaning_type,
+           price_bucket,
+           COUNT(*) FILTER(WHERE in_price_range)   AS cleaning_type_count,
+           COUNT(*) FILTER(WHERE in_cleaning_type) AS price_bucket_count
+    FROM matches
+    GROUP BY GROUPING SETS ((cleaning_type), (price_bucket));
+"""
+
+HAS_PG_TRGM_QUERY = """
+    SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');
 """
 
-DELETE_CLEANING_BY_ID_QUERY = """
-    DELETE FROM cleanings
-    WHERE id = :id
-    RETURNING id;
+# The row deleted by the CTE is still visible to the rest of the statement,
+# so `cleaning_exists` tells a cleaning owned by someone else apart from a missing one.
+DELETE_OWNED_CLEANING_BY_ID_QUERY = """
+    WITH deleted AS (
+        DELETE FROM cleanings
+        WHERE id = :id AND owner = :owner
+        RETURNING id
+    )
+    SELECT (SELECT id FROM deleted) AS deleted_id,
+           EXISTS (SELECT 1 FROM cleanings WHERE id = :id) AS cleaning_exists;
 """
 
 
+queries.register_module(globals())
+
+
 class CleaningsRepository(BaseRepository):
     """"
     All database actions associated with the Cleaning resource
     """
     
-    def __init__(self, db: Database) -> None:
-        super().__init__(db)
-        self.users_repo = UsersRepository(db)
-        self.offers_repo = OffersRepository(db)
+    def __init__(
+            self,
+            db: Database,
+            loaders: Optional["Loaders"] = None,
+            router: Optional[DatabaseRouter] = None,
+    ) -> None:
+        super().__init__(db, loaders, router)
+        self.users_repo = UsersRepository(db, loaders, router)
+        self.offers_repo = OffersRepository(db, loaders, router)
     
     async def create_cleaning(
             self,
@@ -65,12 +182,14 @@ class CleaningsRepository(BaseRepository):
             query=CREATE_CLEANING_QUERY,
             values={**new_cleaning.dict(), "owner": requesting_user.id},
         )
+        # the cached first page of the feed no longer holds the newest cleaning
+        cleaning_feed_cache.clear()
         return CleaningPublic(**cleaning_record, total_offers=0)
     
     async def get_cleaning_by_id(
             self, *, id: int, requesting_user: UserInDB, populate: bool = True
     ) -> Union[CleaningInDB, CleaningPublic]:
-        cleaning_record = await self.db.fetch_one(query=GET_CLEANING_BY_ID_QUERY, values={"id": id})
+        cleaning_record = await self.read_db.fetch_one(query=GET_CLEANING_BY_ID_QUERY, values={"id": id})
         if cleaning_record:
             cleaning = CleaningInDB(**cleaning_record)
             if populate:
@@ -82,56 +201,141 @@ class CleaningsRepository(BaseRepository):
             *,
             requesting_user: UserInDB,
             populate: bool = True,
+            pagination: Pagination = Pagination(),
     ) -> List[Union[CleaningInDB, CleaningPublic]]:
-        cleaning_records = await self.db.fetch_all(
+        cleaning_records = await self.read_db.fetch_all(
             query=LIST_ALL_USER_CLEANINGS_QUERY,
-            values={"owner": requesting_user.id},
+            values={"owner": requesting_user.id, **pagination.keyset_values()},
         )
         cleanings = [CleaningInDB(**l) for l in cleaning_records]
         if populate:
-            return [
-                await self.populate_cleaning(
-                    cleaning=cleaning,
-                    requesting_user=requesting_user,
-                    populate_offers=True,
-                )
-                for cleaning in cleanings
-            ]
+            return await self.populate_cleanings(
+                cleanings=cleanings,
+                requesting_user=requesting_user,
+                populate_offers=True,
+            )
         return cleanings
     
+    async def search_cleanings(
+            self,
+            *,
+            query: str,
+            requesting_user: UserInDB,
+            cleaning_type: Optional[CleaningType] = None,
+            min_price: Optional[float] = None,
+            max_price: Optional[float] = None,
+            pagination: SearchPagination = SearchPagination(),
+    ) -> List[CleaningSearchResult]:
+        """
+        Cleanings matching `query` (in web search syntax), most relevant first.
+        Names are matched fuzzily as well when pg_trgm is installed.
+        """
+        search_query = FUZZY_SEARCH_CLEANINGS_QUERY if await self.has_pg_trgm() else SEARCH_CLEANINGS_QUERY
+        records = await self.read_db.fetch_all(
+            query=search_query,
+            values={
+                "query": query,
+                "cleaning_type": cleaning_type,
+                "min_price": min_price,
+                "max_price": max_price,
+                **pagination.keyset_values(),
+            },
+        )
+        cleanings = await self.populate_cleanings(
+            cleanings=[CleaningInDB(**r) for r in records], requesting_user=requesting_user,
+        )
+        return [
+            CleaningSearchResult(**cleaning.dict(), rank=r["rank"]) for cleaning, r in zip(cleanings, records)
+        ]
+    
+    async def count_cleaning_facets(
+            self,
+            *,
+            query: str,
+            cleaning_type: Optional[CleaningType] = None,
+            min_price: Optional[float] = None,
+            max_price: Optional[float] = None,
+    ) -> CleaningFacets:
+        """
+        Facet counts for the matches of `search_cleanings`, cached for a few seconds per query and filters
+        """
+        cache_key = (query, cleaning_type, min_price, max_price)
+        facets = cleaning_facets_cache.get(cache_key)
+        if facets is not None:
+            return facets
+        facets_query = FUZZY_CLEANING_FACETS_QUERY if await self.has_pg_trgm() else CLEANING_FACETS_QUERY
+        records = await self.read_db.fetch_all(
+            query=facets_query,
+            values={
+                "query": query,
+                "cleaning_type": cleaning_type,
+                "min_price": min_price,
+                "max_price": max_price,
+                "price_buckets": CLEANING_PRICE_BUCKETS,
+            },
+        )
+        cleaning_type_counts = {t: 0 for t in CleaningType}
+        price_bucket_counts = [0] * (len(CLEANING_PRICE_BUCKETS) + 1)
+        for record in records:
+            if record["cleaning_type"] is not None:
+                cleaning_type_counts[CleaningType(record["cleaning_type"])] = record["cleaning_type_count"]
+            else:
+                price_bucket_counts[record["price_bucket"]] = record["price_bucket_count"]
+        # bucket i holds the prices from boundary i - 1 up to boundary i
+        boundaries = [None, *CLEANING_PRICE_BUCKETS, None]
+        facets = CleaningFacets(
+            cleaning_type=cleaning_type_counts,
+            price=[
+                PriceBucketCount(min_price=boundaries[i], max_price=boundaries[i + 1], count=count)
+                for i, count in enumerate(price_bucket_counts)
+            ],
+        )
+        cleaning_facets_cache.set(cache_key, facets)
+        return facets
+    
+    async def has_pg_trgm(self) -> bool:
+        url = str(self.read_db.url)
+        if url not in PG_TRGM_INSTALLED:
+            PG_TRGM_INSTALLED[url] = await self.read_db.fetch_val(query=HAS_PG_TRGM_QUERY)
+        return PG_TRGM_INSTALLED[url]
+    
     async def update_cleaning(
             self,
             *,
             cleaning: CleaningInDB,
             cleaning_update: CleaningUpdate,
     ) -> CleaningInDB:
-        cleaning_update_params = cleaning.copy(
-            update=cleaning_update.dict(exclude_unset=True),
-        )
-        if cleaning_update_params.cleaning_type is None:
+        update_values = cleaning_update.dict(exclude_unset=True)
+        if "cleaning_type" in update_values and update_values["cleaning_type"] is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid cleaning type. Cannot be None.",
             )
-        updated_cleaning = await self.db.fetch_one(
-            query=UPDATE_CLEANING_BY_ID_QUERY,
-            values=cleaning_update_params.dict(
-                exclude={
-                    "owner",
-                    "offers",
-                    "total_offers",
-                    "created_at",
-                    "updated_at",
-                },
-            ),
+        updated_cleaning = await self.partial_update(
+            table="cleanings", values=update_values, where={"id": cleaning.id}, returning=CLEANING_COLUMNS,
         )
+        if not updated_cleaning:
+            # deleted since it was looked up
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cleaning found with that id.")
+        cleaning_feed_cache.clear()
         return await self.populate_cleaning(
             cleaning=CleaningInDB(**updated_cleaning),
             populate_offers=True,
         )
     
-    async def delete_cleaning_by_id(self, *, cleaning: CleaningInDB) -> int:
-        return await self.db.execute(query=DELETE_CLEANING_BY_ID_QUERY, values={"id": cleaning.id})
+    async def delete_cleaning_by_id(self, *, id: int, requesting_user: UserInDB) -> int:
+        record = await self.db.fetch_one(
+            query=DELETE_OWNED_CLEANING_BY_ID_QUERY, values={"id": id, "owner": requesting_user.id},
+        )
+        if record["deleted_id"] is not None:
+            cleaning_feed_cache.clear()
+            return record["deleted_id"]
+        if not record["cleaning_exists"]:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cleaning found with that id.")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Action forbidden. Users are only able to modify cleanings they own.",
+        )
     
     async def populate_cleaning(
             self,
@@ -146,14 +350,18 @@ class CleaningsRepository(BaseRepository):
         If the user is the owner of the cleaning, offers are included by default.
         Otherwise, only include an offer made by the requesting user - if it exists
         """
-        offers = await self.offers_repo.list_offers_for_cleaning(
-            cleaning=cleaning,
-            populate=populate_offers,
-            requesting_user=requesting_user,
+        # fetched together so that request-scoped loaders can batch the owner with the offering users
+        owner, offers = await asyncio.gather(
+            self.users_repo.get_user_by_id(user_id=cleaning.owner),
+            self.offers_repo.list_offers_for_cleaning(
+                cleaning=cleaning,
+                populate=populate_offers,
+                requesting_user=requesting_user,
+            ),
         )
         return CleaningPublic(
             **cleaning.dict(exclude={"owner"}),
-            owner=await self.users_repo.get_user_by_id(user_id=cleaning.owner),
+            owner=owner,
             total_offers=len(offers),
             # full offers if `populate_offers` is specified,
             # otherwise only the offer from the authed user
@@ -167,3 +375,44 @@ class CleaningsRepository(BaseRepository):
             ],
             # any other populated fields for cleaning public would be tacked on here
         )
+    
+    async def populate_cleanings(
+            self,
+            *,
+            cleanings: List[CleaningInDB],
+            requesting_user: UserInDB = None,
+            populate_offers: bool = False,
+    ) -> List[CleaningPublic]:
+        """
+        Batched version of `populate_cleaning`.
+        Offers for all cleanings are fetched in one query, and owners plus offering users
+        (along with their profiles) in another, no matter how many cleanings are passed in.
+        """
+        if not cleanings:
+            return []
+        offers_by_cleaning_id = await self.offers_repo.list_offers_for_cleanings(cleanings=cleanings, populate=False)
+        user_ids = {cleaning.owner for cleaning in cleanings}
+        if populate_offers:
+            user_ids.update(offer.user_id for offers in offers_by_cleaning_id.values() for offer in offers)
+        users = await self.users_repo.get_users_by_ids(user_ids=list(user_ids))
+        users_by_id = {user.id: user for user in users}
+        
+        populated_cleanings = []
+        for cleaning in cleanings:
+            offers = offers_by_cleaning_id[cleaning.id]
+            if populate_offers:
+                public_offers = [OfferPublic(**offer.dict(), user=users_by_id.get(offer.user_id)) for offer in offers]
+            else:
+                public_offers = [
+                    OfferPublic(**offer.dict(), user=requesting_user)
+                    for offer in offers if requesting_user and offer.user_id == requesting_user.id
+                ]
+            populated_cleanings.append(
+                CleaningPublic(
+                    **cleaning.dict(exclude={"owner"}),
+                    owner=users_by_id.get(cleaning.owner),
+                    total_offers=len(offers),
+                    offers=public_offers,
+                )
+            )
+        return populated_cleanings
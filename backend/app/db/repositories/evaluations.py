@@ -1,48 +1,151 @@
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
 
 from databases import Database
+from fastapi import HTTPException, status
 
+from app.db.replicas import DatabaseRouter
+from app.db.queries import queries
 from app.db.repositories.base import BaseRepository
 from app.db.repositories.offers import OffersRepository
+from app.db.repositories.users import UsersRepository
 
 from app.models.cleaning import CleaningInDB
 from app.models.user import UserInDB
-from app.models.evaluation import EvaluationCreate, EvaluationUpdate, EvaluationInDB, EvaluationAggregate
+from app.models.evaluation import (
+    EvaluationCreate,
+    EvaluationUpdate,
+    EvaluationInDB,
+    EvaluationAggregate,
+    CleanerAggregate,
+    LeaderboardEntry,
+)
+from app.models.pagination import Pagination
 
+if TYPE_CHECKING:
+    from app.db.loaders import Loaders
+
+# The probe always returns the cleaning when it exists, along with the cleaner named in the path and their offer,
+# so that a failed submission can be explained. The offer is only completed when the requesting user owns
+# the cleaning and the offer is still accepted, and the evaluation is only inserted for a completed offer.
+# The cleaner's rating aggregates are updated along with the evaluation, so stats never have to scan evaluations.
 CREATE_OWNER_EVALUATION_FOR_CLEANER_QUERY = """
-    INSERT INTO cleaning_to_cleaner_evaluations (
-        cleaning_id,
-        cleaner_id,
-        no_show,
-        headline,
-        comment,
-        professionalism,
-        completeness,
-        efficiency,
-        overall_rating
-    )
-    VALUES (
-        :cleaning_id,
-        :cleaner_id,
-        :no_show,
-        :headline,
-        :comment,
-        :professionalism,
-        :completeness,
-        :efficiency,
-        :overall_rating
+    WITH probe AS (
+        SELECT c.id     AS cleaning_id,
+               c.owner  AS cleaning_owner,
+               u.id     AS cleaner_id,
+               o.status AS offer_status
+        FROM cleanings c
+            LEFT JOIN users u
+            ON u.username = :cleaner_username
+            LEFT JOIN user_offers_for_cleanings o
+            ON o.cleaning_id = c.id AND o.user_id = u.id
+        WHERE c.id = :cleaning_id
+        FOR UPDATE OF c
+    ), completed AS (
+        UPDATE user_offers_for_cleanings o
+        SET status = 'completed'
+        FROM probe
+        WHERE o.cleaning_id = probe.cleaning_id
+          AND o.user_id = probe.cleaner_id
+          AND o.status = 'accepted'
+          AND probe.cleaning_owner = :owner_id
+        RETURNING o.cleaning_id, o.user_id
+    ), evaluation AS (
+        INSERT INTO cleaning_to_cleaner_evaluations (
+            cleaning_id,
+            cleaner_id,
+            no_show,
+            headline,
+            comment,
+            professionalism,
+            completeness,
+            efficiency,
+            overall_rating
+        )
+        SELECT cleaning_id,
+               user_id,
+               :no_show,
+               :headline,
+               :comment,
+               :professionalism,
+               :completeness,
+               :efficiency,
+               :overall_rating
+        FROM completed
+        RETURNING no_show,
+                  cleaning_id,
+                  cleaner_id,
+                  headline,
+                  comment,
+                  professionalism,
+                  completeness,
+                  efficiency,
+                  overall_rating,
+                  created_at,
+                  updated_at
+    ), aggregate AS (
+        INSERT INTO cleaner_rating_aggregates AS a (
+            cleaner_id,
+            total_evaluations,
+            total_no_show,
+            sum_professionalism,
+            count_professionalism,
+            sum_completeness,
+            count_completeness,
+            sum_efficiency,
+            count_efficiency,
+            sum_overall_rating,
+            min_overall_rating,
+            max_overall_rating,
+            one_stars,
+            two_stars,
+            three_stars,
+            four_stars,
+            five_stars
+        )
+        SELECT cleaner_id,
+               1,
+               no_show::int,
+               COALESCE(professionalism, 0),
+               (professionalism IS NOT NULL)::int,
+               COALESCE(completeness, 0),
+               (completeness IS NOT NULL)::int,
+               COALESCE(efficiency, 0),
+               (efficiency IS NOT NULL)::int,
+               overall_rating,
+               overall_rating,
+               overall_rating,
+               (overall_rating = 1)::int,
+               (overall_rating = 2)::int,
+               (overall_rating = 3)::int,
+               (overall_rating = 4)::int,
+               (overall_rating = 5)::int
+        FROM evaluation
+        ON CONFLICT (cleaner_id) DO UPDATE
+        SET total_evaluations     = a.total_evaluations + EXCLUDED.total_evaluations,
+            total_no_show         = a.total_no_show + EXCLUDED.total_no_show,
+            sum_professionalism   = a.sum_professionalism + EXCLUDED.sum_professionalism,
+            count_professionalism = a.count_professionalism + EXCLUDED.count_professionalism,
+            sum_completeness      = a.sum_completeness + EXCLUDED.sum_completeness,
+            count_completeness    = a.count_completeness + EXCLUDED.count_completeness,
+            sum_efficiency        = a.sum_efficiency + EXCLUDED.sum_efficiency,
+            count_efficiency      = a.count_efficiency + EXCLUDED.count_efficiency,
+            sum_overall_rating    = a.sum_overall_rating + EXCLUDED.sum_overall_rating,
+            min_overall_rating    = LEAST(a.min_overall_rating, EXCLUDED.min_overall_rating),
+            max_overall_rating    = GREATEST(a.max_overall_rating, EXCLUDED.max_overall_rating),
+            one_stars             = a.one_stars + EXCLUDED.one_stars,
+            two_stars             = a.two_stars + EXCLUDED.two_stars,
+            three_stars           = a.three_stars + EXCLUDED.three_stars,
+            four_stars            = a.four_stars + EXCLUDED.four_stars,
+            five_stars            = a.five_stars + EXCLUDED.five_stars
     )
-    RETURNING no_show,
-              cleaning_id,
-              cleaner_id,
-              headline,
-              comment,
-              professionalism,
-              completeness,
-              efficiency,
-              overall_rating,
-              created_at,
-              updated_at;
+    SELECT probe.cleaning_owner,
+           probe.cleaner_id AS probe_cleaner_id,
+           probe.offer_status,
+           evaluation.*
+    FROM probe
+        LEFT JOIN evaluation
+        ON TRUE;
 """
 
 GET_CLEANER_EVALUATION_FOR_CLEANING_QUERY = """
@@ -74,48 +177,196 @@ LIST_EVALUATIONS_FOR_CLEANER_QUERY = """
            created_at,
            updated_at
     FROM cleaning_to_cleaner_evaluations
-    WHERE cleaner_id = :cleaner_id;
+    WHERE cleaner_id = :cleaner_id
+      AND (created_at, cleaning_id) < (:after_created_at, :after_id)
+    ORDER BY created_at DESC, cleaning_id DESC
+    LIMIT :limit;
+"""
+
+CLEANER_AGGREGATE_RATINGS_COLUMNS = """
+    a.sum_professionalism::numeric / NULLIF(a.count_professionalism, 0) AS avg_professionalism,
+    a.sum_completeness::numeric / NULLIF(a.count_completeness, 0)       AS avg_completeness,
+    a.sum_efficiency::numeric / NULLIF(a.count_efficiency, 0)           AS avg_efficiency,
+    a.sum_overall_rating::numeric / NULLIF(a.total_evaluations, 0)      AS avg_overall_rating,
+    a.min_overall_rating,
+    a.max_overall_rating,
+    a.total_evaluations,
+    a.total_no_show,
+    a.one_stars,
+    a.two_stars,
+    a.three_stars,
+    a.four_stars,
+    a.five_stars
 """
 
-GET_CLEANER_AGGREGATE_RATINGS_QUERY = """
-    SELECT
-        AVG(professionalism) AS avg_professionalism,
-        AVG(completeness)    AS avg_completeness,
-        AVG(efficiency)      AS avg_efficiency,
-        AVG(overall_rating)  AS avg_overall_rating,
-        MIN(overall_rating)  AS min_overall_rating,
-        MAX(overall_rating)  AS max_overall_rating,
-        COUNT(cleaning_id)   AS total_evaluations,
-        SUM(no_show::int)    AS total_no_show,
-        COUNT(overall_rating) FILTER(WHERE overall_rating = 1) AS one_stars,
-        COUNT(overall_rating) FILTER(WHERE overall_rating = 2) AS two_stars,
-        COUNT(overall_rating) FILTER(WHERE overall_rating = 3) AS three_stars,
-        COUNT(overall_rating) FILTER(WHERE overall_rating = 4) AS four_stars,
-        COUNT(overall_rating) FILTER(WHERE overall_rating = 5) AS five_stars
+# cleaners that have never been evaluated don't have any aggregates
+GET_CLEANER_AGGREGATE_RATINGS_QUERY = f"""
+    SELECT {CLEANER_AGGREGATE_RATINGS_COLUMNS}
+    FROM cleaner_rating_aggregates a
+    WHERE a.cleaner_id = :cleaner_id;
+"""
+
+LIST_CLEANER_AGGREGATE_RATINGS_BY_USERNAMES_QUERY = f"""
+    SELECT u.id AS cleaner_id,
+           u.username,
+           {CLEANER_AGGREGATE_RATINGS_COLUMNS}
+    FROM users u
+        JOIN cleaner_rating_aggregates a
+        ON a.cleaner_id = u.id
+    WHERE u.username = ANY(:usernames)
+    ORDER BY u.username;
+"""
+
+LIST_CLEANER_LEADERBOARD_QUERY = """
+    SELECT rank, cleaner_id, score, avg_overall_rating, total_evaluations, no_show_rate
+    FROM cleaner_leaderboard
+    WHERE rank > :after_rank
+      AND total_evaluations >= :min_evaluations
+      AND no_show_rate <= :max_no_show_rate
+    ORDER BY rank
+    LIMIT :limit;
+"""
+
+# readers keep seeing the previous rankings while they're being recomputed
+REFRESH_CLEANER_LEADERBOARD_QUERY = """
+    REFRESH MATERIALIZED VIEW CONCURRENTLY cleaner_leaderboard;
+"""
+
+CLEANER_RATING_AGGREGATE_COLUMNS = """
+    cleaner_id,
+    total_evaluations,
+    total_no_show,
+    sum_professionalism,
+    count_professionalism,
+    sum_completeness,
+    count_completeness,
+    sum_efficiency,
+    count_efficiency,
+    sum_overall_rating,
+    min_overall_rating,
+    max_overall_rating,
+    one_stars,
+    two_stars,
+    three_stars,
+    four_stars,
+    five_stars
+"""
+
+# aggregates computed from scratch, in the order and with the types of `CLEANER_RATING_AGGREGATE_COLUMNS`
+COMPUTE_CLEANER_RATING_AGGREGATES_QUERY = """
+    SELECT cleaner_id,
+           COUNT(*)::int,
+           COUNT(*) FILTER(WHERE no_show)::int,
+           COALESCE(SUM(professionalism), 0)::int,
+           COUNT(professionalism)::int,
+           COALESCE(SUM(completeness), 0)::int,
+           COUNT(completeness)::int,
+           COALESCE(SUM(efficiency), 0)::int,
+           COUNT(efficiency)::int,
+           SUM(overall_rating)::int,
+           MIN(overall_rating),
+           MAX(overall_rating),
+           COUNT(*) FILTER(WHERE overall_rating = 1)::int,
+           COUNT(*) FILTER(WHERE overall_rating = 2)::int,
+           COUNT(*) FILTER(WHERE overall_rating = 3)::int,
+           COUNT(*) FILTER(WHERE overall_rating = 4)::int,
+           COUNT(*) FILTER(WHERE overall_rating = 5)::int
     FROM cleaning_to_cleaner_evaluations
-    WHERE cleaner_id = :cleaner_id;
+    GROUP BY cleaner_id
+"""
+
+# Both lock out new evaluations, which update the aggregates in the same statement they're inserted with,
+# so that every evaluation committed before the lock is counted and none is counted twice.
+LOCK_CLEANER_RATING_AGGREGATES_FOR_REBUILD_QUERY = """
+    LOCK TABLE cleaner_rating_aggregates IN SHARE ROW EXCLUSIVE MODE;
+"""
+
+LOCK_CLEANER_RATING_AGGREGATES_FOR_CHECK_QUERY = """
+    LOCK TABLE cleaner_rating_aggregates IN SHARE MODE;
+"""
+
+DELETE_CLEANER_RATING_AGGREGATES_QUERY = """
+    DELETE FROM cleaner_rating_aggregates;
+"""
+
+REBUILD_CLEANER_RATING_AGGREGATES_QUERY = f"""
+    INSERT INTO cleaner_rating_aggregates ({CLEANER_RATING_AGGREGATE_COLUMNS})
+    {COMPUTE_CLEANER_RATING_AGGREGATES_QUERY}
+    RETURNING cleaner_id;
+"""
+
+LIST_INCONSISTENT_CLEANER_RATING_AGGREGATES_QUERY = f"""
+    WITH computed ({CLEANER_RATING_AGGREGATE_COLUMNS}) AS (
+        {COMPUTE_CLEANER_RATING_AGGREGATES_QUERY}
+    ), stored AS (
+        SELECT {CLEANER_RATING_AGGREGATE_COLUMNS}
+        FROM cleaner_rating_aggregates
+    )
+    SELECT COALESCE(computed.cleaner_id, stored.cleaner_id) AS cleaner_id
+    FROM computed
+        FULL OUTER JOIN stored
+        ON stored.cleaner_id = computed.cleaner_id
+    WHERE computed IS DISTINCT FROM stored
+    ORDER BY 1;
 """
 
 
+queries.register_module(globals())
+
+
 class EvaluationsRepository(BaseRepository):
-    def __init__(self, db: Database) -> None:
-        super().__init__(db)
-        self.offers_repo = OffersRepository(db)
+    def __init__(
+            self,
+            db: Database,
+            loaders: Optional["Loaders"] = None,
+            router: Optional[DatabaseRouter] = None,
+    ) -> None:
+        super().__init__(db, loaders, router)
+        self.offers_repo = OffersRepository(db, loaders, router)
+        self.users_repo = UsersRepository(db, loaders, router)
     
     async def create_evaluation_for_cleaner(
-            self, *, evaluation_create: EvaluationCreate, cleaning: CleaningInDB, cleaner: UserInDB
+            self,
+            *,
+            evaluation_create: EvaluationCreate,
+            cleaning_id: int,
+            cleaner_username: str,
+            requesting_user: UserInDB,
     ) -> EvaluationInDB:
-        async with self.db.transaction():
-            created_evaluation = await self.db.fetch_one(
-                query=CREATE_OWNER_EVALUATION_FOR_CLEANER_QUERY,
-                values={**evaluation_create.dict(), "cleaning_id": cleaning.id, "cleaner_id": cleaner.id},
+        """
+        Checks the permissions, marks the offer as completed and creates the evaluation in a single statement
+        """
+        record = await self.db.fetch_one(
+            query=CREATE_OWNER_EVALUATION_FOR_CLEANER_QUERY,
+            values={
+                **evaluation_create.dict(),
+                "cleaning_id": cleaning_id,
+                "cleaner_username": cleaner_username,
+                "owner_id": requesting_user.id,
+            },
+        )
+        if not record:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cleaning found with that id.")
+        if record["probe_cleaner_id"] is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No user found with that username.")
+        if record["offer_status"] is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Offer not found.")
+        # Check that only owners of a cleaning can leave evaluations for that cleaning job
+        if record["cleaning_owner"] != requesting_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Users are unable to leave evaluations for cleaning jobs they do not own.",
+            )
+        # Evaluations can only be made for accepted offers, which also allows a single evaluation per-cleaner-per-job
+        if record["cleaning_id"] is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only users with accepted offers can be evaluated.",
             )
-            # also mark offer as completed
-            await self.offers_repo.mark_offer_completed(cleaning=cleaning, cleaner=cleaner)
-            return EvaluationInDB(**created_evaluation)
+        return EvaluationInDB(**{key: record[key] for key in EvaluationInDB.__fields__})
     
     async def get_cleaner_evaluation_for_cleaning(self, *, cleaning: CleaningInDB, cleaner: UserInDB) -> EvaluationInDB:
-        evaluation = await self.db.fetch_one(
+        evaluation = await self.read_db.fetch_one(
             query=GET_CLEANER_EVALUATION_FOR_CLEANING_QUERY,
             values={"cleaning_id": cleaning.id, "cleaner_id": cleaner.id},
         )
@@ -123,11 +374,71 @@ class EvaluationsRepository(BaseRepository):
             return None
         return EvaluationInDB(**evaluation)
     
-    async def list_evaluations_for_cleaner(self, *, cleaner: UserInDB) -> List[EvaluationInDB]:
-        evaluations = await self.db.fetch_all(
-            query=LIST_EVALUATIONS_FOR_CLEANER_QUERY, values={"cleaner_id": cleaner.id}
+    async def list_evaluations_for_cleaner(
+            self, *, cleaner: UserInDB, pagination: Pagination = Pagination()
+    ) -> List[EvaluationInDB]:
+        evaluations = await self.read_db.fetch_all(
+            query=LIST_EVALUATIONS_FOR_CLEANER_QUERY,
+            values={"cleaner_id": cleaner.id, **pagination.keyset_values()},
         )
         return [EvaluationInDB(**e) for e in evaluations]
     
     async def get_cleaner_aggregates(self, *, cleaner: UserInDB) -> EvaluationAggregate:
-        return await self.db.fetch_one(query=GET_CLEANER_AGGREGATE_RATINGS_QUERY, values={"cleaner_id": cleaner.id})
+        return await self.read_db.fetch_one(
+            query=GET_CLEANER_AGGREGATE_RATINGS_QUERY, values={"cleaner_id": cleaner.id}
+        )
+    
+    async def list_cleaner_aggregates(self, *, usernames: List[str]) -> List[CleanerAggregate]:
+        """
+        Aggregates of many cleaners in one query. Unknown and never evaluated cleaners are left out.
+        """
+        records = await self.read_db.fetch_all(
+            query=LIST_CLEANER_AGGREGATE_RATINGS_BY_USERNAMES_QUERY, values={"usernames": usernames},
+        )
+        return [CleanerAggregate(**r) for r in records]
+    
+    async def list_leaderboard(
+            self,
+            *,
+            min_evaluations: int = 1,
+            max_no_show_rate: float = 1,
+            limit: Optional[int] = None,
+            after_rank: int = 0,
+    ) -> List[LeaderboardEntry]:
+        """
+        Cleaners in the order of the last refresh of the leaderboard, along with their profiles
+        """
+        records = await self.read_db.fetch_all(
+            query=LIST_CLEANER_LEADERBOARD_QUERY,
+            values={
+                "min_evaluations": min_evaluations,
+                "max_no_show_rate": max_no_show_rate,
+                "limit": limit,
+                "after_rank": after_rank,
+            },
+        )
+        cleaners = await self.users_repo.get_users_by_ids(user_ids=[r["cleaner_id"] for r in records])
+        cleaners_by_id = {cleaner.id: cleaner for cleaner in cleaners}
+        return [LeaderboardEntry(**r, cleaner=cleaners_by_id.get(r["cleaner_id"])) for r in records]
+    
+    async def refresh_leaderboard(self) -> None:
+        await self.db.execute(query=REFRESH_CLEANER_LEADERBOARD_QUERY)
+    
+    async def rebuild_cleaner_aggregates(self) -> List[int]:
+        """
+        Recompute every cleaner's rating aggregates from their evaluations, returning the ids of the cleaners
+        """
+        async with self.db.transaction():
+            await self.db.execute(query=LOCK_CLEANER_RATING_AGGREGATES_FOR_REBUILD_QUERY)
+            await self.db.execute(query=DELETE_CLEANER_RATING_AGGREGATES_QUERY)
+            records = await self.db.fetch_all(query=REBUILD_CLEANER_RATING_AGGREGATES_QUERY)
+        return [r["cleaner_id"] for r in records]
+    
+    async def list_inconsistent_cleaner_aggregates(self) -> List[int]:
+        """
+        Ids of the cleaners whose stored rating aggregates don't match their evaluations
+        """
+        async with self.db.transaction():
+            await self.db.execute(query=LOCK_CLEANER_RATING_AGGREGATES_FOR_CHECK_QUERY)
+            records = await self.db.fetch_all(query=LIST_INCONSISTENT_CLEANER_RATING_AGGREGATES_QUERY)
+        return [r["cleaner_id"] for r in records]
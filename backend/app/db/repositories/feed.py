@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, List, Optional
+
+from databases import Database
+
+from app.db.replicas import DatabaseRouter
+from app.db.queries import queries
+from app.db.repositories.base import BaseRepository
+from app.db.repositories.users import UsersRepository
+from app.db.repositories.offers import OffersRepository
+
+from app.models.cleaning import CleaningInDB
+from app.models.feed import CleaningFeedItem
+from app.models.pagination import Pagination
+from app.services import cleaning_feed_cache
+
+if TYPE_CHECKING:
+    from app.db.loaders import Loaders
+
+# Every cleaning shows up once, as its latest event, so the feed is paginated on `updated_at`.
+# The plain `updated_at <=` condition lets the planner walk the index on `updated_at`
+# instead of filtering every newer row through the row comparison.
+LIST_CLEANING_FEED_QUERY = """
+    SELECT id, name, description, price, cleaning_type, owner, created_at, updated_at,
+           CASE WHEN updated_at > created_at THEN 'is_update' ELSE 'is_create' END AS event_type,
+           updated_at AS event_timestamp
+    FROM cleanings
+    WHERE updated_at <= :after_created_at
+      AND (updated_at, id) < (:after_created_at, :after_id)
+    ORDER BY updated_at DESC, id DESC
+    LIMIT :limit;
+"""
+
+# clients start the feed at their own clock's "now", which is rarely ahead of ours
+FIRST_PAGE_CLOCK_SKEW = timedelta(minutes=1)
+
+
+queries.register_module(globals())
+
+
+class FeedRepository(BaseRepository):
+    """
+    Activity feeds shared by every user
+    """
+    
+    def __init__(
+            self,
+            db: Database,
+            loaders: Optional["Loaders"] = None,
+            router: Optional[DatabaseRouter] = None,
+    ) -> None:
+        super().__init__(db, loaders, router)
+        self.users_repo = UsersRepository(db, loaders, router)
+        self.offers_repo = OffersRepository(db, loaders, router)
+    
+    async def get_cleaning_feed(self, *, pagination: Pagination) -> List[CleaningFeedItem]:
+        """
+        The first page is what every user loads, so it's served from `cleaning_feed_cache`.
+        A page starting after the newest event of the first page is that same page.
+        """
+        cursor = pagination.cursor
+        if cursor is None or cursor.created_at >= datetime.now(timezone.utc) - FIRST_PAGE_CLOCK_SKEW:
+            first_page = await self.get_first_page_of_cleaning_feed(limit=pagination.limit)
+            if cursor is None or not first_page or (
+                    (cursor.created_at, cursor.id) > (first_page[0].event_timestamp, first_page[0].id)
+            ):
+                return first_page
+        return await self.list_cleaning_feed(pagination=pagination)
+    
+    async def get_first_page_of_cleaning_feed(self, *, limit: int) -> List[CleaningFeedItem]:
+        first_page = cleaning_feed_cache.get(limit)
+        if first_page is None:
+            first_page = await self.list_cleaning_feed(pagination=Pagination(limit=limit))
+            cleaning_feed_cache.set(limit, first_page)
+        return first_page
+    
+    async def list_cleaning_feed(self, *, pagination: Pagination) -> List[CleaningFeedItem]:
+        """
+        Owners (with their profiles) and offer counts are fetched in one query each, however long the page is.
+        Feed items are the same for every user, so offers themselves are left out.
+        """
+        feed_records = await self.read_db.fetch_all(query=LIST_CLEANING_FEED_QUERY, values=pagination.keyset_values())
+        if not feed_records:
+            return []
+        cleanings = [CleaningInDB(**record) for record in feed_records]
+        owners, offer_counts = await asyncio.gather(
+            self.users_repo.get_users_by_ids(user_ids=[cleaning.owner for cleaning in cleanings]),
+            self.offers_repo.count_offers_for_cleanings(cleanings=cleanings),
+        )
+        owners_by_id = {owner.id: owner for owner in owners}
+        return [
+            CleaningFeedItem(
+                **{**record, "owner": owners_by_id.get(record["owner"])},
+                total_offers=offer_counts[record["id"]],
+            )
+            for record in feed_records
+        ]
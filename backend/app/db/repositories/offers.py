@@ -1,13 +1,21 @@
-from typing import List, Union
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Union
 
 from databases import Database
+from asyncpg.exceptions import UniqueViolationError
+from fastapi import HTTPException, status
 
+from app.db.replicas import DatabaseRouter
+from app.db.queries import queries
 from app.db.repositories.base import BaseRepository
-from app.db.repositories.users import UsersRepository
+from app.db.repositories.users import UsersRepository, USER_WITH_PROFILE_COLUMNS
 
 from app.models.cleaning import CleaningInDB
 from app.models.user import UserInDB
 from app.models.offer import OfferCreate, OfferUpdate, OfferInDB, OfferPublic
+from app.models.pagination import Pagination
+
+if TYPE_CHECKING:
+    from app.db.loaders import Loaders
 
 CREATE_OFFER_FOR_CLEANING_QUERY = """
     INSERT INTO user_offers_for_cleanings (cleaning_id, user_id, status)
@@ -15,46 +23,108 @@ CREATE_OFFER_FOR_CLEANING_QUERY = """
     RETURNING cleaning_id, user_id, status, created_at, updated_at;
 """
 
+# offers are identified by their user within a cleaning, so the user id breaks ties between pages
 LIST_OFFERS_FOR_CLEANING_QUERY = """
     SELECT cleaning_id, user_id, status, created_at, updated_at
     FROM user_offers_for_cleanings
-    WHERE cleaning_id = :cleaning_id;
+    WHERE cleaning_id = :cleaning_id
+      AND (created_at, user_id) < (:after_created_at, :after_id)
+    ORDER BY created_at DESC, user_id DESC
+    LIMIT :limit;
 """
 
-GET_OFFER_FOR_CLEANING_FROM_USER_QUERY = """
+LIST_OFFERS_FOR_CLEANINGS_QUERY = """
     SELECT cleaning_id, user_id, status, created_at, updated_at
     FROM user_offers_for_cleanings
-    WHERE cleaning_id = :cleaning_id AND user_id = :user_id;
+    WHERE cleaning_id = ANY(:cleaning_ids)
+    ORDER BY created_at DESC, user_id DESC;
 """
 
-ACCEPT_OFFER_QUERY = """
-    UPDATE user_offers_for_cleanings
-    SET status = 'accepted'
-    WHERE cleaning_id = :cleaning_id AND user_id = :user_id
-    RETURNING cleaning_id, user_id, status, created_at, updated_at;
+COUNT_OFFERS_FOR_CLEANINGS_QUERY = """
+    SELECT cleaning_id, COUNT(*) AS total_offers
+    FROM user_offers_for_cleanings
+    WHERE cleaning_id = ANY(:cleaning_ids)
+    GROUP BY cleaning_id;
 """
 
-REJECT_ALL_OTHER_OFFERS_QUERY = """
-    UPDATE user_offers_for_cleanings
-    SET status = 'rejected'
-    WHERE cleaning_id = :cleaning_id
-    AND user_id != :user_id
-    AND status = 'pending';
+GET_OFFER_FOR_CLEANING_FROM_USER_QUERY = """
+    SELECT cleaning_id, user_id, status, created_at, updated_at
+    FROM user_offers_for_cleanings
+    WHERE cleaning_id = :cleaning_id AND user_id = :user_id;
 """
 
-CANCEL_OFFER_QUERY = """
-    UPDATE user_offers_for_cleanings
-    SET status = 'cancelled'
-    WHERE cleaning_id = :cleaning_id AND user_id = :user_id
-    RETURNING cleaning_id, user_id, status, created_at, updated_at;
+# the offer is returned with its user and their profile, offer columns prefixed with `offer_`
+OFFER_WITH_USER_COLUMNS = f"""
+    o.cleaning_id AS offer_cleaning_id,
+    o.user_id     AS offer_user_id,
+    o.status      AS offer_status,
+    o.created_at  AS offer_created_at,
+    o.updated_at  AS offer_updated_at,
+    {USER_WITH_PROFILE_COLUMNS}
 """
 
-SET_ALL_OTHER_OFFERS_AS_PENDING_QUERY = """
-    UPDATE user_offers_for_cleanings
-    SET status = 'pending'
-    WHERE cleaning_id = :cleaning_id
-    AND user_id != :user_id
-    AND status = 'rejected';
+# Offers change status while the cleaning row is locked, so competing changes to offers
+# for the same cleaning are applied one after the other. The offer being changed is
+# guarded by its current status, which is rechecked once the lock is released.
+# The partial unique index on accepted offers guarantees a single accepted offer per cleaning.
+ACCEPT_OFFER_QUERY = f"""
+    WITH locked_cleaning AS (
+        SELECT id
+        FROM cleanings
+        WHERE id = :cleaning_id
+        FOR UPDATE
+    ), o AS (
+        UPDATE user_offers_for_cleanings
+        SET status = 'accepted'
+        WHERE cleaning_id = :cleaning_id
+          AND user_id     = :user_id
+          AND status      = 'pending'
+          AND EXISTS (SELECT 1 FROM locked_cleaning)
+        RETURNING cleaning_id, user_id, status, created_at, updated_at
+    ), rejected AS (
+        UPDATE user_offers_for_cleanings
+        SET status = 'rejected'
+        WHERE cleaning_id = :cleaning_id
+          AND user_id != :user_id
+          AND status = 'pending'
+          AND EXISTS (SELECT 1 FROM o)
+    )
+    SELECT {OFFER_WITH_USER_COLUMNS}
+    FROM o
+        JOIN users u
+        ON u.id = o.user_id
+        LEFT JOIN profiles p
+        ON p.user_id = u.id;
+"""
+
+CANCEL_OFFER_QUERY = f"""
+    WITH locked_cleaning AS (
+        SELECT id
+        FROM cleanings
+        WHERE id = :cleaning_id
+        FOR UPDATE
+    ), o AS (
+        UPDATE user_offers_for_cleanings
+        SET status = 'cancelled'
+        WHERE cleaning_id = :cleaning_id
+          AND user_id     = :user_id
+          AND status      = 'accepted'
+          AND EXISTS (SELECT 1 FROM locked_cleaning)
+        RETURNING cleaning_id, user_id, status, created_at, updated_at
+    ), reopened AS (
+        UPDATE user_offers_for_cleanings
+        SET status = 'pending'
+        WHERE cleaning_id = :cleaning_id
+          AND user_id != :user_id
+          AND status = 'rejected'
+          AND EXISTS (SELECT 1 FROM o)
+    )
+    SELECT {OFFER_WITH_USER_COLUMNS}
+    FROM o
+        JOIN users u
+        ON u.id = o.user_id
+        LEFT JOIN profiles p
+        ON p.user_id = u.id;
 """
 
 RESCIND_OFFER_QUERY = """
@@ -71,24 +141,34 @@ RESCIND_OFFER_QUERY_AND_RETURN_CLEANING_ID = """
 """
 
 MARK_OFFER_COMPLETED_QUERY = """
-    UPDATE user_offers_for_cleanings
-    SET status = 'completed'
-    WHERE cleaning_id = :cleaning_id AND user_id = :user_id
-"""
-
-MARK_OFFER_COMPLETED_QUERY = """
+    WITH locked_cleaning AS (
+        SELECT id
+        FROM cleanings
+        WHERE id = :cleaning_id
+        FOR UPDATE
+    )
     UPDATE user_offers_for_cleanings
     SET status = 'completed'
     WHERE cleaning_id = :cleaning_id
       AND user_id     = :user_id
-    RETURNING *;
+      AND status      = 'accepted'
+      AND EXISTS (SELECT 1 FROM locked_cleaning)
+    RETURNING cleaning_id, user_id, status, created_at, updated_at;
 """
 
 
+queries.register_module(globals())
+
+
 class OffersRepository(BaseRepository):
-    def __init__(self, db: Database) -> None:
-        super().__init__(db)
-        self.users_repo = UsersRepository(db)
+    def __init__(
+            self,
+            db: Database,
+            loaders: Optional["Loaders"] = None,
+            router: Optional[DatabaseRouter] = None,
+    ) -> None:
+        super().__init__(db, loaders, router)
+        self.users_repo = UsersRepository(db, loaders, router)
     
     async def create_offer_for_cleaning(
             self, *,
@@ -106,19 +186,54 @@ class OffersRepository(BaseRepository):
             *,
             cleaning: CleaningInDB,
             populate: bool = True,
-            requesting_user: UserInDB = None
+            requesting_user: UserInDB = None,
+            pagination: Pagination = Pagination(),
     ) -> List[Union[OfferInDB, OfferPublic]]:
-        offer_records = await self.db.fetch_all(
+        offer_records = await self.read_db.fetch_all(
             query=LIST_OFFERS_FOR_CLEANING_QUERY,
-            values={"cleaning_id": cleaning.id}
+            values={"cleaning_id": cleaning.id, **pagination.keyset_values()},
         )
         offers = [OfferInDB(**o) for o in offer_records]
         if populate:
-            return [await self.populate_offer(offer=offer) for offer in offers]
+            return await self.populate_offers(offers=offers)
         return offers
     
+    async def list_offers_for_cleanings(
+            self,
+            *,
+            cleanings: List[CleaningInDB],
+            populate: bool = True,
+    ) -> Dict[int, List[Union[OfferInDB, OfferPublic]]]:
+        """
+        Fetch the offers for many cleanings at once, grouped by cleaning id.
+        Every cleaning passed in gets an entry, even if no offers have been made for it.
+        """
+        offer_records = await self.read_db.fetch_all(
+            query=LIST_OFFERS_FOR_CLEANINGS_QUERY,
+            values={"cleaning_ids": [cleaning.id for cleaning in cleanings]},
+        )
+        offers = [OfferInDB(**o) for o in offer_records]
+        if populate:
+            offers = await self.populate_offers(offers=offers)
+        offers_by_cleaning_id = {cleaning.id: [] for cleaning in cleanings}
+        for offer in offers:
+            offers_by_cleaning_id[offer.cleaning_id].append(offer)
+        return offers_by_cleaning_id
+    
+    async def count_offers_for_cleanings(self, *, cleanings: List[CleaningInDB]) -> Dict[int, int]:
+        """
+        Number of offers made for each of the cleanings, counted in one query without fetching the offers
+        """
+        count_records = await self.read_db.fetch_all(
+            query=COUNT_OFFERS_FOR_CLEANINGS_QUERY,
+            values={"cleaning_ids": [cleaning.id for cleaning in cleanings]},
+        )
+        offer_counts = {cleaning.id: 0 for cleaning in cleanings}
+        offer_counts.update({c["cleaning_id"]: c["total_offers"] for c in count_records})
+        return offer_counts
+    
     async def get_offer_for_cleaning_from_user(self, *, cleaning: CleaningInDB, user: UserInDB) -> OfferInDB:
-        offer_record = await self.db.fetch_one(
+        offer_record = await self.read_db.fetch_one(
             query=GET_OFFER_FOR_CLEANING_FROM_USER_QUERY,
             values={"cleaning_id": cleaning.id, "user_id": user.id},
         )
@@ -128,29 +243,33 @@ class OffersRepository(BaseRepository):
         
         return OfferPublic(**offer_record, user=user)
     
-    async def accept_offer(self, *, offer: OfferInDB) -> OfferInDB:
-        async with self.db.transaction():
+    async def accept_offer(self, *, offer: OfferInDB) -> OfferPublic:
+        try:
             accepted_offer = await self.db.fetch_one(
-                query=ACCEPT_OFFER_QUERY,  # accept current offer
+                query=ACCEPT_OFFER_QUERY,  # accept current offer and reject all other offers
                 values={"cleaning_id": offer.cleaning_id, "user_id": offer.user_id},
             )
-            await self.db.execute(
-                query=REJECT_ALL_OTHER_OFFERS_QUERY,  # reject all other offers
-                values={"cleaning_id": offer.cleaning_id, "user_id": offer.user_id},
+        except UniqueViolationError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="That cleaning job already has an accepted offer."
             )
-            return await self.populate_offer(offer=OfferInDB(**accepted_offer))
-    
-    async def cancel_offer(self, *, offer: OfferInDB) -> OfferInDB:
-        async with self.db.transaction():
-            cancelled_offer = await self.db.fetch_one(
-                query=CANCEL_OFFER_QUERY,  # cancel current offer
-                values={"cleaning_id": offer.cleaning_id, "user_id": offer.user_id},
+        if not accepted_offer:
+            # another request changed the offer since it was checked
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Can only accept offers that are currently pending."
             )
-            await self.db.execute(
-                query=SET_ALL_OTHER_OFFERS_AS_PENDING_QUERY,  # set all other offers to pending again
-                values={"cleaning_id": offer.cleaning_id, "user_id": offer.user_id},
+        return self.build_offer_with_user(record=accepted_offer)
+    
+    async def cancel_offer(self, *, offer: OfferInDB) -> OfferPublic:
+        cancelled_offer = await self.db.fetch_one(
+            query=CANCEL_OFFER_QUERY,  # cancel current offer and set all other offers to pending again
+            values={"cleaning_id": offer.cleaning_id, "user_id": offer.user_id},
+        )
+        if not cancelled_offer:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Can only cancel offers that have been accepted.",
             )
-            return await self.populate_offer(offer=OfferInDB(**cancelled_offer))
+        return self.build_offer_with_user(record=cancelled_offer)
     
     async def rescind_offer(self, *, offer: OfferInDB) -> int:
         return await self.db.execute(
@@ -163,10 +282,29 @@ class OffersRepository(BaseRepository):
             query=MARK_OFFER_COMPLETED_QUERY,  # owner of cleaning marks job status as completed
             values={"cleaning_id": cleaning.id, "user_id": cleaner.id},
         )
+        if not offer_record:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Only users with accepted offers can be evaluated.",
+            )
         return OfferPublic(**offer_record, user=cleaner)
     
+    def build_offer_with_user(self, *, record: Mapping) -> OfferPublic:
+        """
+        Build the offer from a record selected with `OFFER_WITH_USER_COLUMNS`
+        """
+        user_values = {**record}
+        offer_values = {
+            key[len("offer_"):]: user_values.pop(key) for key in list(user_values) if key.startswith("offer_")
+        }
+        return OfferPublic(**offer_values, user=self.users_repo.build_user_with_profile(record=user_values))
+    
     async def populate_offer(self, *, offer: OfferInDB) -> OfferPublic:
         return OfferPublic(
             **offer.dict(),
             user=await self.users_repo.get_user_by_id(user_id=offer.user_id),
         )
+    
+    async def populate_offers(self, *, offers: List[OfferInDB]) -> List[OfferPublic]:
+        users = await self.users_repo.get_users_by_ids(user_ids=[offer.user_id for offer in offers])
+        users_by_id = {user.id: user for user in users}
+        return [OfferPublic(**offer.dict(), user=users_by_id.get(offer.user_id)) for offer in offers]
@@ -1,6 +1,10 @@
+from typing import List
+
+from app.db.queries import queries
 from app.db.repositories.base import BaseRepository
 from app.models.profile import ProfileCreate, ProfileUpdate, ProfileInDB
 from app.models.user import UserInDB
+from app.services import authenticated_user_cache
 
 CREATE_PROFILE_FOR_USER_QUERY = """
     INSERT INTO profiles (full_name, phone_number, bio, image, user_id)
@@ -13,6 +17,12 @@ GET_PROFILE_BY_USER_ID_QUERY = """
     WHERE user_id = :user_id;
 """
 
+LIST_PROFILES_BY_USER_IDS_QUERY = """
+    SELECT id, full_name, phone_number, bio, image, user_id, created_at, updated_at
+    FROM profiles
+    WHERE user_id = ANY(:user_ids);
+"""
+
 GET_PROFILE_BY_USERNAME_QUERY = """
     SELECT p.id,
            u.email AS email,
@@ -30,15 +40,10 @@ GET_PROFILE_BY_USERNAME_QUERY = """
     WHERE user_id = (SELECT id FROM users WHERE username = :username);
 """
 
-UPDATE_PROFILE_QUERY = """
-    UPDATE profiles
-    SET full_name    = :full_name,
-        phone_number = :phone_number,
-        bio          = :bio,
-        image        = :image
-    WHERE user_id = :user_id
-    RETURNING id, full_name, phone_number, bio, image, user_id, created_at, updated_at;
-"""
+PROFILE_COLUMNS = "id, full_name, phone_number, bio, image, user_id, created_at, updated_at"
+
+
+queries.register_module(globals())
 
 
 class ProfilesRepository(BaseRepository):
@@ -47,21 +52,38 @@ class ProfilesRepository(BaseRepository):
         return created_profile
     
     async def get_profile_by_user_id(self, *, user_id: int) -> ProfileInDB:
-        profile_record = await self.db.fetch_one(query=GET_PROFILE_BY_USER_ID_QUERY, values={"user_id": user_id})
+        if self.loaders:
+            return await self.loaders.profiles.load(user_id)
+        profile_record = await self.read_db.fetch_one(query=GET_PROFILE_BY_USER_ID_QUERY, values={"user_id": user_id})
         if not profile_record:
             return None
         return ProfileInDB(**profile_record)
     
+    async def list_profiles_by_user_ids(self, *, user_ids: List[int]) -> List[ProfileInDB]:
+        if self.loaders:
+            return [profile for profile in await self.loaders.profiles.load_many(list(set(user_ids))) if profile]
+        profile_records = await self.read_db.fetch_all(
+            query=LIST_PROFILES_BY_USER_IDS_QUERY, values={"user_ids": list(set(user_ids))}
+        )
+        return [ProfileInDB(**p) for p in profile_records]
+    
     async def get_profile_by_username(self, *, username: str) -> ProfileInDB:
-        profile_record = await self.db.fetch_one(query=GET_PROFILE_BY_USERNAME_QUERY, values={"username": username})
+        profile_record = await self.read_db.fetch_one(
+            query=GET_PROFILE_BY_USERNAME_QUERY, values={"username": username}
+        )
         if profile_record:
             return ProfileInDB(**profile_record)
     
     async def update_profile(self, *, profile_update: ProfileUpdate, requesting_user: UserInDB) -> ProfileInDB:
-        profile = await self.get_profile_by_user_id(user_id=requesting_user.id)
-        update_params = profile.copy(update=profile_update.dict(exclude_unset=True))
-        updated_profile = await self.db.fetch_one(
-            query=UPDATE_PROFILE_QUERY,
-            values=update_params.dict(exclude={"id", "created_at", "updated_at", "username", "email"}),
+        updated_profile = await self.partial_update(
+            table="profiles",
+            values=profile_update.dict(exclude_unset=True),
+            where={"user_id": requesting_user.id},
+            returning=PROFILE_COLUMNS,
         )
-        return ProfileInDB(**updated_profile)
+        updated_profile = ProfileInDB(**updated_profile)
+        # the cached authenticated user embeds their profile
+        authenticated_user_cache.evict(requesting_user.username)
+        if self.loaders:
+            self.loaders.profiles.prime(requesting_user.id, updated_profile)
+        return updated_profile
@@ -0,0 +1,25 @@
+from app.db.queries import queries
+from app.db.repositories.base import BaseRepository
+
+# expired ids are cleared out on the way, since their tokens can't be used anyway
+REVOKE_TOKEN_QUERY = """
+    WITH expired AS (
+        DELETE FROM revoked_tokens WHERE expires_at < now()
+    )
+    INSERT INTO revoked_tokens (jti, expires_at)
+    VALUES (:jti, to_timestamp(:expires_at))
+    ON CONFLICT (jti) DO NOTHING
+    RETURNING jti;
+"""
+
+
+queries.register_module(globals())
+
+
+class TokensRepository(BaseRepository):
+    async def revoke_token(self, *, jti: str, expires_at: float) -> bool:
+        """
+        Revoke the token with id `jti`, unless it was revoked already - in which case this returns False.
+        """
+        revoked = await self.db.fetch_val(query=REVOKE_TOKEN_QUERY, values={"jti": jti, "expires_at": expires_at})
+        return revoked is not None
@@ -1,17 +1,23 @@
-from typing import Optional
+from typing import TYPE_CHECKING, List, Mapping, Optional, Tuple
 
 from pydantic import EmailStr
 from fastapi import HTTPException, status
 from databases import Database
+from asyncpg.exceptions import UniqueViolationError
 
 from app.models.user import UserCreate, UserInDB, UserPublic
+from app.db.replicas import DatabaseRouter
+from app.db.queries import queries
 from app.db.repositories.base import BaseRepository
 
 from app.db.repositories.profiles import ProfilesRepository
-from app.models.profile import ProfileCreate
+from app.models.profile import ProfileInDB
 
 from app.services import auth_service
 
+if TYPE_CHECKING:
+    from app.db.loaders import Loaders
+
 GET_USER_BY_EMAIL_QUERY = """
     SELECT id, username, email, email_verified, password, salt, is_active, is_superuser, created_at, updated_at
     FROM users
@@ -24,64 +30,156 @@ GET_USER_BY_USERNAME_QUERY = """
     WHERE username = :username;
 """
 
-REGISTER_NEW_USER_QUERY = """
-    INSERT INTO users (username, email, password, salt)
-    VALUES (:username, :email, :password, :salt)
-    RETURNING id, username, email, email_verified, password, salt, is_active, is_superuser, created_at, updated_at;
-"""
-
 GET_USER_BY_ID_QUERY = """
     SELECT id, username, email, email_verified, password, salt, is_active, is_superuser, created_at, updated_at
     FROM users
     WHERE id = :id;
 """
 
+UPDATE_USER_PASSWORD_QUERY = """
+    UPDATE users
+    SET password = :password
+    WHERE id = :id;
+"""
+
+GET_USERS_BY_IDS_QUERY = """
+    SELECT id, username, email, email_verified, password, salt, is_active, is_superuser, created_at, updated_at
+    FROM users
+    WHERE id = ANY(:ids);
+"""
+
+# the user's profile is selected alongside the user, with every profile column prefixed with `profile_`
+USER_WITH_PROFILE_COLUMNS = """
+    u.id, u.username, u.email, u.email_verified, u.password, u.salt, u.is_active, u.is_superuser,
+    u.created_at, u.updated_at,
+    p.id           AS profile_id,
+    p.full_name    AS profile_full_name,
+    p.phone_number AS profile_phone_number,
+    p.bio          AS profile_bio,
+    p.image        AS profile_image,
+    p.created_at   AS profile_created_at,
+    p.updated_at   AS profile_updated_at
+"""
+
+GET_USER_WITH_PROFILE_BY_EMAIL_QUERY = f"""
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM users u
+        LEFT JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.email = :email;
+"""
+
+GET_USER_WITH_PROFILE_BY_USERNAME_QUERY = f"""
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM users u
+        LEFT JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.username = :username;
+"""
+
+GET_USER_WITH_PROFILE_BY_ID_QUERY = f"""
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM users u
+        LEFT JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.id = :id;
+"""
+
+GET_USERS_WITH_PROFILES_BY_IDS_QUERY = f"""
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM users u
+        LEFT JOIN profiles p
+        ON p.user_id = u.id
+    WHERE u.id = ANY(:ids);
+"""
+
+# the user and an empty profile are created together, relying on the unique indexes to reject taken credentials
+REGISTER_NEW_USER_WITH_PROFILE_QUERY = f"""
+    WITH u AS (
+        INSERT INTO users (username, email, password, salt)
+        VALUES (:username, :email, :password, :salt)
+        RETURNING id, username, email, email_verified, password, salt, is_active, is_superuser, created_at, updated_at
+    ), p AS (
+        INSERT INTO profiles (full_name, phone_number, bio, image, user_id)
+        SELECT NULL, NULL, NULL, NULL, id
+        FROM u
+        RETURNING id, full_name, phone_number, bio, image, user_id, created_at, updated_at
+    )
+    SELECT {USER_WITH_PROFILE_COLUMNS}
+    FROM u
+        LEFT JOIN p
+        ON p.user_id = u.id;
+"""
+
+# unique indexes on the users table and the error raised when one of them is violated on registration
+TAKEN_CREDENTIALS_ERRORS = {
+    "ix_users_email": "That email is already taken. Login with that email or register with another one.",
+    "ix_users_username": "That username is already taken. Please try another one.",
+}
+
+
+def split_user_with_profile_record(record: Mapping) -> Tuple[UserInDB, Optional[ProfileInDB]]:
+    user_values = {**record}
+    profile_values = {
+        key[len("profile_"):]: user_values.pop(key) for key in list(user_values) if key.startswith("profile_")
+    }
+    user = UserInDB(**user_values)
+    if profile_values["id"] is None:
+        return user, None
+    return user, ProfileInDB(**profile_values, user_id=user.id)
+
+
+queries.register_module(globals())
+
 
 class UsersRepository(BaseRepository):
-    def __init__(self, db: Database) -> None:
-        super().__init__(db)
+    def __init__(
+            self,
+            db: Database,
+            loaders: Optional["Loaders"] = None,
+            router: Optional[DatabaseRouter] = None,
+    ) -> None:
+        super().__init__(db, loaders, router)
         self.auth_service = auth_service
-        self.profiles_repo = ProfilesRepository(db)
+        self.profiles_repo = ProfilesRepository(db, loaders, router)
     
     async def get_user_by_email(self, *, email: EmailStr, populate: bool = True) -> UserInDB:
-        user_record = await self.db.fetch_one(query=GET_USER_BY_EMAIL_QUERY, values={"email": email})
+        if populate:
+            return await self.get_user_with_profile(
+                query=GET_USER_WITH_PROFILE_BY_EMAIL_QUERY, values={"email": email}
+            )
+        user_record = await self.read_db.fetch_one(query=GET_USER_BY_EMAIL_QUERY, values={"email": email})
         if user_record:
             user = UserInDB(**user_record)
-            if populate:
-                return await self.populate_user(user=user)
+            if self.loaders:
+                self.loaders.users.prime(user.id, user)
             return user
     
     async def get_user_by_username(self, *, username: str, populate: bool = True) -> UserInDB:
-        user_record = await self.db.fetch_one(query=GET_USER_BY_USERNAME_QUERY, values={"username": username})
+        if populate:
+            return await self.get_user_with_profile(
+                query=GET_USER_WITH_PROFILE_BY_USERNAME_QUERY, values={"username": username}
+            )
+        user_record = await self.read_db.fetch_one(query=GET_USER_BY_USERNAME_QUERY, values={"username": username})
         if user_record:
             user = UserInDB(**user_record)
-            if populate:
-                return await self.populate_user(user=user)
+            if self.loaders:
+                self.loaders.users.prime(user.id, user)
             return user
     
-    async def register_new_user(self, *, new_user: UserCreate) -> UserInDB:
-        # make sure email isn't already taken
-        if await self.get_user_by_email(email=new_user.email):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="That email is already taken. Login with that email or register with another one."
-            )
-        # make sure username isn't already taken
-        if await self.get_user_by_username(username=new_user.username):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="That username is already taken. Please try another one."
-            )
-        
-        user_password_update = self.auth_service.create_salt_and_hashed_password(plaintext_password=new_user.password)
-        new_user_params = new_user.copy(update=user_password_update.dict())
-        created_user = await self.db.fetch_one(query=REGISTER_NEW_USER_QUERY, values=new_user_params.dict())
-        
-        # create profile for new user
-        await self.profiles_repo.create_profile_for_user(
-            profile_create=ProfileCreate(user_id=created_user["id"])
+    async def register_new_user(self, *, new_user: UserCreate) -> UserPublic:
+        user_password_update = await self.auth_service.create_salt_and_hashed_password_in_pool(
+            plaintext_password=new_user.password
         )
-        return await self.populate_user(user=UserInDB(**created_user))
+        new_user_params = new_user.copy(update=user_password_update.dict())
+        try:
+            user_record = await self.db.fetch_one(
+                query=REGISTER_NEW_USER_WITH_PROFILE_QUERY, values=new_user_params.dict()
+            )
+        except UniqueViolationError as e:
+            detail = TAKEN_CREDENTIALS_ERRORS.get(e.constraint_name, TAKEN_CREDENTIALS_ERRORS["ix_users_email"])
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+        return self.build_user_with_profile(record=user_record)
     
     async def authenticate_user(self, *, email: EmailStr, password: str) -> Optional[UserInDB]:
         # make user user exists in db
@@ -89,8 +187,15 @@ class UsersRepository(BaseRepository):
         if not user:
             return None
         # if submitted password doesn't match
-        if not self.auth_service.verify_password(password=password, salt=user.salt, hashed_pw=user.password):
+        is_valid, updated_hash = await self.auth_service.verify_and_update_password_in_pool(
+            password=password, salt=user.salt, hashed_pw=user.password
+        )
+        if not is_valid:
             return None
+        # password was hashed with an outdated cost factor, so store the rehashed version
+        if updated_hash:
+            await self.db.execute(query=UPDATE_USER_PASSWORD_QUERY, values={"id": user.id, "password": updated_hash})
+            user = user.copy(update={"password": updated_hash})
         return user
     
     async def populate_user(self, *, user: UserInDB) -> UserInDB:
@@ -103,9 +208,64 @@ class UsersRepository(BaseRepository):
         )
     
     async def get_user_by_id(self, *, user_id: int, populate: bool = True) -> UserPublic:
-        user_record = await self.db.fetch_one(query=GET_USER_BY_ID_QUERY, values={"id": user_id})
-        if user_record:
-            user = UserInDB(**user_record)
-            if populate:
+        if self.loaders:
+            # the users loader fetches profiles along with users, so populating is free
+            user = await self.loaders.users.load(user_id)
+            if user and populate:
                 return await self.populate_user(user=user)
             return user
+        if populate:
+            return await self.get_user_with_profile(query=GET_USER_WITH_PROFILE_BY_ID_QUERY, values={"id": user_id})
+        user_record = await self.read_db.fetch_one(query=GET_USER_BY_ID_QUERY, values={"id": user_id})
+        if user_record:
+            return UserInDB(**user_record)
+    
+    async def get_users_by_ids(self, *, user_ids: List[int], populate: bool = True) -> List[UserInDB]:
+        if self.loaders:
+            users = [user for user in await self.loaders.users.load_many(list(set(user_ids))) if user]
+            if populate:
+                return await self.populate_users(users=users)
+            return users
+        if populate:
+            return [
+                UserPublic(**user.dict(), profile=profile)
+                for user, profile in await self.get_users_and_profiles_by_ids(user_ids=user_ids)
+            ]
+        user_records = await self.read_db.fetch_all(query=GET_USERS_BY_IDS_QUERY, values={"ids": list(set(user_ids))})
+        return [UserInDB(**u) for u in user_records]
+    
+    async def get_users_and_profiles_by_ids(
+            self, *, user_ids: List[int]
+    ) -> List[Tuple[UserInDB, Optional[ProfileInDB]]]:
+        user_records = await self.read_db.fetch_all(
+            query=GET_USERS_WITH_PROFILES_BY_IDS_QUERY, values={"ids": list(set(user_ids))}
+        )
+        return [split_user_with_profile_record(u) for u in user_records]
+    
+    async def get_user_with_profile(self, *, query: str, values: dict) -> Optional[UserPublic]:
+        """
+        Fetch a user and their profile in a single round trip, using one of the
+        `GET_USER_WITH_PROFILE_*` queries.
+        """
+        user_record = await self.read_db.fetch_one(query=query, values=values)
+        if not user_record:
+            return None
+        return self.build_user_with_profile(record=user_record)
+    
+    def build_user_with_profile(self, *, record: Mapping) -> UserPublic:
+        """
+        Build the user from a record selected with `USER_WITH_PROFILE_COLUMNS`, priming the loaders along the way
+        """
+        user, profile = split_user_with_profile_record(record)
+        if self.loaders:
+            self.loaders.users.prime(user.id, user)
+            self.loaders.profiles.prime(user.id, profile)
+        return UserPublic(**user.dict(), profile=profile)
+    
+    async def populate_users(self, *, users: List[UserInDB]) -> List[UserPublic]:
+        """
+        Same as `populate_user`, but fetches the profiles for all users in a single query
+        """
+        profiles = await self.profiles_repo.list_profiles_by_user_ids(user_ids=[user.id for user in users])
+        profiles_by_user_id = {profile.user_id: profile for profile in profiles}
+        return [UserPublic(**user.dict(), profile=profiles_by_user_id.get(user.id)) for user in users]
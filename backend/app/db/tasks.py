@@ -1,33 +1,95 @@
 import os
+from typing import Optional, Union
 from fastapi import FastAPI
-from databases import Database
-from app.core.config import DATABASE_URL
+from app.core.config import (
+    DATABASE_BACKEND,
+    DATABASE_URL,
+    DATABASE_REPLICA_URLS,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_ACQUIRE_TIMEOUT_SECONDS,
+    DB_POOL_MAX_CONNECTION_LIFETIME_SECONDS,
+    DB_POOL_MAX_IDLE_SECONDS,
+    DB_REPLICA_MAX_LAG_SECONDS,
+)
+from app.db.database import AsyncpgDatabase, PrecompiledDatabase
+from app.db.pool import instrument_pool
+from app.db.replicas import Replica, ReplicaSet
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-async def connect_to_db(app: FastAPI) -> None:
-    DB_URL = f"{DATABASE_URL}_test" if os.environ.get("TESTING") else DATABASE_URL
-    database = Database(DB_URL, min_size=2, max_size=10)
+DATABASE_BACKENDS = {
+    "databases": PrecompiledDatabase,
+    "asyncpg": AsyncpgDatabase,
+}
+
+
+def create_database(url: str) -> Union[PrecompiledDatabase, AsyncpgDatabase]:
+    if DATABASE_BACKEND not in DATABASE_BACKENDS:
+        raise ValueError(f"DATABASE_BACKEND has to be one of {list(DATABASE_BACKENDS)}, not {DATABASE_BACKEND!r}")
+    url = f"{url}_test" if os.environ.get("TESTING") else url
+    return DATABASE_BACKENDS[DATABASE_BACKEND](
+        url,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_IDLE_SECONDS,
+    )
+
 
+async def connect_to_replicas() -> Optional[ReplicaSet]:
+    if not DATABASE_REPLICA_URLS:
+        return None
+    replicas = ReplicaSet(
+        [
+            Replica(
+                create_database(url),
+                acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT_SECONDS,
+                max_lifetime=DB_POOL_MAX_CONNECTION_LIFETIME_SECONDS,
+            )
+            for url in DATABASE_REPLICA_URLS
+        ],
+        max_lag=DB_REPLICA_MAX_LAG_SECONDS,
+    )
+    # connects every replica it can reach, the primary serves every read until one is healthy
+    await replicas.check_health()
+    for replica in replicas.replicas:
+        if not replica.healthy:
+            logger.warning(f"Replica {replica.database.url.obscure_password} isn't serving reads yet")
+    return replicas
+
+
+async def connect_to_db(app: FastAPI) -> None:
+    database = create_database(str(DATABASE_URL))
+    
     try:
         await database.connect()
-        app.state._db = database
-        
     except Exception as e:
-        logger.warning(
+        logger.error(
             '''
             --- DB CONNECTION ERROR ---
             {}
             --- DB CONNECTION ERROR ---
             '''.format(e)
         )
+        # the app can't serve anything without its database, so it shouldn't start
+        raise
+    
+    app.state._db = database
+    app.state._db_pool = instrument_pool(
+        database,
+        acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT_SECONDS,
+        max_lifetime=DB_POOL_MAX_CONNECTION_LIFETIME_SECONDS,
+    )
+    app.state._db_replicas = await connect_to_replicas()
 
 
 async def close_db_connection(app: FastAPI) -> None:
     try:
         await app.state._db.disconnect()
+        if app.state._db_replicas is not None:
+            await app.state._db_replicas.disconnect()
     except Exception as e:
         logger.warning(
             '''
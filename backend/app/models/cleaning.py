@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional, Union, List
+from typing import Dict, Optional, Union, List
 from enum import Enum
 
 from app.models.core import IDModelMixin, DateTimeModelMixin, CoreModel
@@ -32,6 +32,17 @@ class CleaningUpdate(CleaningBase):
     cleaning_type: Optional[CleaningType]
 
 
+class CleaningSearch(CoreModel):
+    """
+    Search query in web search syntax, along with the filters applied to its matches
+    """
+    
+    query: str
+    cleaning_type: Optional[CleaningType]
+    min_price: Optional[float]
+    max_price: Optional[float]
+
+
 class CleaningInDB(IDModelMixin, DateTimeModelMixin, CleaningBase):
     name: str
     price: float
@@ -48,3 +59,30 @@ class CleaningPublic(CleaningInDB):
 from app.models.offer import OfferPublic  # noqa E402
 
 CleaningPublic.update_forward_refs()
+
+
+class CleaningSearchResult(CleaningPublic):
+    rank: float
+
+
+class PriceBucketCount(CoreModel):
+    """
+    Number of cleanings priced from `min_price` (inclusive) up to `max_price`, either of which can be unbounded
+    """
+    min_price: Optional[float]
+    max_price: Optional[float]
+    count: int
+
+
+class CleaningFacets(CoreModel):
+    """
+    Counts of the matches of a search for each cleaning type and price bucket.
+    Each facet ignores its own filter, so that the counts of the other options stay visible.
+    """
+    cleaning_type: Dict[CleaningType, int]
+    price: List[PriceBucketCount]
+
+
+class CleaningDiscovery(CoreModel):
+    results: List[CleaningSearchResult]
+    facets: CleaningFacets
@@ -50,3 +50,17 @@ class EvaluationAggregate(CoreModel):
     five_stars: conint(ge=0)
     total_evaluations: conint(ge=0)
     total_no_show: conint(ge=0)
+
+
+class CleanerAggregate(EvaluationAggregate):
+    cleaner_id: int
+    username: str
+
+
+class LeaderboardEntry(CoreModel):
+    rank: conint(ge=1)
+    score: confloat(ge=0, le=5)
+    avg_overall_rating: confloat(ge=0, le=5)
+    total_evaluations: conint(ge=1)
+    no_show_rate: confloat(ge=0, le=1)
+    cleaner: Optional[UserPublic]
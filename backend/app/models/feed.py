@@ -0,0 +1,14 @@
+import datetime
+from typing import Literal, Optional
+
+from app.models.core import CoreModel
+from app.models.cleaning import CleaningPublic
+
+
+class FeedItem(CoreModel):
+    event_type: Optional[Literal["is_create", "is_update"]]
+    event_timestamp: Optional[datetime.datetime]
+
+
+class CleaningFeedItem(CleaningPublic, FeedItem):
+    pass
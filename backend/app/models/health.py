@@ -0,0 +1,30 @@
+from typing import Dict
+
+from app.models.core import CoreModel
+
+
+class LatencyHistogram(CoreModel):
+    # counts per bucket upper bound in milliseconds, "+Inf" holding everything above the last bound
+    buckets: Dict[str, int]
+    count: int
+    sum_ms: float
+
+
+class DatabasePoolStats(CoreModel):
+    size: int
+    min_size: int
+    max_size: int
+    in_use: int
+    idle: int
+    waiters: int
+    acquire_timeouts: int
+    acquire_latency: LatencyHistogram
+
+
+class PasswordHashingStats(CoreModel):
+    max_workers: int
+    queue_depth: int
+    in_progress: int
+    completed: int
+    timed_out: int
+    hash_latency: LatencyHistogram
@@ -37,3 +37,14 @@ class OfferInDB(DateTimeModelMixin, OfferBase):
 class OfferPublic(OfferInDB):
     user: Optional[UserPublic]
     cleaning: Optional[CleaningPublic]
+
+
+class OfferAuthorization(CoreModel):
+    """
+    What the offer and evaluation permission checks need to know about a cleaning
+    and the offer made for it by a user, fetched in a single query
+    """
+    cleaning_owner: int
+    user_id: Optional[int]
+    offer_status: Optional[OfferStatus]
+    has_accepted_offer: bool
@@ -0,0 +1,72 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import ValidationError
+
+from app.models.core import CoreModel
+
+
+class Cursor(CoreModel):
+    """
+    Position of the last item of a page, sent to clients as an opaque string
+    """
+    
+    def encode(self) -> str:
+        payload = json.dumps(list(json.loads(self.json()).values())).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+    
+    @classmethod
+    def decode(cls, cursor: str) -> "Cursor":
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            if not isinstance(values, list) or len(values) != len(cls.__fields__):
+                raise ValueError
+            return cls(**dict(zip(cls.__fields__, values)))
+        except (ValueError, TypeError, ValidationError):
+            raise ValueError("Invalid page cursor.")
+
+
+class PageCursor(Cursor):
+    """
+    Lists are ordered newest first by `created_at`, with ties broken by `id`
+    - or whichever column identifies the items in that list.
+    """
+    created_at: datetime
+    id: int
+
+
+class SearchCursor(Cursor):
+    """
+    Search results are ordered by decreasing rank, with ties broken by `id`
+    """
+    rank: float
+    id: int
+
+
+class Pagination(CoreModel):
+    limit: Optional[int]
+    cursor: Optional[PageCursor]
+    
+    def keyset_values(self) -> dict:
+        """
+        Values for the `:after_created_at`, `:after_id` and `:limit` binds of a paginated query.
+        The first page starts after the end of time, and a limit of None fetches every item.
+        """
+        if self.cursor is None:
+            return {"after_created_at": datetime.max.replace(tzinfo=timezone.utc), "after_id": 0, "limit": self.limit}
+        return {"after_created_at": self.cursor.created_at, "after_id": self.cursor.id, "limit": self.limit}
+
+
+class SearchPagination(CoreModel):
+    limit: Optional[int]
+    cursor: Optional[SearchCursor]
+    
+    def keyset_values(self) -> dict:
+        """
+        Values for the `:after_rank`, `:after_id` and `:limit` binds of a paginated search
+        """
+        if self.cursor is None:
+            return {"after_rank": float("inf"), "after_id": 0, "limit": self.limit}
+        return {"after_rank": self.cursor.rank, "after_id": self.cursor.id, "limit": self.limit}
@@ -1,3 +1,4 @@
+from typing import Optional
 from datetime import datetime, timedelta
 from pydantic import EmailStr
 from app.core.config import JWT_AUDIENCE, ACCESS_TOKEN_EXPIRE_MINUTES
@@ -9,6 +10,8 @@ class JWTMeta(CoreModel):
     aud: str = JWT_AUDIENCE
     iat: float = datetime.timestamp(datetime.utcnow())
     exp: float = datetime.timestamp(datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    jti: Optional[str]
+    token_type: str = "access"
 
 
 class JWTCreds(CoreModel):
@@ -17,9 +20,18 @@ class JWTCreds(CoreModel):
     username: str
 
 
-class JWTPayload(JWTMeta, JWTCreds):
+class JWTClaims(CoreModel):
     """
-    JWT Payload right before it's encoded - combine meta and username
+    Embedded in stateless access tokens, so that requests can be authorized without a database lookup
+    """
+    id: Optional[int]
+    is_active: Optional[bool]
+    is_superuser: Optional[bool]
+
+
+class JWTPayload(JWTMeta, JWTCreds, JWTClaims):
+    """
+    JWT Payload right before it's encoded - combine meta, username and any claims
     """
     pass
 
@@ -27,3 +39,4 @@ class JWTPayload(JWTMeta, JWTCreds):
 class AccessToken(CoreModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str]
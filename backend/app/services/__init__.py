@@ -1,3 +1,18 @@
+from app.core.config import (
+    AUTH_USER_CACHE_MAX_SIZE,
+    AUTH_USER_CACHE_TTL_SECONDS,
+    CLEANING_FEED_CACHE_TTL_SECONDS,
+    CLEANING_FACETS_CACHE_MAX_SIZE,
+    CLEANING_FACETS_CACHE_TTL_SECONDS,
+    MAX_PAGE_SIZE,
+)
 from app.services.authentication import AuthService
+from app.services.cache import TTLCache
 
 auth_service = AuthService()
+# populated users looked up by `get_user_from_token`, keyed by username
+authenticated_user_cache = TTLCache(max_size=AUTH_USER_CACHE_MAX_SIZE, ttl=AUTH_USER_CACHE_TTL_SECONDS)
+# first pages of the cleaning feed along with when they were fetched, keyed by page size
+cleaning_feed_cache = TTLCache(max_size=MAX_PAGE_SIZE, ttl=CLEANING_FEED_CACHE_TTL_SECONDS)
+# search facet counts, keyed by the query and its filters
+cleaning_facets_cache = TTLCache(max_size=CLEANING_FACETS_CACHE_MAX_SIZE, ttl=CLEANING_FACETS_CACHE_TTL_SECONDS)
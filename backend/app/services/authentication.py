@@ -1,17 +1,62 @@
 from typing import Type
+import asyncio
+import threading
+import time
+import uuid
 import jwt
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
 from passlib.context import CryptContext
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 from fastapi import HTTPException, status
 from pydantic import ValidationError
 
-from app.core.config import SECRET_KEY, JWT_ALGORITHM, JWT_AUDIENCE, ACCESS_TOKEN_EXPIRE_MINUTES
-from app.models.token import JWTMeta, JWTCreds, JWTPayload
+from app.core.config import (
+    SECRET_KEY,
+    JWT_ALGORITHM,
+    JWT_AUDIENCE,
+    JWT_STATELESS_AUTH,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES,
+    REFRESH_TOKEN_EXPIRE_MINUTES,
+    BCRYPT_ROUNDS,
+    PASSWORD_HASHING_MAX_WORKERS,
+    PASSWORD_HASHING_QUEUE_TIMEOUT_SECONDS,
+)
+from app.db.pool import LatencyHistogram
+from app.models.token import JWTMeta, JWTCreds, JWTClaims, JWTPayload, AccessToken
 from app.models.user import UserPasswordUpdate, UserInDB, UserBase
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def build_pwd_context(*, rounds: int) -> CryptContext:
+    # pinning min and max rounds to the current cost makes passlib flag hashes of any other cost for an update
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def calibrate_bcrypt_rounds(*, target_ms: float, min_rounds: int = 10, max_rounds: int = 20) -> int:
+    """
+    Pick the highest bcrypt cost factor whose hash time on this machine stays within `target_ms`.
+    Each extra round doubles the hash time, so a single timing at `min_rounds` is enough to extrapolate from.
+    """
+    started_at = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=min_rounds))
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+    return rounds
+
+
+pwd_context = build_pwd_context(rounds=BCRYPT_ROUNDS)
 
 
 class AuthException(BaseException):
@@ -21,7 +66,87 @@ class AuthException(BaseException):
     pass
 
 
+class PasswordHashingTimeout(Exception):
+    """
+    Raised when a hashing job waited in the queue for longer than the pool's queue timeout.
+    """
+    pass
+
+
+class PasswordHashingPool:
+    """
+    Runs bcrypt hashing and verification on a bounded thread pool so they don't block the event loop.
+    At most `max_workers` jobs run at once; jobs that wait in the queue longer than `queue_timeout`
+    seconds are dropped without being run.
+    """
+    
+    # upper bounds of the hash latency buckets, in milliseconds
+    LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500)
+    
+    def __init__(self, *, max_workers: int, queue_timeout: float) -> None:
+        self.max_workers = max_workers
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hashing")
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.in_progress = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.hash_latency = LatencyHistogram(buckets_ms=self.LATENCY_BUCKETS_MS)
+    
+    async def run(self, fn: Callable[..., Any], **kwargs: Any) -> Any:
+        with self._lock:
+            self.queue_depth += 1
+        job = partial(self._run_job, fn, kwargs, time.monotonic())
+        return await asyncio.get_running_loop().run_in_executor(self.executor, job)
+    
+    def _run_job(self, fn: Callable[..., Any], kwargs: Dict[str, Any], enqueued_at: float) -> Any:
+        started_at = time.monotonic()
+        with self._lock:
+            self.queue_depth -= 1
+            if started_at - enqueued_at > self.queue_timeout:
+                self.timed_out += 1
+                raise PasswordHashingTimeout()
+            self.in_progress += 1
+        try:
+            return fn(**kwargs)
+        finally:
+            latency_ms = (time.monotonic() - started_at) * 1000
+            with self._lock:
+                self.in_progress -= 1
+                self.completed += 1
+                self.hash_latency.observe(latency_ms)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queue_depth,
+                "in_progress": self.in_progress,
+                "completed": self.completed,
+                "timed_out": self.timed_out,
+                "hash_latency": self.hash_latency.as_dict(),
+            }
+
+
+password_hashing_pool = PasswordHashingPool(
+    max_workers=PASSWORD_HASHING_MAX_WORKERS, queue_timeout=PASSWORD_HASHING_QUEUE_TIMEOUT_SECONDS,
+)
+
+
 class AuthService:
+    def __init__(self, hashing_pool: PasswordHashingPool = password_hashing_pool) -> None:
+        self.hashing_pool = hashing_pool
+        self.pwd_context = pwd_context
+        self.stateless_auth = JWT_STATELESS_AUTH
+    
+    def set_bcrypt_rounds(self, *, rounds: int) -> None:
+        """
+        Hash new passwords with a different cost factor. Hashes stored with any other cost
+        get rehashed the next time their owner logs in.
+        """
+        self.pwd_context = build_pwd_context(rounds=rounds)
+    
     def create_salt_and_hashed_password(self, *, plaintext_password: str) -> UserPasswordUpdate:
         salt = self.generate_salt()
         hashed_password = self.hash_password(password=plaintext_password, salt=salt)
@@ -31,10 +156,39 @@ class AuthService:
         return bcrypt.gensalt().decode()
     
     def hash_password(self, *, password: str, salt: str) -> str:
-        return pwd_context.hash(password + salt)
+        return self.pwd_context.hash(password + salt)
     
     def verify_password(self, *, password: str, salt: str, hashed_pw: str) -> bool:
-        return pwd_context.verify(password + salt, hashed_pw)
+        return self.pwd_context.verify(password + salt, hashed_pw)
+    
+    def verify_and_update_password(self, *, password: str, salt: str, hashed_pw: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify the password and, if it matches but was hashed with an outdated cost factor,
+        also return a fresh hash of it to store in place of the old one.
+        """
+        return self.pwd_context.verify_and_update(password + salt, hashed_pw)
+    
+    async def create_salt_and_hashed_password_in_pool(self, *, plaintext_password: str) -> UserPasswordUpdate:
+        return await self._run_in_hashing_pool(
+            self.create_salt_and_hashed_password, plaintext_password=plaintext_password
+        )
+    
+    async def verify_and_update_password_in_pool(
+            self, *, password: str, salt: str, hashed_pw: str
+    ) -> Tuple[bool, Optional[str]]:
+        return await self._run_in_hashing_pool(
+            self.verify_and_update_password, password=password, salt=salt, hashed_pw=hashed_pw
+        )
+    
+    async def _run_in_hashing_pool(self, fn: Callable[..., Any], **kwargs: Any) -> Any:
+        try:
+            return await self.hashing_pool.run(fn, **kwargs)
+        except PasswordHashingTimeout:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The server is handling too many logins right now. Please try again.",
+                headers={"Retry-After": "1"},
+            )
     
     def create_access_token_for_user(
             self,
@@ -42,33 +196,96 @@ class AuthService:
             user: Type[UserBase],
             secret_key: str = str(SECRET_KEY),
             audience: str = JWT_AUDIENCE,
-            expires_in: int = ACCESS_TOKEN_EXPIRE_MINUTES,
+            expires_in: Optional[int] = None,
+    ) -> str:
+        if not user or not isinstance(user, UserBase):
+            return None
+        if self.stateless_auth:
+            # stateless access tokens are short-lived, since the claims they carry can go stale
+            claims = JWTClaims(id=user.id, is_active=user.is_active, is_superuser=user.is_superuser)
+            expires_in = expires_in or STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES
+        else:
+            claims = JWTClaims()
+            expires_in = expires_in or ACCESS_TOKEN_EXPIRE_MINUTES
+        return self._create_token(
+            user=user,
+            claims=claims,
+            token_type="access",
+            secret_key=secret_key,
+            audience=audience,
+            expires_in=expires_in,
+        )
+    
+    def create_refresh_token_for_user(
+            self,
+            *,
+            user: Type[UserBase],
+            secret_key: str = str(SECRET_KEY),
+            audience: str = JWT_AUDIENCE,
+            expires_in: int = REFRESH_TOKEN_EXPIRE_MINUTES,
     ) -> str:
         if not user or not isinstance(user, UserBase):
             return None
+        return self._create_token(
+            user=user,
+            claims=JWTClaims(),
+            token_type="refresh",
+            secret_key=secret_key,
+            audience=audience,
+            expires_in=expires_in,
+        )
+    
+    def create_tokens_for_user(self, *, user: Type[UserBase]) -> AccessToken:
+        """
+        Access token for the user, along with a refresh token when stateless auth is enabled
+        """
+        return AccessToken(
+            access_token=self.create_access_token_for_user(user=user),
+            refresh_token=self.create_refresh_token_for_user(user=user) if self.stateless_auth else None,
+            token_type="bearer",
+        )
+    
+    def _create_token(
+            self,
+            *,
+            user: Type[UserBase],
+            claims: JWTClaims,
+            token_type: str,
+            secret_key: str,
+            audience: str,
+            expires_in: int,
+    ) -> str:
         jwt_meta = JWTMeta(
             aud=audience,
             iat=datetime.timestamp(datetime.utcnow()),
             exp=datetime.timestamp(datetime.utcnow() + timedelta(minutes=expires_in)),
+            jti=uuid.uuid4().hex,
+            token_type=token_type,
         )
         jwt_creds = JWTCreds(sub=user.email, username=user.username)
         token_payload = JWTPayload(
             **jwt_meta.dict(),
             **jwt_creds.dict(),
+            **claims.dict(),
         )
         # NOTE - previous versions of pyjwt ("<2.0") returned the token as bytes instead of a string.
         # That is no longer the case and the `.decode("utf-8")` has been removed.
-        access_token = jwt.encode(token_payload.dict(), secret_key, algorithm=JWT_ALGORITHM)
+        access_token = jwt.encode(token_payload.dict(exclude_none=True), secret_key, algorithm=JWT_ALGORITHM)
         return access_token
     
-    def get_username_from_token(self, *, token: str, secret_key: str) -> Optional[str]:
+    def get_payload_from_token(self, *, token: str, secret_key: str, token_type: str = "access") -> JWTPayload:
         try:
             decoded_token = jwt.decode(token, str(secret_key), audience=JWT_AUDIENCE, algorithms=[JWT_ALGORITHM])
             payload = JWTPayload(**decoded_token)
         except (jwt.PyJWTError, ValidationError):
+            payload = None
+        if not payload or payload.token_type != token_type:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate token credentials.",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return payload.username
+        return payload
+    
+    def get_username_from_token(self, *, token: str, secret_key: str) -> Optional[str]:
+        return self.get_payload_from_token(token=token, secret_key=secret_key).username
@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Bounded, in-process cache. Entries expire `ttl` seconds after they're set and the
+    least recently used entry is evicted once `max_size` entries are held.
+    A `ttl` of 0 disables the cache entirely.
+    """
+    
+    def __init__(self, *, max_size: int, ttl: float, timer: Callable[[], float] = time.monotonic) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timer = timer
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self.timer():
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        self._entries[key] = (self.timer() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def evict(self, key: Hashable) -> None:
+        if self._entries.pop(key, None) is not None:
+            self.evictions += 1
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -53,7 +53,10 @@ async def create_cleaning_with_evaluated_offer_helper(
     )
     await offers_repo.accept_offer(offer=offer)
     await evals_repo.create_evaluation_for_cleaner(
-        evaluation_create=evaluation_create, cleaning=created_cleaning, cleaner=cleaner,
+        evaluation_create=evaluation_create,
+        cleaning_id=created_cleaning.id,
+        cleaner_username=cleaner.username,
+        requesting_user=owner,
     )
     return created_cleaning
 
@@ -197,6 +200,19 @@ async def test_list_of_cleanings_with_evaluated_offer(
     ]
 
 
+@pytest_asyncio.fixture
+async def test_cleaning_with_no_show_evaluation(
+        db: Database, test_user2: UserInDB, test_user4: UserInDB,
+) -> CleaningInDB:
+    return await create_cleaning_with_evaluated_offer_helper(
+        db=db,
+        owner=test_user2,
+        cleaner=test_user4,
+        cleaning_create=CleaningCreate(name="no show cleaning", price=9.99, cleaning_type="spot_clean"),
+        evaluation_create=EvaluationCreate(no_show=True, overall_rating=0, headline="no show"),
+    )
+
+
 @pytest_asyncio.fixture
 async def test_list_of_cleanings_with_pending_offers(
         db: Database, test_user: UserInDB, test_user_list: List[UserInDB]
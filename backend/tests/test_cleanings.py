@@ -1,14 +1,16 @@
+import uuid
 from typing import List, Dict, Union, Optional, Callable
 
 import pytest
 import pytest_asyncio
 from async_asgi_testclient import TestClient
-from fastapi import FastAPI, status
+from fastapi import FastAPI, HTTPException, status
 from databases import Database
 
 from app.db.repositories.cleanings import CleaningsRepository
-from app.models.cleaning import CleaningCreate, CleaningInDB, CleaningPublic
+from app.models.cleaning import CleaningCreate, CleaningInDB, CleaningPublic, CleaningUpdate
 from app.models.user import UserInDB
+from app.services import cleaning_facets_cache
 
 pytestmark = pytest.mark.asyncio
 
@@ -238,6 +240,18 @@ class TestUpdateCleaning:
             app.url_path_for("cleanings:update-cleaning-by-id", cleaning_id=id), json=cleaning_update
         )
         assert res.status_code == status_code
+    
+    async def test_updating_a_cleaning_deleted_meanwhile_is_not_found(
+            self, client: TestClient, db: Database, test_cleaning: CleaningInDB, test_user: UserInDB,
+    ) -> None:
+        cleanings_repo = CleaningsRepository(db)
+        cleaning = await cleanings_repo.get_cleaning_by_id(
+            id=test_cleaning.id, requesting_user=test_user, populate=False,
+        )
+        await cleanings_repo.delete_cleaning_by_id(id=cleaning.id, requesting_user=test_user)
+        with pytest.raises(HTTPException) as exc_info:
+            await cleanings_repo.update_cleaning(cleaning=cleaning, cleaning_update=CleaningUpdate(price=10))
+        assert exc_info.value.status_code == status.HTTP_404_NOT_FOUND
 
 
 class TestDeleteCleaning:
@@ -257,6 +271,31 @@ class TestDeleteCleaning:
         )
         assert res.status_code == status.HTTP_403_FORBIDDEN
     
+    async def test_delete_is_scoped_to_the_owner(
+            self,
+            app: FastAPI,
+            authorized_client: TestClient,
+            test_cleaning: CleaningInDB,
+            test_cleanings_list: List[CleaningInDB],
+    ) -> None:
+        res = await authorized_client.delete(
+            app.url_path_for("cleanings:delete-cleaning-by-id", cleaning_id=test_cleanings_list[1].id)
+        )
+        assert res.status_code == status.HTTP_403_FORBIDDEN
+        res = await authorized_client.get(
+            app.url_path_for("cleanings:get-cleaning-by-id", cleaning_id=test_cleanings_list[1].id)
+        )
+        assert res.status_code == status.HTTP_200_OK
+        
+        res = await authorized_client.delete(
+            app.url_path_for("cleanings:delete-cleaning-by-id", cleaning_id=test_cleaning.id)
+        )
+        assert res.json() == test_cleaning.id
+        res = await authorized_client.delete(
+            app.url_path_for("cleanings:delete-cleaning-by-id", cleaning_id=test_cleaning.id)
+        )
+        assert res.status_code == status.HTTP_404_NOT_FOUND
+    
     @pytest.mark.parametrize(
         "id, status_code", ((5000000, 404), (0, 422), (-1, 422), (None, 422)),
     )
@@ -318,3 +357,198 @@ class TestPopulatedCleanings:
         assert cleaning.total_offers == len(test_user_list)
         # but no actual offers are included
         assert cleaning.offers == []
+    
+    async def test_batched_population_matches_populating_each_cleaning(
+            self,
+            client: TestClient,
+            db: Database,
+            test_user: UserInDB,
+            test_list_of_cleanings_with_pending_offers: List[CleaningInDB],
+    ) -> None:
+        cleanings_repo = CleaningsRepository(db)
+        cleanings = await cleanings_repo.list_all_user_cleanings(requesting_user=test_user, populate=False)
+        batched = await cleanings_repo.populate_cleanings(
+            cleanings=cleanings, requesting_user=test_user, populate_offers=True,
+        )
+        one_by_one = [
+            await cleanings_repo.populate_cleaning(cleaning=c, requesting_user=test_user, populate_offers=True)
+            for c in cleanings
+        ]
+        assert [c.dict() for c in batched] == [c.dict() for c in one_by_one]
+
+
+class TestCleaningsPagination:
+    async def test_cursors_walk_every_cleaning_exactly_once(
+            self, app: FastAPI, client: TestClient, db: Database, create_authorized_client: Callable,
+            test_user6: UserInDB,
+    ) -> None:
+        cleanings_repo = CleaningsRepository(db)
+        for i in range(5):
+            await cleanings_repo.create_cleaning(
+                new_cleaning=CleaningCreate(name=f"paginated cleaning {i}", price=10.00), requesting_user=test_user6,
+            )
+        expected = await cleanings_repo.list_all_user_cleanings(requesting_user=test_user6, populate=False)
+        
+        authorized_client = create_authorized_client(user=test_user6)
+        seen, params = [], {"limit": 2}
+        while True:
+            res = await authorized_client.get(app.url_path_for("cleanings:list-all-user-cleanings"), query_string=params)
+            assert res.status_code == status.HTTP_200_OK
+            assert res.headers["X-Limit"] == "2"
+            seen.extend(c["id"] for c in res.json())
+            if "X-Next-Cursor" not in res.headers:
+                break
+            params = {"limit": 2, "cursor": res.headers["X-Next-Cursor"]}
+        # newest first, without skipping or repeating any cleaning between pages
+        assert seen == [c.id for c in expected]
+        assert len(seen) >= 5
+    
+    @pytest.mark.parametrize("params", ({"cursor": "not-a-cursor"}, {"limit": 0}, {"limit": 10 ** 6}))
+    async def test_invalid_pagination_is_rejected(
+            self, app: FastAPI, authorized_client: TestClient, params: dict,
+    ) -> None:
+        res = await authorized_client.get(app.url_path_for("cleanings:list-all-user-cleanings"), query_string=params)
+        assert res.status_code in (status.HTTP_400_BAD_REQUEST, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+class TestCleaningsSearch:
+    @pytest_asyncio.fixture
+    async def searchable_cleanings(self, db: Database, test_user2: UserInDB) -> List[CleaningInDB]:
+        cleanings_repo = CleaningsRepository(db)
+        return [
+            await cleanings_repo.create_cleaning(new_cleaning=new_cleaning, requesting_user=test_user2)
+            for new_cleaning in (
+                CleaningCreate(name="Chandelier dusting", description="Crystal", price=80, cleaning_type="dust_up"),
+                CleaningCreate(name="Whole house", description="Chandeliers too", price=300, cleaning_type="full_clean"),
+                CleaningCreate(name="Garage sweep", description="Oil stains", price=40, cleaning_type="spot_clean"),
+                CleaningCreate(name="Chandelier polish", price=120, cleaning_type="spot_clean"),
+            )
+        ]
+    
+    async def test_search_requires_authentication(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.get(app.url_path_for("cleanings:search-cleanings"), query_string={"q": "chandelier"})
+        assert res.status_code == status.HTTP_401_UNAUTHORIZED
+    
+    async def test_matches_are_ranked_with_names_first(
+            self, app: FastAPI, authorized_client: TestClient, searchable_cleanings: List[CleaningInDB],
+    ) -> None:
+        res = await authorized_client.get(
+            app.url_path_for("cleanings:search-cleanings"), query_string={"q": "chandelier"},
+        )
+        assert res.status_code == status.HTTP_200_OK
+        results = res.json()
+        ids = [r["id"] for r in results]
+        expected = {searchable_cleanings[i].id for i in (0, 1, 3)}
+        assert expected <= set(ids)
+        assert searchable_cleanings[2].id not in ids
+        # a match in the description ranks below matches in the name
+        assert ids.index(searchable_cleanings[1].id) > max(ids.index(searchable_cleanings[i].id) for i in (0, 3))
+        assert [r["rank"] for r in results] == sorted((r["rank"] for r in results), reverse=True)
+        assert all(r["owner"]["id"] == searchable_cleanings[0].owner for r in results if r["id"] in expected)
+    
+    @pytest.mark.parametrize(
+        "filters, expected_indexes",
+        (
+            ({"cleaning_type": "spot_clean"}, {3}),
+            ({"min_price": 100}, {1, 3}),
+            ({"max_price": 100}, {0}),
+            ({"min_price": 100, "max_price": 200}, {3}),
+        ),
+    )
+    async def test_results_can_be_filtered_by_type_and_price(
+            self,
+            app: FastAPI,
+            authorized_client: TestClient,
+            searchable_cleanings: List[CleaningInDB],
+            filters: dict,
+            expected_indexes: set,
+    ) -> None:
+        res = await authorized_client.get(
+            app.url_path_for("cleanings:search-cleanings"), query_string={"q": "chandelier", **filters},
+        )
+        assert res.status_code == status.HTTP_200_OK
+        ids = {r["id"] for r in res.json()}
+        searchable_ids = {c.id for c in searchable_cleanings}
+        assert ids & searchable_ids == {searchable_cleanings[i].id for i in expected_indexes}
+    
+    async def test_cursors_walk_every_match_exactly_once(
+            self, app: FastAPI, authorized_client: TestClient, searchable_cleanings: List[CleaningInDB],
+    ) -> None:
+        res = await authorized_client.get(
+            app.url_path_for("cleanings:search-cleanings"), query_string={"q": "chandelier"},
+        )
+        expected = [r["id"] for r in res.json()]
+        
+        seen, params = [], {"q": "chandelier", "limit": 1}
+        while True:
+            res = await authorized_client.get(app.url_path_for("cleanings:search-cleanings"), query_string=params)
+            assert res.status_code == status.HTTP_200_OK
+            seen.extend(r["id"] for r in res.json())
+            if "X-Next-Cursor" not in res.headers:
+                break
+            params = {"q": "chandelier", "limit": 1, "cursor": res.headers["X-Next-Cursor"]}
+        assert seen == expected
+    
+    @pytest.mark.parametrize(
+        "params", ({}, {"q": ""}, {"q": "x", "cursor": "not-a-cursor"}, {"q": "x", "min_price": -1}),
+    )
+    async def test_invalid_searches_are_rejected(
+            self, app: FastAPI, authorized_client: TestClient, params: dict,
+    ) -> None:
+        res = await authorized_client.get(app.url_path_for("cleanings:search-cleanings"), query_string=params)
+        assert res.status_code in (status.HTTP_400_BAD_REQUEST, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+class TestCleaningsDiscovery:
+    @pytest_asyncio.fixture
+    async def faceted_cleanings(self, db: Database, test_user2: UserInDB) -> str:
+        # a word no other cleaning contains, so that the counts only cover these cleanings
+        word = f"facet{uuid.uuid4().hex[:8]}"
+        cleanings_repo = CleaningsRepository(db)
+        for cleaning_type, price in (("dust_up", 20), ("dust_up", 60), ("spot_clean", 60), ("full_clean", 300)):
+            await cleanings_repo.create_cleaning(
+                new_cleaning=CleaningCreate(name=f"{word} job", price=price, cleaning_type=cleaning_type),
+                requesting_user=test_user2,
+            )
+        return word
+    
+    @pytest.mark.parametrize(
+        "filters, total_results, cleaning_type_counts, price_bucket_counts",
+        (
+            ({}, 4, {"dust_up": 2, "spot_clean": 1, "full_clean": 1}, [1, 0, 2, 0, 1]),
+            # each facet is counted without its own filter
+            ({"cleaning_type": "dust_up"}, 2, {"dust_up": 2, "spot_clean": 1, "full_clean": 1}, [1, 0, 1, 0, 0]),
+            ({"min_price": 50}, 3, {"dust_up": 1, "spot_clean": 1, "full_clean": 1}, [1, 0, 2, 0, 1]),
+        ),
+    )
+    async def test_results_come_with_facet_counts(
+            self,
+            app: FastAPI,
+            authorized_client: TestClient,
+            faceted_cleanings: str,
+            filters: dict,
+            total_results: int,
+            cleaning_type_counts: dict,
+            price_bucket_counts: list,
+    ) -> None:
+        res = await authorized_client.get(
+            app.url_path_for("cleanings:discover-cleanings"), query_string={"q": faceted_cleanings, **filters},
+        )
+        assert res.status_code == status.HTTP_200_OK
+        discovery = res.json()
+        assert len(discovery["results"]) == total_results
+        assert discovery["facets"]["cleaning_type"] == cleaning_type_counts
+        assert [bucket["count"] for bucket in discovery["facets"]["price"]] == price_bucket_counts
+        assert [(b["min_price"], b["max_price"]) for b in discovery["facets"]["price"]] == [
+            (None, 25), (25, 50), (50, 100), (100, 250), (250, None),
+        ]
+    
+    async def test_facet_counts_are_cached_per_filters(
+            self, client: TestClient, db: Database, faceted_cleanings: str,
+    ) -> None:
+        cleanings_repo = CleaningsRepository(db)
+        facets = await cleanings_repo.count_cleaning_facets(query=faceted_cleanings)
+        hits = cleaning_facets_cache.hits
+        assert await cleanings_repo.count_cleaning_facets(query=faceted_cleanings) is facets
+        assert cleaning_facets_cache.hits == hits + 1
+        assert await cleanings_repo.count_cleaning_facets(query=faceted_cleanings, min_price=50) != facets
@@ -0,0 +1,107 @@
+from typing import Union
+
+import asyncpg
+import pytest
+import pytest_asyncio
+from async_asgi_testclient import TestClient
+from databases import Database
+from sqlalchemy import literal, select
+
+from app.db import tasks
+from app.db.database import AsyncpgDatabase, PrecompiledDatabase
+from app.db.queries import queries
+from app.db.repositories.cleanings import GET_CLEANING_BY_ID_QUERY, CleaningsRepository
+from app.models.cleaning import CleaningCreate, CleaningUpdate
+from app.models.user import UserInDB
+
+pytestmark = pytest.mark.asyncio
+
+RENAME_CLEANING_QUERY = "UPDATE cleanings SET name = :name WHERE id = :id;"
+GET_CLEANING_NAME_QUERY = "SELECT name FROM cleanings WHERE id = :id;"
+
+
+@pytest_asyncio.fixture(params=list(tasks.DATABASE_BACKENDS))
+async def backend_db(
+        request: pytest.FixtureRequest, client: TestClient, db: Database,
+) -> Union[PrecompiledDatabase, AsyncpgDatabase]:
+    database = tasks.DATABASE_BACKENDS[request.param](str(db.url), min_size=2, max_size=2)
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+@pytest_asyncio.fixture
+async def asyncpg_db(client: TestClient, db: Database) -> AsyncpgDatabase:
+    database = AsyncpgDatabase(str(db.url), min_size=2, max_size=2)
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+class TestDatabaseBackends:
+    async def test_repositories_run_on_either_backend(
+            self, backend_db: Union[PrecompiledDatabase, AsyncpgDatabase], test_user: UserInDB,
+    ) -> None:
+        cleanings_repo = CleaningsRepository(backend_db)
+        created = await cleanings_repo.create_cleaning(
+            new_cleaning=CleaningCreate(name="backend cleaning", price=12.50, cleaning_type="full_clean"),
+            requesting_user=test_user,
+        )
+        cleaning = await cleanings_repo.get_cleaning_by_id(id=created.id, requesting_user=test_user, populate=False)
+        assert (cleaning.name, cleaning.price, cleaning.owner) == ("backend cleaning", 12.50, test_user.id)
+        updated = await cleanings_repo.update_cleaning(cleaning=cleaning, cleaning_update=CleaningUpdate(price=15))
+        assert updated.price == 15
+        user_cleanings = await cleanings_repo.list_all_user_cleanings(requesting_user=test_user, populate=False)
+        assert created.id in [c.id for c in user_cleanings]
+        assert await cleanings_repo.delete_cleaning_by_id(id=created.id, requesting_user=test_user) == created.id
+        assert await cleanings_repo.get_cleaning_by_id(id=created.id, requesting_user=test_user) is None
+    
+    async def test_transactions_commit_or_roll_back(
+            self, backend_db: Union[PrecompiledDatabase, AsyncpgDatabase], test_user: UserInDB,
+    ) -> None:
+        cleaning = await CleaningsRepository(backend_db).create_cleaning(
+            new_cleaning=CleaningCreate(name="transaction cleaning", price=10.00), requesting_user=test_user,
+        )
+        async with backend_db.transaction():
+            await backend_db.execute(query=RENAME_CLEANING_QUERY, values={"id": cleaning.id, "name": "committed"})
+        with pytest.raises(RuntimeError):
+            async with backend_db.transaction():
+                await backend_db.execute(
+                    query=RENAME_CLEANING_QUERY, values={"id": cleaning.id, "name": "rolled back"},
+                )
+                raise RuntimeError
+        assert await backend_db.fetch_val(query=GET_CLEANING_NAME_QUERY, values={"id": cleaning.id}) == "committed"
+    
+    async def test_idle_connections_hold_no_locks(
+            self, backend_db: Union[PrecompiledDatabase, AsyncpgDatabase], db: Database,
+    ) -> None:
+        await backend_db.fetch_val(query=GET_CLEANING_NAME_QUERY, values={"id": 0})
+        async with db.transaction():
+            await db.execute(query="LOCK TABLE cleanings IN ACCESS EXCLUSIVE MODE NOWAIT;")
+
+
+class TestAsyncpgDatabase:
+    async def test_registered_queries_are_prepared_as_connections_open(self, asyncpg_db: AsyncpgDatabase) -> None:
+        async with asyncpg_db.connection() as connection:
+            prepared = await connection.fetch_all(query="SELECT statement FROM pg_prepared_statements;")
+        assert queries.get(GET_CLEANING_BY_ID_QUERY).sql in {record["statement"] for record in prepared}
+    
+    async def test_rows_are_asyncpg_records(self, asyncpg_db: AsyncpgDatabase) -> None:
+        assert isinstance(await asyncpg_db.fetch_one(query="SELECT 1 AS one;"), asyncpg.Record)
+    
+    async def test_only_text_queries_are_run(self, asyncpg_db: AsyncpgDatabase) -> None:
+        with pytest.raises(TypeError):
+            await asyncpg_db.fetch_one(query=select(literal(1)))
+
+
+class TestDatabaseBackendSetting:
+    async def test_the_configured_backend_is_used(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(tasks, "DATABASE_BACKEND", "asyncpg")
+        assert isinstance(tasks.create_database("postgresql://localhost/postgres"), AsyncpgDatabase)
+        monkeypatch.setattr(tasks, "DATABASE_BACKEND", "databases")
+        assert isinstance(tasks.create_database("postgresql://localhost/postgres"), PrecompiledDatabase)
+    
+    async def test_unknown_backends_are_refused(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(tasks, "DATABASE_BACKEND", "sqlite")
+        with pytest.raises(ValueError):
+            tasks.create_database("postgresql://localhost/postgres")
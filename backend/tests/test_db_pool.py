@@ -0,0 +1,164 @@
+import asyncio
+from typing import Callable
+
+import pytest
+import pytest_asyncio
+from async_asgi_testclient import TestClient
+from databases import Database
+from fastapi import Depends, FastAPI, status
+
+from app.api.dependencies import database as database_dependencies
+from app.api.dependencies.database import get_repository, release_request_connection
+from app.core.config import DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE
+from app.db.pool import InstrumentedPool, LatencyHistogram, PoolAcquireTimeout, get_pool, instrument_pool
+from app.db.repositories.users import UsersRepository
+from app.models.cleaning import CleaningInDB
+from app.models.user import UserInDB
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def single_connection_db(client: TestClient, db: Database) -> Database:
+    database = Database(str(db.url), min_size=1, max_size=1)
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+@pytest.fixture
+def connection_routes(app: FastAPI) -> FastAPI:
+    async def count_connections_in_use(users_repo: UsersRepository = Depends(get_repository(UsersRepository))) -> int:
+        await users_repo.get_user_by_id(user_id=1, populate=False)
+        return app.state._db_pool.stats()["in_use"]
+    
+    app.get("/pinned/")(count_connections_in_use)
+    app.get("/released/", dependencies=[Depends(release_request_connection)])(count_connections_in_use)
+    return app
+
+
+@pytest.fixture
+def timeout_routes(app: FastAPI) -> FastAPI:
+    async def time_out_acquiring() -> None:
+        raise PoolAcquireTimeout("No connection was free within 10s")
+    
+    async def time_out_elsewhere() -> None:
+        raise asyncio.TimeoutError
+    
+    app.get("/pool-timeout/")(time_out_acquiring)
+    app.get("/other-timeout/")(time_out_elsewhere)
+    return app
+
+
+def count_acquires(app: FastAPI) -> int:
+    return app.state._db_pool.stats()["acquire_latency"]["count"]
+
+
+class TestLatencyHistogram:
+    async def test_latencies_are_counted_in_the_first_bucket_that_holds_them(self) -> None:
+        histogram = LatencyHistogram(buckets_ms=(1, 10))
+        for latency_ms in (0.5, 1, 5, 50):
+            histogram.observe(latency_ms)
+        assert histogram.as_dict() == {"buckets": {"1": 2, "10": 1, "+Inf": 1}, "count": 4, "sum_ms": 56.5}
+
+
+class TestDatabasePoolRoutes:
+    async def test_pool_stats_are_reported(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.get(app.url_path_for("health:get-db-pool-stats"))
+        assert res.status_code == status.HTTP_200_OK
+        stats = res.json()
+        assert stats["min_size"] == DB_POOL_MIN_SIZE
+        assert stats["max_size"] == DB_POOL_MAX_SIZE
+        assert stats["size"] == stats["in_use"] + stats["idle"]
+        assert stats["waiters"] == 0
+        
+        await app.state._db.fetch_val(query="SELECT 1;")
+        res = await client.get(app.url_path_for("health:get-db-pool-stats"))
+        assert res.json()["acquire_latency"]["count"] > stats["acquire_latency"]["count"]
+    
+    
+    async def test_pool_timeouts_ask_clients_to_retry(self, timeout_routes: FastAPI, client: TestClient) -> None:
+        res = await client.get("/pool-timeout/")
+        assert res.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert res.headers["Retry-After"] == "1"
+    
+    async def test_other_timeouts_are_not_taken_for_pool_timeouts(
+            self, timeout_routes: FastAPI, client: TestClient,
+    ) -> None:
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get("/other-timeout/")
+
+
+class TestInstrumentedPool:
+    async def test_the_apps_connections_go_through_the_instrumented_pool(
+            self, app: FastAPI, client: TestClient, db: Database,
+    ) -> None:
+        assert isinstance(get_pool(db), InstrumentedPool)
+        assert get_pool(db) is app.state._db_pool
+    
+    async def test_acquire_times_out_when_every_connection_is_busy(self, single_connection_db: Database) -> None:
+        pool = instrument_pool(single_connection_db, acquire_timeout=0.1)
+        connection = await pool.acquire()
+        waiting = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert pool.stats()["waiters"] == 1
+        assert pool.stats()["in_use"] == 1
+        with pytest.raises(PoolAcquireTimeout):
+            await waiting
+        await pool.release(connection)
+        stats = pool.stats()
+        assert stats["waiters"] == 0
+        assert stats["acquire_timeouts"] == 1
+        assert stats["in_use"] == 0
+        assert await single_connection_db.fetch_val(query="SELECT 1;") == 1
+    
+    async def test_connections_are_replaced_after_their_lifetime(self, single_connection_db: Database) -> None:
+        instrument_pool(single_connection_db, max_lifetime=0.1)
+        first_pid = await single_connection_db.fetch_val(query="SELECT pg_backend_pid();")
+        await asyncio.sleep(0.2)
+        assert await single_connection_db.fetch_val(query="SELECT pg_backend_pid();") != first_pid
+
+
+class TestRequestConnectionPinning:
+    async def test_requests_acquire_a_single_connection(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            create_authorized_client: Callable,
+            test_user2: UserInDB,
+            test_cleaning_with_offers: CleaningInDB,
+    ) -> None:
+        authorized_client = create_authorized_client(user=test_user2)
+        acquires = count_acquires(app)
+        res = await authorized_client.get(
+            app.url_path_for("offers:list-offers-for-cleaning", cleaning_id=test_cleaning_with_offers.id)
+        )
+        assert res.status_code == status.HTTP_200_OK
+        assert count_acquires(app) == acquires + 1
+    
+    async def test_pinning_can_be_turned_off(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            create_authorized_client: Callable,
+            test_user2: UserInDB,
+            test_cleaning_with_offers: CleaningInDB,
+            monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        authorized_client = create_authorized_client(user=test_user2)
+        monkeypatch.setattr(database_dependencies, "DB_PIN_REQUEST_CONNECTIONS", False)
+        acquires = count_acquires(app)
+        res = await authorized_client.get(
+            app.url_path_for("offers:list-offers-for-cleaning", cleaning_id=test_cleaning_with_offers.id)
+        )
+        assert res.status_code == status.HTTP_200_OK
+        assert count_acquires(app) > acquires + 1
+    
+    @pytest.mark.parametrize("path, in_use", (("/pinned/", 1), ("/released/", 0)))
+    async def test_routes_can_release_the_requests_connection(
+            self, connection_routes: FastAPI, client: TestClient, path: str, in_use: int,
+    ) -> None:
+        res = await client.get(path)
+        assert res.status_code == status.HTTP_200_OK
+        assert res.json() == in_use
+        assert connection_routes.state._db_pool.stats()["in_use"] == 0
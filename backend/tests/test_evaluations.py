@@ -5,10 +5,19 @@ import pytest
 from async_asgi_testclient import TestClient
 from fastapi import FastAPI, status
 
+from app.db.commands import run
+from app.db.repositories.evaluations import EvaluationsRepository
+from app.db.repositories.offers import OffersRepository
 from app.models.cleaning import CleaningInDB
 from app.models.user import UserInDB
 from app.models.offer import OfferInDB
-from app.models.evaluation import EvaluationCreate, EvaluationInDB, EvaluationPublic, EvaluationAggregate
+from app.models.evaluation import (
+    EvaluationCreate,
+    EvaluationInDB,
+    EvaluationPublic,
+    EvaluationAggregate,
+    LeaderboardEntry,
+)
 
 pytestmark = pytest.mark.asyncio
 
@@ -148,6 +157,63 @@ Though the cleaner took their time, I would definitely hire them again for the q
         )
         assert res.status_code == status.HTTP_400_BAD_REQUEST
 
+    
+    @pytest.mark.parametrize(
+        "cleaning_id, username, detail",
+        (
+                (10 ** 6, "test_user3", "No cleaning found with that id."),
+                (None, "nobody_here", "No user found with that username."),
+                (None, "test_user", "Offer not found."),
+        ),
+    )
+    async def test_missing_resources_are_reported_without_evaluating(
+            self,
+            app: FastAPI,
+            create_authorized_client: Callable,
+            test_user: UserInDB,
+            test_user2: UserInDB,
+            test_user3: UserInDB,
+            test_cleaning_with_accepted_offer: CleaningInDB,
+            cleaning_id: int,
+            username: str,
+            detail: str,
+    ) -> None:
+        authorized_client = create_authorized_client(user=test_user2)
+        res = await authorized_client.post(
+            app.url_path_for(
+                "evaluations:create-evaluation-for-cleaner",
+                cleaning_id=cleaning_id or test_cleaning_with_accepted_offer.id,
+                username={"test_user": test_user.username, "test_user3": test_user3.username}.get(username, username),
+            ),
+            json={"evaluation_create": {"overall_rating": 4}},
+        )
+        assert res.status_code == status.HTTP_404_NOT_FOUND
+        assert res.json()["detail"] == detail
+    
+    async def test_forbidden_evaluation_leaves_offer_accepted(
+            self,
+            app: FastAPI,
+            create_authorized_client: Callable,
+            test_user3: UserInDB,
+            test_user4: UserInDB,
+            test_cleaning_with_accepted_offer: CleaningInDB,
+    ) -> None:
+        authorized_client = create_authorized_client(user=test_user4)
+        res = await authorized_client.post(
+            app.url_path_for(
+                "evaluations:create-evaluation-for-cleaner",
+                cleaning_id=test_cleaning_with_accepted_offer.id,
+                username=test_user3.username,
+            ),
+            json={"evaluation_create": {"overall_rating": 5}},
+        )
+        assert res.status_code == status.HTTP_403_FORBIDDEN
+        # the offer is only completed along with the evaluation
+        offer = await OffersRepository(app.state._db).get_offer_for_cleaning_from_user(
+            cleaning=test_cleaning_with_accepted_offer, user=test_user3,
+        )
+        assert offer.status == "accepted"
+
 
 class TestGetEvaluations:
     """
@@ -261,3 +327,132 @@ class TestGetEvaluations:
             app.url_path_for("evaluations:list-evaluations-for-cleaner", username=test_user3.username)
         )
         assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+class TestCleanerRatingAggregates:
+    async def test_rebuild_restores_aggregates_that_drifted_from_evaluations(
+            self,
+            app: FastAPI,
+            create_authorized_client: Callable,
+            test_user3: UserInDB,
+            test_user4: UserInDB,
+            test_list_of_cleanings_with_evaluated_offer: List[CleaningInDB],
+    ) -> None:
+        db = app.state._db
+        evals_repo = EvaluationsRepository(db)
+        assert await evals_repo.list_inconsistent_cleaner_aggregates() == []
+        stats = {**await evals_repo.get_cleaner_aggregates(cleaner=test_user3)}
+        
+        await db.execute(
+            query="UPDATE cleaner_rating_aggregates SET five_stars = five_stars + 1 WHERE cleaner_id = :cleaner_id;",
+            values={"cleaner_id": test_user3.id},
+        )
+        assert await evals_repo.list_inconsistent_cleaner_aggregates() == [test_user3.id]
+        assert await run("check-rating-aggregates") == 1
+        
+        assert await run("rebuild-rating-aggregates") == 0
+        assert await evals_repo.list_inconsistent_cleaner_aggregates() == []
+        assert {**await evals_repo.get_cleaner_aggregates(cleaner=test_user3)} == stats
+        
+        authorized_client = create_authorized_client(user=test_user4)
+        res = await authorized_client.get(
+            app.url_path_for("evaluations:get-stats-for-cleaner", username=test_user3.username)
+        )
+        assert res.status_code == status.HTTP_200_OK
+        assert EvaluationAggregate(**res.json()).five_stars == stats["five_stars"]
+
+
+class TestBulkCleanerStats:
+    async def test_stats_for_many_cleaners_match_their_individual_stats(
+            self,
+            app: FastAPI,
+            create_authorized_client: Callable,
+            test_user3: UserInDB,
+            test_user4: UserInDB,
+            test_user5: UserInDB,
+            test_list_of_cleanings_with_evaluated_offer: List[CleaningInDB],
+    ) -> None:
+        authorized_client = create_authorized_client(user=test_user4)
+        res = await authorized_client.get(
+            app.url_path_for("evaluations:get-stats-for-cleaner", username=test_user3.username)
+        )
+        assert res.status_code == status.HTTP_200_OK
+        stats = res.json()
+        
+        # cleaners without evaluations and unknown usernames are left out
+        res = await authorized_client.get(
+            app.url_path_for("cleaners:list-stats-for-cleaners"),
+            query_string=[
+                ("usernames", f"{test_user3.username},{test_user5.username}"),
+                ("usernames", "nobodyatall"),
+            ],
+        )
+        assert res.status_code == status.HTTP_200_OK
+        assert res.json() == [{**stats, "cleaner_id": test_user3.id, "username": test_user3.username}]
+    
+    @pytest.mark.parametrize("usernames", ("no", "not a username", ",".join(f"cleaner{i}" for i in range(301))))
+    async def test_invalid_usernames_are_rejected(
+            self, app: FastAPI, authorized_client: TestClient, usernames: str,
+    ) -> None:
+        res = await authorized_client.get(
+            app.url_path_for("cleaners:list-stats-for-cleaners"), query_string={"usernames": usernames},
+        )
+        assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestCleanerLeaderboard:
+    async def test_leaderboard_ranks_cleaners_by_smoothed_rating(
+            self,
+            app: FastAPI,
+            authorized_client: TestClient,
+            test_list_of_cleanings_with_evaluated_offer: List[CleaningInDB],
+    ) -> None:
+        db = app.state._db
+        await EvaluationsRepository(db).refresh_leaderboard()
+        aggregates = await db.fetch_all(query="SELECT * FROM cleaner_rating_aggregates;")
+        mean_rating = sum(a["sum_overall_rating"] for a in aggregates) / sum(a["total_evaluations"] for a in aggregates)
+        expected_scores = {
+            a["cleaner_id"]: (10 * mean_rating + a["sum_overall_rating"]) / (10 + a["total_evaluations"])
+            for a in aggregates
+        }
+        
+        res = await authorized_client.get(app.url_path_for("cleaners:get-leaderboard"))
+        assert res.status_code == status.HTTP_200_OK
+        leaderboard = [LeaderboardEntry(**e) for e in res.json()]
+        assert [e.rank for e in leaderboard] == list(range(1, len(expected_scores) + 1))
+        assert [e.score for e in leaderboard] == sorted((e.score for e in leaderboard), reverse=True)
+        for entry in leaderboard:
+            assert entry.score == pytest.approx(expected_scores[entry.cleaner.id])
+    
+    async def test_leaderboard_is_filtered_and_paginated_by_rank(
+            self,
+            app: FastAPI,
+            authorized_client: TestClient,
+            test_user4: UserInDB,
+            test_list_of_cleanings_with_evaluated_offer: List[CleaningInDB],
+            test_cleaning_with_no_show_evaluation: CleaningInDB,
+    ) -> None:
+        await EvaluationsRepository(app.state._db).refresh_leaderboard()
+        
+        seen, params = [], {"limit": 1}
+        while True:
+            res = await authorized_client.get(app.url_path_for("cleaners:get-leaderboard"), query_string=params)
+            assert res.status_code == status.HTTP_200_OK
+            seen.extend(e["rank"] for e in res.json())
+            if "X-Next-Cursor" not in res.headers:
+                break
+            params = {"limit": 1, "cursor": res.headers["X-Next-Cursor"]}
+        assert seen == list(range(1, len(seen) + 1))
+        assert len(seen) >= 2
+        
+        res = await authorized_client.get(
+            app.url_path_for("cleaners:get-leaderboard"), query_string={"max_no_show_rate": 0},
+        )
+        assert all(e["no_show_rate"] == 0 for e in res.json())
+        assert test_user4.id not in [e["cleaner"]["id"] for e in res.json()]
+        
+        res = await authorized_client.get(
+            app.url_path_for("cleaners:get-leaderboard"), query_string={"min_evaluations": 5},
+        )
+        assert all(e["total_evaluations"] >= 5 for e in res.json())
+        assert test_user4.id not in [e["cleaner"]["id"] for e in res.json()]
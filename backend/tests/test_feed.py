@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List
+
+import pytest
+from async_asgi_testclient import TestClient
+from databases import Database
+from fastapi import FastAPI, status
+
+from app.db.loaders import Loaders
+from app.db.repositories.cleanings import CleaningsRepository
+from app.db.repositories.feed import FeedRepository
+from app.models.cleaning import CleaningCreate, CleaningInDB, CleaningUpdate
+from app.models.pagination import Pagination
+from app.models.user import UserInDB
+from app.services import cleaning_feed_cache
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture(autouse=True)
+def clear_cleaning_feed_cache() -> None:
+    cleaning_feed_cache.clear()
+
+
+async def list_feed_ids(db: Database) -> List[int]:
+    records = await db.fetch_all(query="SELECT id FROM cleanings ORDER BY updated_at DESC, id DESC;")
+    return [record["id"] for record in records]
+
+
+class TestFeedRoutes:
+    async def test_routes_exist(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.get(app.url_path_for("feed:get-cleaning-feed-for-user"))
+        assert res.status_code != status.HTTP_404_NOT_FOUND
+    
+    async def test_unauthenticated_users_cannot_access_the_feed(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.get(app.url_path_for("feed:get-cleaning-feed-for-user"))
+        assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+class TestCleaningFeed:
+    async def test_feed_items_are_populated_and_newest_first(
+            self,
+            app: FastAPI,
+            authorized_client: TestClient,
+            db: Database,
+            test_cleaning_with_offers: CleaningInDB,
+            test_user2: UserInDB,
+    ) -> None:
+        res = await authorized_client.get(
+            app.url_path_for("feed:get-cleaning-feed-for-user"), query_string={"page_chunk_size": 5},
+        )
+        assert res.status_code == status.HTTP_200_OK
+        feed = res.json()
+        assert [item["id"] for item in feed] == (await list_feed_ids(db))[:5]
+        item = next(item for item in feed if item["id"] == test_cleaning_with_offers.id)
+        assert item["event_type"] == "is_create"
+        assert item["owner"]["username"] == test_user2.username
+        assert item["owner"]["profile"] is not None
+        assert item["total_offers"] == 4
+        assert item["offers"] == []
+    
+    async def test_updated_cleanings_move_to_the_top_of_the_feed(
+            self, app: FastAPI, authorized_client: TestClient, db: Database, test_cleaning: CleaningInDB,
+    ) -> None:
+        cleanings_repo = CleaningsRepository(db)
+        await cleanings_repo.update_cleaning(cleaning=test_cleaning, cleaning_update=CleaningUpdate(price=12.50))
+        res = await authorized_client.get(app.url_path_for("feed:get-cleaning-feed-for-user"))
+        assert res.status_code == status.HTTP_200_OK
+        newest = res.json()[0]
+        assert newest["id"] == test_cleaning.id
+        assert newest["event_type"] == "is_update"
+        assert newest["price"] == 12.50
+    
+    @pytest.mark.parametrize("follow", ("cursor", "starting_date"))
+    async def test_pages_walk_every_cleaning_exactly_once(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            db: Database,
+            create_authorized_client: Callable,
+            test_user6: UserInDB,
+            follow: str,
+    ) -> None:
+        cleanings_repo = CleaningsRepository(db)
+        for i in range(3):
+            await cleanings_repo.create_cleaning(
+                new_cleaning=CleaningCreate(name=f"feed cleaning {i}", price=10.00), requesting_user=test_user6,
+            )
+        expected = await list_feed_ids(db)
+        
+        authorized_client = create_authorized_client(user=test_user6)
+        seen, params = [], {"page_chunk_size": 2}
+        while True:
+            res = await authorized_client.get(app.url_path_for("feed:get-cleaning-feed-for-user"), query_string=params)
+            assert res.status_code == status.HTTP_200_OK
+            feed = res.json()
+            seen.extend(item["id"] for item in feed)
+            if len(feed) < 2:
+                assert "X-Next-Cursor" not in res.headers
+                break
+            if follow == "cursor":
+                params = {"page_chunk_size": 2, "cursor": res.headers["X-Next-Cursor"]}
+            else:
+                params = {"page_chunk_size": 2, "starting_date": feed[-1]["event_timestamp"]}
+        assert seen == expected
+    
+    @pytest.mark.parametrize(
+        "params", ({"cursor": "not-a-cursor"}, {"page_chunk_size": 0}, {"page_chunk_size": 10 ** 6}),
+    )
+    async def test_invalid_pagination_is_rejected(
+            self, app: FastAPI, authorized_client: TestClient, params: dict,
+    ) -> None:
+        res = await authorized_client.get(app.url_path_for("feed:get-cleaning-feed-for-user"), query_string=params)
+        assert res.status_code in (status.HTTP_400_BAD_REQUEST, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+
+class TestCleaningFeedQueries:
+    async def test_pages_are_populated_in_a_constant_number_of_queries(
+            self, client: TestClient, db: Database, test_cleaning_with_offers: CleaningInDB, test_user: UserInDB,
+    ) -> None:
+        for i in range(10):
+            await CleaningsRepository(db).create_cleaning(
+                new_cleaning=CleaningCreate(name=f"feed cleaning {i}", price=10.00), requesting_user=test_user,
+            )
+        queries = []
+        fetch_all = db.fetch_all
+        
+        async def count_fetch_all(*args, **kwargs):
+            queries.append(args)
+            return await fetch_all(*args, **kwargs)
+        
+        db.fetch_all = count_fetch_all
+        try:
+            for limit in (1, 10):
+                queries.clear()
+                feed = await FeedRepository(db, Loaders(db)).list_cleaning_feed(pagination=Pagination(limit=limit))
+                assert len(feed) == limit
+                # the page, its owners with their profiles, and its offer counts
+                assert len(queries) == 3
+        finally:
+            del db.fetch_all
+    
+    async def test_first_page_is_shared_until_the_feed_changes(
+            self, client: TestClient, db: Database, test_user: UserInDB,
+    ) -> None:
+        feed_repo = FeedRepository(db)
+        first_page = await feed_repo.get_cleaning_feed(pagination=Pagination(limit=3))
+        hits = cleaning_feed_cache.hits
+        # clients start the feed at their own "now"
+        starting_date = Pagination.parse_obj(
+            {"limit": 3, "cursor": {"created_at": datetime.now(timezone.utc) + timedelta(seconds=1), "id": 0}}
+        )
+        assert await feed_repo.get_cleaning_feed(pagination=starting_date) is first_page
+        assert await feed_repo.get_cleaning_feed(pagination=Pagination(limit=3)) is first_page
+        assert cleaning_feed_cache.hits == hits + 2
+        
+        new_cleaning = await CleaningsRepository(db).create_cleaning(
+            new_cleaning=CleaningCreate(name="newest cleaning", price=10.00), requesting_user=test_user,
+        )
+        assert (await feed_repo.get_cleaning_feed(pagination=Pagination(limit=3)))[0].id == new_cleaning.id
+    
+    async def test_pages_after_the_first_are_not_served_from_the_cache(
+            self, client: TestClient, db: Database,
+    ) -> None:
+        feed_repo = FeedRepository(db)
+        first_page = await feed_repo.get_cleaning_feed(pagination=Pagination(limit=3))
+        next_page = await feed_repo.get_cleaning_feed(
+            pagination=Pagination.parse_obj(
+                {"limit": 3, "cursor": {"created_at": first_page[-1].event_timestamp, "id": first_page[-1].id}}
+            )
+        )
+        assert not {item.id for item in first_page} & {item.id for item in next_page}
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Dict, List
+
+import pytest
+from async_asgi_testclient import TestClient
+from databases import Database
+
+from app.db.loaders import DataLoader, Loaders
+from app.db.repositories.offers import OffersRepository
+from app.models.cleaning import CleaningInDB
+from app.models.user import UserInDB
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestDataLoader:
+    async def test_loads_in_the_same_tick_are_batched_and_memoized(self) -> None:
+        batches: List[List[int]] = []
+        
+        async def batch_load_fn(keys: List[int]) -> Dict[int, int]:
+            batches.append(keys)
+            return {key: key * 10 for key in keys if key != 3}
+        
+        loader = DataLoader(batch_load_fn)
+        assert await asyncio.gather(loader.load(1), loader.load(2), loader.load(1), loader.load(3)) == [10, 20, 10, None]
+        assert batches == [[1, 2, 3]]
+        # memoized keys don't hit the batch function again
+        assert await loader.load_many([2, 1, 4]) == [20, 10, 40]
+        assert batches == [[1, 2, 3], [4]]
+    
+    async def test_primed_values_are_returned_without_loading(self) -> None:
+        async def batch_load_fn(keys: List[int]) -> Dict[int, int]:
+            raise AssertionError("primed keys should not be loaded")
+        
+        loader = DataLoader(batch_load_fn)
+        loader.prime(1, "primed")
+        assert await loader.load(1) == "primed"
+    
+    async def test_errors_are_raised_for_every_key_in_the_batch_and_not_memoized(self) -> None:
+        calls = 0
+        
+        async def batch_load_fn(keys: List[int]) -> Dict[int, int]:
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise ValueError("boom")
+            return {key: key for key in keys}
+        
+        loader = DataLoader(batch_load_fn)
+        results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert await loader.load(1) == 1
+
+
+class TestRequestLoaders:
+    async def test_offer_users_and_their_profiles_are_loaded_in_one_query(
+            self,
+            client: TestClient,
+            db: Database,
+            test_cleaning_with_offers: CleaningInDB,
+            test_user_list: List[UserInDB],
+    ) -> None:
+        loaders = Loaders(db)
+        batches = {"users": 0, "profiles": 0}
+        batch_load_users, batch_load_profiles = loaders.users.batch_load_fn, loaders.profiles.batch_load_fn
+        
+        async def count_users(keys: List[int]) -> dict:
+            batches["users"] += 1
+            return await batch_load_users(keys)
+        
+        async def count_profiles(keys: List[int]) -> dict:
+            batches["profiles"] += 1
+            return await batch_load_profiles(keys)
+        
+        loaders.users.batch_load_fn, loaders.profiles.batch_load_fn = count_users, count_profiles
+        offers_repo = OffersRepository(db, loaders)
+        
+        offers = await offers_repo.list_offers_for_cleaning(cleaning=test_cleaning_with_offers)
+        assert len(offers) == len(test_user_list)
+        assert all(offer.user.profile is not None for offer in offers)
+        # populating the same users again is served from the loaders
+        await offers_repo.list_offers_for_cleaning(cleaning=test_cleaning_with_offers)
+        # profiles are fetched along with the users
+        assert batches == {"users": 1, "profiles": 0}
@@ -1,15 +1,19 @@
 from typing import List, Callable
+import asyncio
 import random
 
 import pytest
 from async_asgi_testclient import TestClient
-from fastapi import FastAPI, status
+from databases import Database
+from fastapi import FastAPI, HTTPException, status
 
 from app.db.repositories.offers import OffersRepository
+from app.db.repositories.authorization import AuthorizationRepository
+from app.db.repositories.cleanings import CleaningsRepository
 
 from app.models.cleaning import CleaningCreate, CleaningInDB
 from app.models.user import UserInDB
-from app.models.offer import OfferCreate, OfferUpdate, OfferInDB, OfferPublic
+from app.models.offer import OfferCreate, OfferUpdate, OfferInDB, OfferPublic, OfferAuthorization
 
 pytestmark = pytest.mark.asyncio
 
@@ -270,6 +274,61 @@ class TestAcceptOffers:
             else:
                 assert offer.status == "rejected"
 
+    
+    async def test_concurrent_accepts_leave_a_single_accepted_offer(
+            self,
+            client: TestClient,
+            db: Database,
+            test_user_list: List[UserInDB],
+            test_cleaning_with_offers: CleaningInDB,
+    ) -> None:
+        offers_repo = OffersRepository(db)
+        offers = await offers_repo.list_offers_for_cleaning(cleaning=test_cleaning_with_offers, populate=False)
+        results = await asyncio.gather(
+            *[offers_repo.accept_offer(offer=offer) for offer in offers], return_exceptions=True
+        )
+        accepted = [r for r in results if isinstance(r, OfferPublic)]
+        assert len(accepted) == 1
+        assert all(isinstance(r, HTTPException) and r.status_code == 400 for r in results if r not in accepted)
+        # the accepted offer comes back with its user and profile
+        assert accepted[0].user.profile is not None
+        
+        offers = await offers_repo.list_offers_for_cleaning(cleaning=test_cleaning_with_offers, populate=False)
+        assert sorted(offer.status for offer in offers) == ["accepted"] + ["rejected"] * (len(test_user_list) - 1)
+
+
+class TestOfferAuthorization:
+    async def test_offer_authorization_is_fetched_in_one_query(
+            self,
+            client: TestClient,
+            db: Database,
+            test_user2: UserInDB,
+            test_user3: UserInDB,
+            test_user4: UserInDB,
+            test_cleaning_with_accepted_offer: CleaningInDB,
+    ) -> None:
+        authorization_repo = AuthorizationRepository(db)
+        accepted = await authorization_repo.get_offer_authorization(
+            cleaning_id=test_cleaning_with_accepted_offer.id, username=test_user3.username,
+        )
+        assert accepted == OfferAuthorization(
+            cleaning_owner=test_user2.id, user_id=test_user3.id, offer_status="accepted", has_accepted_offer=True,
+        )
+        rejected = await authorization_repo.get_offer_authorization(
+            cleaning_id=test_cleaning_with_accepted_offer.id, username=test_user4.username,
+        )
+        assert rejected.offer_status == "rejected"
+        # the cleaning owner never made an offer
+        no_offer = await authorization_repo.get_offer_authorization(
+            cleaning_id=test_cleaning_with_accepted_offer.id, username=test_user2.username,
+        )
+        assert no_offer.user_id == test_user2.id and no_offer.offer_status is None
+        missing_user = await authorization_repo.get_offer_authorization(
+            cleaning_id=test_cleaning_with_accepted_offer.id, username="nobody_here",
+        )
+        assert missing_user.user_id is None
+        assert await authorization_repo.get_offer_authorization(cleaning_id=10 ** 6, username=test_user3.username) is None
+
 
 class TestCancelOffers:
     async def test_user_can_cancel_offer_after_it_has_been_accepted(
@@ -347,6 +406,24 @@ class TestRescindOffers:
             assert offer.user_id in user_ids
             assert offer.user_id != test_user4.id
     
+    async def test_rescinding_offer_does_not_populate_cleaning(
+            self,
+            app: FastAPI,
+            create_authorized_client: Callable,
+            test_user5: UserInDB,
+            test_cleaning_with_offers: CleaningInDB,
+            monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        async def populate_cleaning(*args, **kwargs) -> None:
+            raise AssertionError("permission checks should only need the bare cleaning")
+        
+        monkeypatch.setattr(CleaningsRepository, "populate_cleaning", populate_cleaning)
+        authorized_client = create_authorized_client(user=test_user5)
+        res = await authorized_client.delete(
+            app.url_path_for("offers:rescind-offer-from-user", cleaning_id=test_cleaning_with_offers.id)
+        )
+        assert res.status_code == status.HTTP_200_OK
+    
     async def test_users_cannot_rescind_accepted_offers(
             self,
             app: FastAPI,
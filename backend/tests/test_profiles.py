@@ -5,6 +5,7 @@ from async_asgi_testclient import TestClient
 
 from app.models.user import UserInDB, UserPublic
 from app.models.profile import ProfileInDB, ProfilePublic
+from app.db.repositories.base import build_partial_update_query
 from app.db.repositories.profiles import ProfilesRepository
 
 pytestmark = pytest.mark.asyncio
@@ -108,3 +109,35 @@ class TestProfileManagement:
             app.url_path_for("profiles:update-own-profile"), json={"profile_update": {attr: value}},
         )
         assert res.status_code == status_code
+    
+    async def test_only_the_fields_sent_are_written(
+            self, app: FastAPI, authorized_client: TestClient, db: Database, test_user: UserInDB,
+    ) -> None:
+        res = await authorized_client.put(
+            app.url_path_for("profiles:update-own-profile"),
+            json={"profile_update": {"full_name": "Partial Kane", "bio": "Before"}},
+        )
+        assert res.status_code == status.HTTP_200_OK
+        res = await authorized_client.put(
+            app.url_path_for("profiles:update-own-profile"), json={"profile_update": {"bio": "After"}},
+        )
+        assert res.status_code == status.HTTP_200_OK
+        profile = ProfilePublic(**res.json())
+        assert profile.full_name == "Partial Kane"
+        assert profile.bio == "After"
+
+
+class TestPartialUpdateQuery:
+    async def test_only_given_columns_are_set(self) -> None:
+        query = build_partial_update_query(
+            table="profiles", columns=("bio",), where=("user_id",), returning="id, bio",
+        )
+        assert query == "UPDATE profiles SET bio = :set_bio WHERE user_id = :where_user_id RETURNING id, bio;"
+        query = build_partial_update_query(table="profiles", columns=(), where=("user_id",), returning="id, bio")
+        assert query == "SELECT id, bio FROM profiles WHERE user_id = :where_user_id;"
+    
+    async def test_invalid_identifiers_are_rejected(self) -> None:
+        with pytest.raises(ValueError):
+            build_partial_update_query(
+                table="profiles", columns=("bio = NULL; --",), where=("user_id",), returning="id",
+            )
@@ -0,0 +1,97 @@
+from typing import Callable, Union
+
+import pytest
+import pytest_asyncio
+from async_asgi_testclient import TestClient
+from databases import Database
+from databases.backends.postgres import PostgresConnection
+from fastapi import FastAPI, status
+
+from app.db.database import AsyncpgDatabase, PrecompiledDatabase
+from app.db.queries import CompiledQuery, QueryParameterError, QueryRegistry, queries
+from app.db.repositories.cleanings import GET_CLEANING_BY_ID_QUERY, CleaningsRepository
+from app.models.cleaning import CleaningInDB
+from app.models.user import UserInDB
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def plain_db(client: TestClient, db: Database) -> Database:
+    # compiles every query itself, whichever backend the app runs on
+    database = Database(str(db.url), min_size=1, max_size=1)
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+class TestCompiledQuery:
+    async def test_parameters_are_numbered_once_each(self) -> None:
+        query = CompiledQuery("QUERY", "SELECT count(*)::int + :b FROM cleanings WHERE name LIKE '%' || :a AND :b > 0;")
+        assert query.parameters == ("a", "b")
+        assert query.sql == "SELECT count(*)::int + $2 FROM cleanings WHERE name LIKE '%' || $1 AND $2 > 0;"
+        assert query.arguments({"a": 1, "b": 2}) == [1, 2]
+    
+    @pytest.mark.parametrize("values", ({"a": 1}, {"a": 1, "b": 2, "c": 3}, None))
+    async def test_values_have_to_match_the_parameters(self, values: dict) -> None:
+        query = CompiledQuery("QUERY", "SELECT :a + :b;")
+        with pytest.raises(QueryParameterError):
+            query.arguments(values)
+    
+    async def test_modules_register_their_query_constants(self) -> None:
+        registry = QueryRegistry()
+        registry.register_module(
+            {"GET_QUERY": "SELECT :id;", "SELECT_COLUMNS": "id, name", "OTHER_QUERY": "SELECT :id;", "count": 1}
+        )
+        assert len(registry) == 1
+        assert registry.get("SELECT :id;").parameters == ("id",)
+        assert registry.get("id, name") is None
+
+
+class TestRegisteredQueries:
+    async def test_every_query_is_valid_sql_for_the_schema(self, client: TestClient, db: Database) -> None:
+        has_pg_trgm = await CleaningsRepository(db).has_pg_trgm()
+        async with db.connection() as connection:
+            for query in queries:
+                if "FUZZY" in query.name and not has_pg_trgm:
+                    continue
+                statement = await connection.raw_connection.prepare(query.sql)
+                assert len(statement.get_parameters()) == len(query.parameters), query.name
+    
+    async def test_rows_are_the_same_as_through_databases(
+            self,
+            client: TestClient,
+            db: Union[PrecompiledDatabase, AsyncpgDatabase],
+            plain_db: Database,
+            test_cleaning: CleaningInDB,
+    ) -> None:
+        values = {"id": test_cleaning.id}
+        assert db.registry.get(GET_CLEANING_BY_ID_QUERY) is not None
+        assert {**await db.fetch_one(query=GET_CLEANING_BY_ID_QUERY, values=values)} == {
+            **(await plain_db.fetch_one(query=GET_CLEANING_BY_ID_QUERY, values=values))._mapping
+        }
+        assert await db.fetch_val(query=GET_CLEANING_BY_ID_QUERY, values=values) == test_cleaning.id
+    
+    async def test_requests_compile_no_queries(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            create_authorized_client: Callable,
+            test_user2: UserInDB,
+            test_cleaning_with_offers: CleaningInDB,
+            monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        compiled = []
+        compile_query = PostgresConnection._compile
+        
+        def count_compiles(self, query):
+            compiled.append(query)
+            return compile_query(self, query)
+        
+        monkeypatch.setattr(PostgresConnection, "_compile", count_compiles)
+        authorized_client = create_authorized_client(user=test_user2)
+        res = await authorized_client.get(
+            app.url_path_for("cleanings:get-cleaning-by-id", cleaning_id=test_cleaning_with_offers.id)
+        )
+        assert res.status_code == status.HTTP_200_OK
+        assert compiled == []
@@ -1,4 +1,7 @@
 from typing import Union, Type, Optional
+import asyncio
+import threading
+import time
 import pytest
 import jwt
 from pydantic import ValidationError
@@ -14,8 +17,11 @@ from starlette.status import (
 )
 from app.models.user import UserInDB, UserPublic
 from app.db.repositories.users import UsersRepository
-from app.services import auth_service
-from app.core.config import SECRET_KEY, JWT_ALGORITHM, JWT_AUDIENCE, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.db.repositories.tokens import TokensRepository
+from app.services import auth_service, authenticated_user_cache
+from app.services.cache import TTLCache
+from app.services.authentication import PasswordHashingPool, PasswordHashingTimeout, calibrate_bcrypt_rounds
+from app.core.config import SECRET_KEY, JWT_ALGORITHM, JWT_AUDIENCE, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS
 
 pytestmark = pytest.mark.asyncio
 
@@ -84,6 +90,38 @@ class TestUserRegistration:
         res = await client.post(app.url_path_for("users:register-new-user"), json={"new_user": new_user})
         assert res.status_code == status_code
     
+    @pytest.mark.parametrize(
+        "attr, value, detail",
+        (
+                ("email", "random@mail.com", "That email is already taken."),
+                ("username", "random", "That username is already taken."),
+        )
+    )
+    async def test_taken_credentials_are_reported_without_creating_anything(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            db: Database,
+            attr: str,
+            value: str,
+            detail: str,
+    ) -> None:
+        profiles_count = await db.fetch_val("SELECT COUNT(*) FROM profiles;")
+        new_user = {"email": "unique@mail.com", "username": "unique_username", "password": "freepassword", attr: value}
+        res = await client.post(app.url_path_for("users:register-new-user"), json={"new_user": new_user})
+        assert res.status_code == 400
+        assert res.json()["detail"].startswith(detail)
+        # the profile insert is rolled back along with the user
+        assert await db.fetch_val("SELECT COUNT(*) FROM profiles;") == profiles_count
+    
+    async def test_registered_user_is_returned_with_profile(self, app: FastAPI, client: TestClient) -> None:
+        new_user = {"email": "profiled@mail.com", "username": "profiled", "password": "longpassword"}
+        res = await client.post(app.url_path_for("users:register-new-user"), json={"new_user": new_user})
+        assert res.status_code == HTTP_201_CREATED
+        created_user = UserPublic(**res.json())
+        assert created_user.profile is not None
+        assert created_user.profile.user_id == created_user.id
+    
     async def test_users_saved_password_is_hashed_and_has_salt(
             self,
             app: FastAPI,
@@ -110,6 +148,22 @@ class TestUserRegistration:
         )
 
 
+class TestUserLookups:
+    async def test_joined_lookups_return_user_populated_with_profile(
+            self, app: FastAPI, client: TestClient, db: Database, test_user: UserInDB,
+    ) -> None:
+        user_repo = UsersRepository(db)
+        user_in_db = await user_repo.get_user_by_id(user_id=test_user.id, populate=False)
+        assert isinstance(user_in_db, UserInDB)
+        expected = await user_repo.populate_user(user=user_in_db)
+        assert expected.profile is not None
+        assert await user_repo.get_user_by_id(user_id=test_user.id) == expected
+        assert await user_repo.get_user_by_email(email=test_user.email) == expected
+        assert await user_repo.get_user_by_username(username=test_user.username) == expected
+        assert await user_repo.get_users_by_ids(user_ids=[test_user.id, test_user.id]) == [expected]
+        assert await user_repo.get_user_by_id(user_id=5000000) is None
+
+
 class TestAuthTokens:
     async def test_can_create_access_token_successfully(
             self, app: FastAPI, client: TestClient, test_user: UserInDB
@@ -193,6 +247,64 @@ class TestAuthTokens:
             username = auth_service.get_username_from_token(token=wrong_token, secret_key=str(secret))
 
 
+class TestPasswordHashingPool:
+    async def test_hashing_runs_off_the_event_loop_thread(self) -> None:
+        pool = PasswordHashingPool(max_workers=2, queue_timeout=5)
+        hashed = await pool.run(auth_service.hash_password, password="tottenham", salt="salt")
+        assert auth_service.verify_password(password="tottenham", salt="salt", hashed_pw=hashed)
+        assert await pool.run(threading.get_ident) != threading.get_ident()
+        stats = pool.stats()
+        assert stats["completed"] == 2
+        assert stats["queue_depth"] == 0
+        assert stats["hash_latency"]["count"] == 2
+    
+    async def test_jobs_queued_past_the_timeout_are_dropped(self) -> None:
+        pool = PasswordHashingPool(max_workers=1, queue_timeout=0.01)
+        results = await asyncio.gather(
+            pool.run(lambda: time.sleep(0.1)), pool.run(lambda: "never runs"), return_exceptions=True,
+        )
+        assert results[0] is None
+        assert isinstance(results[1], PasswordHashingTimeout)
+        assert pool.stats()["timed_out"] == 1
+    
+    async def test_hashing_stats_are_reported(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.get(app.url_path_for("health:get-password-hashing-stats"))
+        assert res.status_code == HTTP_200_OK
+        stats = res.json()
+        assert stats["max_workers"] == auth_service.hashing_pool.max_workers
+        
+        await auth_service.create_salt_and_hashed_password_in_pool(plaintext_password="tottenham")
+        res = await client.get(app.url_path_for("health:get-password-hashing-stats"))
+        assert res.json()["completed"] == stats["completed"] + 1
+        assert res.json()["hash_latency"]["count"] == stats["hash_latency"]["count"] + 1
+
+
+class TestPasswordHashingCost:
+    async def test_calibration_picks_cost_within_target_hash_time(self) -> None:
+        assert calibrate_bcrypt_rounds(target_ms=0, min_rounds=4) == 4
+        assert calibrate_bcrypt_rounds(target_ms=float("inf"), min_rounds=4, max_rounds=8) == 8
+    
+    async def test_login_rehashes_passwords_stored_with_an_outdated_cost(
+            self, app: FastAPI, client: TestClient, db: Database, test_user: UserInDB,
+    ) -> None:
+        user_repo = UsersRepository(db)
+        auth_service.set_bcrypt_rounds(rounds=5)
+        try:
+            assert await user_repo.authenticate_user(email=test_user.email, password="tottenham")
+            user_in_db = await user_repo.get_user_by_email(email=test_user.email, populate=False)
+            assert user_in_db.password.startswith("$2b$05$")
+            # a wrong password never updates the stored hash
+            auth_service.set_bcrypt_rounds(rounds=6)
+            assert await user_repo.authenticate_user(email=test_user.email, password="wrong") is None
+            user_in_db = await user_repo.get_user_by_email(email=test_user.email, populate=False)
+            assert user_in_db.password.startswith("$2b$05$")
+        finally:
+            auth_service.set_bcrypt_rounds(rounds=BCRYPT_ROUNDS)
+        assert await user_repo.authenticate_user(email=test_user.email, password="tottenham")
+        user_in_db = await user_repo.get_user_by_email(email=test_user.email, populate=False)
+        assert user_in_db.password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+
+
 class TestUserLogin:
     async def test_user_can_login_successfully_and_receives_valid_token(
             self, app: FastAPI, client: TestClient, test_user: UserInDB,
@@ -279,3 +391,138 @@ class TestUserMe:
             app.url_path_for("users:get-current-user"), headers={"Authorization": f"{jwt_prefix} {token}"}
         )
         assert res.status_code == HTTP_401_UNAUTHORIZED
+
+
+class TestAuthenticatedUserCache:
+    async def test_cache_expires_and_evicts_least_recently_used_entries(self) -> None:
+        now = 0.0
+        cache = TTLCache(max_size=2, ttl=10, timer=lambda: now)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        # "b" is now the least recently used entry
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        now = 11.0
+        assert cache.get("a") is None
+        assert cache.stats() == {"size": 1, "hits": 1, "misses": 2, "evictions": 2}
+    
+    async def test_authenticated_user_is_served_from_cache_until_profile_is_updated(
+            self, app: FastAPI, authorized_client: TestClient, test_user: UserInDB,
+    ) -> None:
+        authenticated_user_cache.evict(test_user.username)
+        res = await authorized_client.get(app.url_path_for("users:get-current-user"))
+        assert res.status_code == HTTP_200_OK
+        hits = authenticated_user_cache.hits
+        res = await authorized_client.get(app.url_path_for("users:get-current-user"))
+        assert res.status_code == HTTP_200_OK
+        assert authenticated_user_cache.hits == hits + 1
+        
+        res = await authorized_client.put(
+            app.url_path_for("profiles:update-own-profile"), json={"profile_update": {"full_name": "Cached Kane"}},
+        )
+        assert res.status_code == HTTP_200_OK
+        res = await authorized_client.get(app.url_path_for("users:get-current-user"))
+        assert UserPublic(**res.json()).profile.full_name == "Cached Kane"
+
+
+@pytest.fixture
+def stateless_auth():
+    auth_service.stateless_auth = True
+    yield
+    auth_service.stateless_auth = False
+
+
+class TestStatelessAuth:
+    async def login(self, app: FastAPI, client: TestClient, user: UserInDB) -> dict:
+        client.headers["content-type"] = "application/x-www-form-urlencoded"
+        res = await client.post(
+            app.url_path_for("users:login-email-and-password"),
+            form={"username": user.email, "password": "tottenham"},
+        )
+        del client.headers["content-type"]
+        assert res.status_code == HTTP_200_OK
+        return res.json()
+    
+    async def test_access_token_carries_user_claims(
+            self, app: FastAPI, client: TestClient, test_user: UserInDB, stateless_auth: None,
+    ) -> None:
+        tokens = await self.login(app, client, test_user)
+        assert tokens["refresh_token"] is not None
+        creds = jwt.decode(tokens["access_token"], str(SECRET_KEY), audience=JWT_AUDIENCE, algorithms=[JWT_ALGORITHM])
+        assert creds["id"] == test_user.id
+        assert creds["is_active"] is True
+        assert creds["is_superuser"] is False
+        assert creds["token_type"] == "access"
+    
+    async def test_refresh_tokens_are_rotated_and_single_use(
+            self, app: FastAPI, client: TestClient, test_user: UserInDB, stateless_auth: None,
+    ) -> None:
+        tokens = await self.login(app, client, test_user)
+        res = await client.post(
+            app.url_path_for("users:refresh-access-token"), json={"refresh_token": tokens["refresh_token"]},
+        )
+        assert res.status_code == HTTP_200_OK
+        refreshed = res.json()
+        assert refreshed["refresh_token"] != tokens["refresh_token"]
+        res = await client.get(
+            app.url_path_for("users:get-current-user"),
+            headers={"Authorization": f"Bearer {refreshed['access_token']}"},
+        )
+        assert res.status_code == HTTP_200_OK
+        # the old refresh token has been revoked
+        res = await client.post(
+            app.url_path_for("users:refresh-access-token"), json={"refresh_token": tokens["refresh_token"]},
+        )
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+    
+    async def test_refresh_tokens_used_by_another_app_process_are_refused(
+            self, app: FastAPI, client: TestClient, db: Database, test_user: UserInDB, stateless_auth: None,
+    ) -> None:
+        tokens = await self.login(app, client, test_user)
+        payload = auth_service.get_payload_from_token(
+            token=tokens["refresh_token"], secret_key=str(SECRET_KEY), token_type="refresh",
+        )
+        # revocations are kept in the database, rather than in the memory of the process that saw the token
+        tokens_repo = TokensRepository(db)
+        assert await tokens_repo.revoke_token(jti=payload.jti, expires_at=payload.exp)
+        assert not await tokens_repo.revoke_token(jti=payload.jti, expires_at=payload.exp)
+        res = await client.post(
+            app.url_path_for("users:refresh-access-token"), json={"refresh_token": tokens["refresh_token"]},
+        )
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+    
+    async def test_access_token_cannot_be_used_as_refresh_token(
+            self, app: FastAPI, client: TestClient, test_user: UserInDB, stateless_auth: None,
+    ) -> None:
+        tokens = await self.login(app, client, test_user)
+        res = await client.post(
+            app.url_path_for("users:refresh-access-token"), json={"refresh_token": tokens["access_token"]},
+        )
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+    
+    async def test_read_only_routes_trust_token_claims(
+            self, app: FastAPI, client: TestClient, test_user: UserInDB, stateless_auth: None,
+    ) -> None:
+        # a user that isn't in the database can only be authorized by the claims in its token
+        ghost = UserPublic(id=10 ** 6, email="ghost@example.com", username="ghost")
+        token = auth_service.create_access_token_for_user(user=ghost)
+        headers = {"Authorization": f"Bearer {token}"}
+        res = await client.get(
+            app.url_path_for("profiles:get-profile-by-username", username=test_user.username), headers=headers,
+        )
+        assert res.status_code == HTTP_200_OK
+        # endpoints that modify data still look the user up
+        res = await client.put(
+            app.url_path_for("profiles:update-own-profile"),
+            json={"profile_update": {"full_name": "Ghost"}},
+            headers=headers,
+        )
+        assert res.status_code == HTTP_401_UNAUTHORIZED
+        
+        inactive = ghost.copy(update={"is_active": False})
+        res = await client.get(
+            app.url_path_for("profiles:get-profile-by-username", username=test_user.username),
+            headers={"Authorization": f"Bearer {auth_service.create_access_token_for_user(user=inactive)}"},
+        )
+        assert res.status_code == HTTP_401_UNAUTHORIZED